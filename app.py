@@ -2,8 +2,11 @@
 import warnings
 warnings.filterwarnings("ignore", message="coroutine 'expire_cache' was never awaited")
 import streamlit as st
+from utils.prefetch import warm_up
 
 st.set_page_config(page_title="Portfolio Analysis Tool", layout="wide")
+# first visit after server start: metadata and hot price panels load in the background
+warm_up()
 st.title("📁 Portfolio Backtesting & Analysis App")
 
 st.markdown("""
@@ -0,0 +1,104 @@
+# batch_runner.py
+"""
+Headless batch runner: backtests saved portfolios without the Streamlit UI.
+
+Reads `saved_portfolios` from data/portfolio.db, runs the same backtest and
+metrics pipeline as the Portfolio Analysis page for every (portfolio, date
+range) pair across a process pool, and writes NAVs and metrics to Parquet.
+
+    python batch_runner.py --range 2015-01-01:2023-12-31 --range 2020-01-01:2023-12-31
+    python batch_runner.py --portfolios "Core*" "Income" --workers 8 --out reports/nightly
+
+Exits non-zero if any backtest fails, on a data error or anything else (the
+others are still written).
+"""
+
+import argparse
+import fnmatch
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+
+from utils.fx import BASE_CURRENCIES
+from utils.saved_portfolios import DUCKDB_PATH, PRICE_PATH, DataError, load_saved_portfolios, run_backtest
+
+
+def select_portfolios(saved, patterns):
+    if not patterns:
+        return saved
+    return {name: p for name, p in saved.items() if any(fnmatch.fnmatchcase(name, pat) for pat in patterns)}
+
+
+def _task(name, assets, weights, start_date, end_date, price_path, base_currency):
+    # Runs in a worker process; returns plain frames so results pickle cheaply
+    nav, metrics = run_backtest(name, assets, weights, start_date, end_date, price_path, base_currency)
+    nav_df = pd.DataFrame({"portfolio": name, "start_date": start_date, "end_date": end_date,
+                           "date": nav.index, "nav": nav.values})
+    metrics_row = {"portfolio": name, "start_date": start_date, "end_date": end_date, **metrics}
+    return nav_df, metrics_row
+
+
+def parse_range(value):
+    try:
+        start, end = value.split(":")
+        return str(pd.Timestamp(start).date()), str(pd.Timestamp(end).date())
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected START:END dates, got '{value}'")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest saved portfolios headlessly.")
+    parser.add_argument("--db", default=DUCKDB_PATH, help="DuckDB file with saved_portfolios")
+    parser.add_argument("--prices", default=PRICE_PATH, help="price_data.parquet")
+    parser.add_argument("--portfolios", nargs="*", help="names or glob patterns (default: all)")
+    parser.add_argument("--range", dest="ranges", type=parse_range, action="append",
+                        help="START:END date range; repeatable (default: 2015-01-01:2023-12-31)")
+    parser.add_argument("--currency", choices=BASE_CURRENCIES, default=None,
+                        help="base currency for every backtest (default: assets' own currencies)")
+    parser.add_argument("--workers", type=int, default=None, help="process pool size (default: CPU count)")
+    parser.add_argument("--out", default="reports", help="output directory")
+    args = parser.parse_args(argv)
+
+    ranges = args.ranges or [("2015-01-01", "2023-12-31")]
+    portfolios = select_portfolios(load_saved_portfolios(args.db), args.portfolios)
+    if not portfolios:
+        print("No saved portfolios matched.", file=sys.stderr)
+        return 1
+
+    navs, metrics, errors = [], [], []
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {
+            pool.submit(_task, name, assets, weights, start, end, args.prices, args.currency): (name, start, end)
+            for name, (assets, weights) in portfolios.items()
+            for start, end in ranges
+        }
+        for future in as_completed(futures):
+            name, start, end = futures[future]
+            try:
+                nav_df, metrics_row = future.result()
+            except DataError as e:
+                errors.append(str(e))
+                print(f"DATA ERROR {e}", file=sys.stderr)
+                continue
+            except Exception as e:
+                # any other failure (a bug, a DuckDB or optimizer error) costs only this job
+                errors.append(f"{name} {start}..{end}: {type(e).__name__}: {e}")
+                print(f"FAILED {name} {start}..{end}: {type(e).__name__}: {e}", file=sys.stderr)
+                continue
+            navs.append(nav_df)
+            metrics.append(metrics_row)
+            print(f"ok {name} {start}..{end}")
+
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    if navs:
+        pd.concat(navs, ignore_index=True).to_parquet(out / "navs.parquet", index=False)
+        pd.DataFrame(metrics).sort_values(["portfolio", "start_date"]).to_parquet(out / "metrics.parquet", index=False)
+    print(f"{len(metrics)} backtests written to {out}, {len(errors)} failed")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
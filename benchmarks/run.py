@@ -0,0 +1,218 @@
+# benchmarks/run.py
+"""
+Benchmark harness for the loaders and utils kernels.
+
+For every scale it generates (or reuses) a synthetic universe, times each
+case (best of --repeat runs), records peak traced memory, and compares
+against a stored baseline file.
+
+    python -m benchmarks.run --scales 1000 5000 --save-baseline
+    python -m benchmarks.run --scales 1000 5000 --fail-on-regression
+"""
+
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import generate_universe
+
+DEFAULT_BASELINE = Path(__file__).parent / "baselines.json"
+DEFAULT_DATA_ROOT = Path("bench_data")
+
+
+def _measure(fn, repeat):
+    """Best-of-repeat wall time plus the peak traced allocation of one run."""
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best, peak / 2 ** 20
+
+
+def _load_sample(price_path, assets):
+    return duckdb.execute(
+        f"SELECT * FROM '{price_path}' WHERE asset_id IN (SELECT UNNEST(?)) ORDER BY asset_id, date",
+        [assets],
+    ).df()
+
+
+def build_cases(data_dir, kernel_assets, full_load):
+    """
+    Returns [(name, fn)] for one universe. Kernels run on a fixed sample of
+    kernel_assets assets so their cost is comparable across scales.
+    """
+    from utils import parquet_loader
+    from utils.alignment import align_prices, clear_alignment_cache
+    from utils.analysis_tools import compare_multiple_portfolios
+    from utils.asset_stats import compute_asset_stats, build_asset_stats
+    from utils.backtest_engine import prepare_data, compute_portfolio_nav, compute_metrics
+    from utils.downsample import downsample_frame
+    from utils.price_utils import calculate_returns, calculate_cumulative_return
+
+    price_path = data_dir / "price_data.parquet"
+    parquet_loader.data_folder = data_dir
+    metadata = parquet_loader.load_metadata()
+    assets = metadata["asset_id"].sort_values().tolist()[:kernel_assets]
+    sample = _load_sample(price_path, assets)
+    start, end = sample["date"].min(), sample["date"].max()
+
+    rng = np.random.default_rng(0)
+    portfolios = []
+    for _ in range(10):
+        picked = list(rng.choice(assets[:50], size=5, replace=False))
+        portfolios.append((picked, [20.0] * 5))
+    basket = portfolios[0][0]
+
+    def navs():
+        out = {}
+        for i, (p_assets, weights) in enumerate(portfolios):
+            out[f"Portfolio {i + 1}"] = compute_portfolio_nav(prepare_data(sample, p_assets, start, end), weights)
+        return out
+
+    nav_dict = navs()
+    nav = nav_dict["Portfolio 1"]
+    panel = prepare_data(sample, basket, start, end)
+
+    def uncached_align():
+        clear_alignment_cache()
+        align_prices(sample, assets, how="ffill", dropna=False)
+
+    cases = [
+        ("load_metadata", parquet_loader.load_metadata),
+        ("duckdb_filtered_load", lambda: _load_sample(price_path, assets)),
+        ("build_asset_stats", lambda: build_asset_stats(price_path, data_dir / "asset_stats.parquet")),
+        ("prepare_data", lambda: prepare_data(sample, basket, start, end)),
+        ("compute_portfolio_nav", lambda: compute_portfolio_nav(panel, portfolios[0][1])),
+        ("compute_metrics", lambda: compute_metrics(nav)),
+        ("compare_multiple_portfolios", lambda: compare_multiple_portfolios(nav_dict)),
+        ("backtest_10_portfolios", navs),
+        ("align_prices_uncached", uncached_align),
+        ("calculate_returns", lambda: calculate_returns(sample.copy())),
+        ("calculate_cumulative_return", lambda: calculate_cumulative_return(calculate_returns(sample.copy()))),
+        ("compute_asset_stats", lambda: compute_asset_stats(sample)),
+        ("downsample_frame", lambda: downsample_frame(sample, "date", "close", group="asset_id")),
+    ]
+    if full_load:
+        cases.insert(1, ("load_price_data", parquet_loader.load_price_data))
+
+    # Optional-dependency kernels (scipy / statsmodels)
+    try:
+        from utils.data_cleaner import detect_missing_data, detect_outliers
+        cases += [
+            ("detect_missing_data", lambda: detect_missing_data(sample)),
+            ("detect_outliers", lambda: detect_outliers(sample)),
+        ]
+    except ImportError as e:
+        print(f"  skipping data_cleaner cases: {e}", file=sys.stderr)
+    try:
+        from utils.simulator import get_correlated_proxies, run_log_return_regression
+        cases += [
+            ("get_correlated_proxies", lambda: get_correlated_proxies(sample, assets[0], assets[1:50])),
+            ("run_log_return_regression", lambda: run_log_return_regression(sample, assets[0], assets[1])),
+        ]
+    except ImportError as e:
+        print(f"  skipping simulator cases: {e}", file=sys.stderr)
+    return cases
+
+
+def run_scale(n_assets, data_root, years, kernel_assets, repeat, full_load, regenerate):
+    data_dir = Path(data_root) / str(n_assets)
+    if regenerate or not (data_dir / "price_data.parquet").exists():
+        print(f"Generating {n_assets:,} assets into {data_dir} ...")
+        _, rows = generate_universe(n_assets, data_dir, years=years)
+        print(f"  {rows:,} price rows")
+
+    results = {}
+    for name, fn in build_cases(data_dir, kernel_assets, full_load):
+        try:
+            seconds, peak_mb = _measure(fn, repeat)
+            results[name] = {"seconds": seconds, "peak_mb": peak_mb}
+        except Exception as e:
+            results[name] = {"error": f"{type(e).__name__}: {e}"}
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Returns [(scale, case, metric, baseline, current)] for every regression beyond tolerance."""
+    regressions = []
+    for scale, cases in results.items():
+        for case, current in cases.items():
+            base = baseline.get(scale, {}).get(case)
+            if not base or "error" in current or "error" in base:
+                continue
+            for metric in ("seconds", "peak_mb"):
+                if current[metric] > base[metric] * tolerance and current[metric] - base[metric] > 1e-3:
+                    regressions.append((scale, case, metric, base[metric], current[metric]))
+    return regressions
+
+
+def print_report(results, baseline):
+    for scale, cases in results.items():
+        print(f"\n== {int(scale):,} assets ==")
+        print(f"{'case':32} {'seconds':>10} {'peak MB':>10} {'vs base':>9}")
+        for case, r in cases.items():
+            if "error" in r:
+                print(f"{case:32} {r['error']}")
+                continue
+            base = baseline.get(scale, {}).get(case, {})
+            ratio = f"{r['seconds'] / base['seconds']:.2f}x" if base.get("seconds") else "-"
+            print(f"{case:32} {r['seconds']:10.4f} {r['peak_mb']:10.1f} {ratio:>9}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark loaders and utils kernels on synthetic data.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--years", type=float, default=10)
+    parser.add_argument("--kernel-assets", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--data-root", default=str(DEFAULT_DATA_ROOT))
+    parser.add_argument("--full-load", action="store_true", help="also time loading the whole price table")
+    parser.add_argument("--regenerate", action="store_true")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=1.25)
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--json", help="write raw results to this path")
+    args = parser.parse_args(argv)
+
+    baseline_path = Path(args.baseline)
+    baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+
+    results = {}
+    for n in args.scales:
+        results[str(n)] = run_scale(n, args.data_root, args.years, args.kernel_assets,
+                                    args.repeat, args.full_load, args.regenerate)
+
+    print_report(results, baseline)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+    if args.save_baseline:
+        baseline.update(results)
+        baseline_path.write_text(json.dumps(baseline, indent=2))
+        print(f"\nBaseline saved to {baseline_path}")
+
+    regressions = compare(results, baseline, args.tolerance) if not args.save_baseline else []
+    for scale, case, metric, base, current in regressions:
+        print(f"REGRESSION {scale} {case} {metric}: {base:.4f} -> {current:.4f}")
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
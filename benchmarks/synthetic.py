@@ -0,0 +1,167 @@
+# benchmarks/synthetic.py
+"""
+Synthetic universe generator.
+
+Writes price_data.parquet and asset_metadata.parquet with the same schema as
+the real data, at any scale, with the awkward parts of real data mixed in:
+different calendars (daily business, weekly, monthly), staggered start
+dates, gaps, and price outliers.
+
+    python -m benchmarks.synthetic --assets 5000 --years 10 --out bench_data/5000
+"""
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+ASSET_TYPES = {
+    # type: (share of universe, calendar, annual vol range, exchange choices)
+    "ETF": (0.45, "B", (0.10, 0.35), ["NYSE", "NASDAQ", "LSE", "XETRA"]),
+    "FUND": (0.30, "B", (0.05, 0.25), ["FUND"]),
+    "Index": (0.10, "B", (0.10, 0.30), ["INDEX"]),
+    "Economic": (0.15, None, (0.05, 0.60), ["FRED"]),
+}
+ECONOMIC_CALENDARS = ["B", "W-FRI", "BME"]
+CATEGORIES = ["Equity", "Fixed Income", "Commodity", "Currency", "Other"]
+CURRENCIES = ["USD", "USD", "USD", "EUR", "GBP", "JPY"]
+
+PRICE_SCHEMA = pa.schema([
+    ("asset_id", pa.string()),
+    ("date", pa.timestamp("ns")),
+    ("open", pa.float64()),
+    ("high", pa.float64()),
+    ("low", pa.float64()),
+    ("close", pa.float64()),
+    ("volume", pa.float64()),
+    ("open_interest", pa.float64()),
+    ("daily_pct_change", pa.float64()),
+    ("log_return", pa.float64()),
+])
+
+
+def generate_metadata(n_assets, seed=0):
+    rng = np.random.default_rng(seed)
+    types = list(ASSET_TYPES)
+    shares = np.array([ASSET_TYPES[t][0] for t in types])
+    asset_type = rng.choice(types, size=n_assets, p=shares / shares.sum())
+
+    rows = []
+    for i, t in enumerate(asset_type):
+        exchange = rng.choice(ASSET_TYPES[t][2])
+        code = f"S{i:06d}"
+        rows.append({
+            "asset_id": f"{t}.{exchange}.{code}",
+            "code": code,
+            "name": f"Synthetic {t} {i}",
+            "description": f"Generated {t.lower()} series #{i}",
+            "asset_type": t,
+            "exchange": exchange,
+            "category": rng.choice(CATEGORIES),
+            "currency_code": rng.choice(CURRENCIES),
+        })
+    return pd.DataFrame(rows)
+
+
+def _asset_prices(asset_id, asset_type, end, years, rng, gap_rate, outlier_rate):
+    calendar = ASSET_TYPES[asset_type][1] or rng.choice(ECONOMIC_CALENDARS)
+    # staggered starts: most assets cover a fraction of the full window
+    span_years = years * rng.uniform(0.2, 1.0) if rng.random() < 0.7 else years
+    dates = pd.date_range(end=end, periods=max(int(span_years * 252), 30), freq="B")
+    if calendar != "B":
+        dates = pd.date_range(dates[0], end, freq=calendar)
+    n = len(dates)
+    if n < 2:
+        return None
+
+    lo, hi = ASSET_TYPES[asset_type][2]
+    periods_per_year = {"B": 252, "W-FRI": 52, "BME": 12}[calendar]
+    sigma = rng.uniform(lo, hi) / np.sqrt(periods_per_year)
+    mu = rng.normal(0.05, 0.05) / periods_per_year
+    log_ret = rng.normal(mu - sigma ** 2 / 2, sigma, n)
+    log_ret[0] = 0.0
+    close = rng.uniform(5, 500) * np.exp(np.cumsum(log_ret))
+
+    # gaps: drop a few random contiguous blocks
+    keep = np.ones(n, dtype=bool)
+    for _ in range(rng.poisson(gap_rate * n / 252)):
+        start = rng.integers(0, n)
+        keep[start:start + rng.integers(5, 40)] = False
+    keep[0] = True
+
+    # outliers: isolated bad ticks
+    spikes = rng.random(n) < outlier_rate
+    close = np.where(spikes, close * rng.choice([0.1, 10.0], n), close)
+
+    dates, close = dates[keep], close[keep]
+    spread = np.abs(rng.normal(0, sigma / 2, len(close)))
+    open_ = close * np.exp(rng.normal(0, sigma / 3, len(close)))
+    is_economic = asset_type == "Economic"
+    prev = np.r_[np.nan, close[:-1]]
+    return {
+        "asset_id": np.full(len(close), asset_id, dtype=object),
+        "date": dates.to_numpy(dtype="datetime64[ns]"),
+        "open": close if is_economic else open_,
+        "high": close if is_economic else np.maximum(open_, close) * (1 + spread),
+        "low": close if is_economic else np.minimum(open_, close) * (1 - spread),
+        "close": close,
+        "volume": np.full(len(close), np.nan) if is_economic else rng.lognormal(12, 1, len(close)).round(),
+        "open_interest": np.full(len(close), np.nan),
+        "daily_pct_change": (close / prev - 1) * 100,
+        "log_return": np.log(close / prev),
+    }
+
+
+def generate_universe(n_assets, out_dir, years=10, end="2024-12-31", seed=0,
+                      gap_rate=0.5, outlier_rate=0.0005, batch_assets=500):
+    """
+    Writes asset_metadata.parquet and price_data.parquet into out_dir.
+
+    Prices are generated and written batch_assets at a time, so memory stays
+    bounded at any universe size.
+
+    Returns:
+    - (metadata DataFrame, total price rows)
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    metadata = generate_metadata(n_assets, seed)
+    metadata.to_parquet(out_dir / "asset_metadata.parquet", index=False)
+
+    total = 0
+    end = pd.Timestamp(end)
+    with pq.ParquetWriter(out_dir / "price_data.parquet", PRICE_SCHEMA) as writer:
+        for start in range(0, n_assets, batch_assets):
+            batch = metadata.iloc[start:start + batch_assets]
+            parts = [p for p in (
+                _asset_prices(a, t, end, years, rng, gap_rate, outlier_rate)
+                for a, t in zip(batch["asset_id"], batch["asset_type"])
+            ) if p is not None]
+            if not parts:
+                continue
+            columns = {name: np.concatenate([p[name] for p in parts]) for name in PRICE_SCHEMA.names}
+            table = pa.Table.from_pydict(columns, schema=PRICE_SCHEMA)
+            writer.write_table(table)
+            total += table.num_rows
+    return metadata, total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic price/metadata universe.")
+    parser.add_argument("--assets", type=int, default=1000)
+    parser.add_argument("--years", type=float, default=10)
+    parser.add_argument("--end", default="2024-12-31")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="bench_data")
+    args = parser.parse_args(argv)
+
+    metadata, rows = generate_universe(args.assets, args.out, args.years, args.end, args.seed)
+    print(f"Wrote {len(metadata):,} assets and {rows:,} price rows to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
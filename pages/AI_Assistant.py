@@ -1,30 +1,54 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
-from utils.ai_agent import get_ai_response
+import os
+from pathlib import Path
+from utils.data_source import price_source
+from utils.prefetch import load_metadata, warm_up
+from utils.precompute import MANIFEST_PATH, artifact_fingerprint, compute_portfolio_navs, load_fresh_artifact
+from utils.ai_agent import get_ai_response, StubModel
+from utils.ai_stream import stream_ai_response
+from utils.tracing import traced, note_cache_miss
+from utils.diagnostics import begin_rerun, render_diagnostics_panel
 
 # ----------- Load Data -----------
-@st.cache_data
-def load_minimal_price_data():
-    # Load the CSV file instead of Parquet
-    df = pd.read_csv("data/asset_Economic.FRED.DGS30.csv")
-    df['date'] = pd.to_datetime(df['date'])  # Ensure 'date' column is in datetime format
-    df['log_return'] = np.log(df['close'] / df['close'].shift(1))  # Calculate log returns
-    return df[['asset_id', 'date', 'close', 'log_return']]  # Return only required columns
+# Hand-made NAVs, used only when there are no saved portfolios to backtest
+NAV_CSV_PATH = Path("data/portfolio_navs.csv")
 
+# The precomputed NAVs (python -m utils.precompute) when fresh, else the saved portfolios
+# backtested here. `version` only keys the cache: it changes with the NAVs' inputs,
+# the manifest and the CSV, so an ingest, a rebuild or a new portfolio is picked up.
+@traced("load_nav_data", cache=True)
 @st.cache_data
-def load_nav_data():
-    try:
-        return pd.read_csv("data/portfolio_navs.csv")
-    except FileNotFoundError:
-        return pd.DataFrame()
+def load_nav_data(version):
+    note_cache_miss()
+    navs = load_fresh_artifact("portfolio_navs")
+    if navs is None:
+        navs = compute_portfolio_navs()
+    if navs.empty and NAV_CSV_PATH.exists():
+        navs = pd.read_csv(NAV_CSV_PATH)
+    return navs
+
+def _mtime(path):
+    return path.stat().st_mtime if path.exists() else None
 
 # ----------- UI -----------
 st.set_page_config(page_title="🧠 AI Assistant", layout="wide")
+begin_rerun("AI_Assistant")
+warm_up()
 st.title("🧠 Agentic AI Portfolio Assistant")
 
-price_data = load_minimal_price_data()
-portfolio_navs = load_nav_data()
+# Handed to the assistant as a source, not a frame: rows are read only if a tool asks for them
+price_data = price_source()
+nav_version = (artifact_fingerprint("portfolio_navs"), _mtime(MANIFEST_PATH), _mtime(NAV_CSV_PATH))
+portfolio_navs = load_nav_data(nav_version)
+metadata = load_metadata()
+if not portfolio_navs.empty and "date" in portfolio_navs.columns:
+    portfolio_navs = portfolio_navs.set_index(pd.to_datetime(portfolio_navs["date"])).drop(columns="date")
+
+# Without an API key the assistant runs against the offline stub model
+offline = st.sidebar.toggle("Offline mode (stub model)", value=not os.getenv("OPENAI_API_KEY"))
+if offline:
+    model = StubModel(portfolio_navs.columns, metadata["asset_id"] if "asset_id" in metadata.columns else [])
 
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
@@ -35,13 +59,28 @@ for role, msg in st.session_state.chat_history:
 
 query = st.chat_input("Ask me anything about your portfolio...")
 if query:
+    # A new question supersedes any answer still streaming from an earlier rerun
+    previous = st.session_state.get("active_stream")
+    if previous is not None and not previous.done:
+        previous.cancel()
+
     st.session_state.chat_history.append(("user", query))
     with st.chat_message("user"):
         st.markdown(query)
 
     with st.chat_message("assistant"):
-        with st.spinner("Thinking..."):
-            # Adjust this based on available data
-            response = get_ai_response(query, None, price_data, portfolio_navs)
+        if offline:
+            response = get_ai_response(query, metadata, price_data, portfolio_navs, model=model, nav_version=nav_version)
             st.markdown(response)
-            st.session_state.chat_history.append(("assistant", response))
+        else:
+            handle = stream_ai_response(query, metadata, price_data, portfolio_navs, nav_version=nav_version)
+            st.session_state.active_stream = handle
+            placeholder = st.empty()
+            placeholder.markdown("Thinking...")
+            for _ in handle:
+                placeholder.markdown(handle.text + "▌")
+            placeholder.markdown(handle.text)
+            response = handle.text
+        st.session_state.chat_history.append(("assistant", response))
+
+render_diagnostics_panel()
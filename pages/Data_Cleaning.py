@@ -1,65 +1,93 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import duckdb
 import os
 from utils.data_cleaner import detect_missing_data, detect_outliers
+from utils.downsample import downsample_frame
+from utils.arrow_io import iter_asset_chunks, to_pandas
+from utils.data_source import price_source, ParquetSource
+from utils.compact import PRICE_COLUMNS
+from utils.prefetch import load_asset_prices, warm_up
+from utils.precompute import load_fresh_artifact, MANIFEST_PATH
+from utils.tracing import traced, note_cache_miss
+from utils.diagnostics import begin_rerun, render_diagnostics_panel, plotly_chart
 
 # ---------- Data Loading ----------
+@traced("scan_price_data", cache=True)
 @st.cache_data
-def load_metadata():
-    query = "SELECT * FROM 'data/asset_metadata.parquet'"
-    return duckdb.query(query).to_df()
+def scan_price_data(version, asset_ids=None):
+    note_cache_miss()
+    # streamed in batches of complete assets; only the flags are kept
+    missing, outliers = [], []
+    for chunk in iter_asset_chunks(price_source().stream(asset_ids)):
+        missing += detect_missing_data(chunk)
+        outliers.append(detect_outliers(chunk))
+    if not outliers:
+        return missing, pd.DataFrame(columns=["asset_id", "date", "close", "z_score"])
+    return missing, pd.concat(outliers, ignore_index=True)
 
+# Assets served by something other than the Parquet store (imports, per-asset CSVs)
+@traced("load_overlay_assets", cache=True)
 @st.cache_data
-def load_price_data():
-    query = "SELECT asset_id, date, close FROM 'data/price_data.parquet'"
-    return duckdb.query(query).to_df()
+def load_overlay_assets(version):
+    note_cache_miss()
+    return set(a for source, ids in price_source().assets_by_source()
+                  if not isinstance(source, ParquetSource) for a in ids)
 
+# Precomputed flags (see utils.precompute); None when stale so the page computes on demand.
+# The manifest mtime and the price version key the cache, so a rebuild or an ingest is picked up.
+@traced("load_cleaning_artifacts", cache=True)
 @st.cache_data
-def load_price_data_for_asset(asset_id: str):
-    query = f"""
-        SELECT asset_id, date, close FROM 'data/price_data.parquet'
-        WHERE asset_id = '{asset_id}'
-    """
-    return duckdb.query(query).to_df()
+def load_cleaning_artifacts(manifest_mtime, version):
+    note_cache_miss()
+    return load_fresh_artifact("missing_data"), load_fresh_artifact("outliers")
 
 # ----------- UI -----------
 st.set_page_config(page_title="🧹 Data Cleaning Tool", layout="wide")
+begin_rerun("Data_Cleaning")
+warm_up()
 st.title("🧹 Data Cleaning & Validation Tool")
 
-price_data = load_price_data()
+price_version = price_source().version()
+manifest_mtime = MANIFEST_PATH.stat().st_mtime if MANIFEST_PATH.exists() else None
+missing_df, outlier_df = load_cleaning_artifacts(manifest_mtime, price_version)
+if missing_df is None or outlier_df is None:
+    missing_assets, outlier_df = scan_price_data(price_version)
+else:
+    # The artifacts cover the Parquet store; assets served from elsewhere are scanned here
+    overlay = load_overlay_assets(price_version)
+    missing_assets = [a for a in missing_df["asset_id"] if a not in overlay]
+    outlier_df = outlier_df[~outlier_df["asset_id"].isin(overlay)]
+    if overlay:
+        overlay_missing, overlay_outliers = scan_price_data(price_version, sorted(overlay))
+        missing_assets += overlay_missing
+        outlier_df = pd.concat([outlier_df, overlay_outliers], ignore_index=True)
 
 st.subheader("📌 Step 1: Detect Missing Data")
-missing_assets = detect_missing_data(price_data)
 st.write(f"Found {len(missing_assets)} assets with gaps > 6 days")
 st.dataframe(pd.DataFrame(missing_assets, columns=["Asset ID with Missing Data"]))
 
 st.subheader("📌 Step 2: Detect Outliers")
-outlier_df = detect_outliers(price_data)
-
 if not outlier_df.empty:
     st.write(f"Found {len(outlier_df)} potential outliers")
     st.dataframe(outlier_df[["asset_id", "date", "close", "z_score"]].sort_values("z_score", ascending=False))
 
     selected_asset = st.selectbox("Select an asset to view chart", outlier_df["asset_id"].unique())
 
-    chart_df = load_price_data_for_asset(selected_asset)
+    # min/max buckets so the flagged spikes survive downsampling
+    chart_df = downsample_frame(to_pandas(load_asset_prices(selected_asset, PRICE_COLUMNS, price_version)), "date", "close", method="minmax")
     fig = px.line(chart_df, x="date", y="close", title=f"Price Chart for {selected_asset} (Outliers visible)")
-    st.plotly_chart(fig, use_container_width=True)
+    plotly_chart(fig, use_container_width=True)
 else:
     st.success("✅ No extreme outliers detected.")
 
 st.markdown("---")
 
 if st.button("🚀 Simulate Cleaning (Tag Outliers)"):
-    cleaned = price_data.copy()
-    cleaned["has_error"] = False
-    cleaned["error_type"] = None
-
-    outlier_index = outlier_df.index
-    cleaned.loc[outlier_index, "has_error"] = True
-    cleaned.loc[outlier_index, "error_type"] = "outlier_zscore"
+    # Only the tagged rows are shown, so tag the outlier rows directly
+    tagged = outlier_df[["asset_id", "date", "close"]].assign(error_type="outlier_zscore")
 
     st.success("Outliers tagged in memory (not saved).")
-    st.dataframe(cleaned[cleaned["has_error"] == True][["asset_id", "date", "close", "error_type"]])
+    st.dataframe(tagged)
+
+render_diagnostics_panel()
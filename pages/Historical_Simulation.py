@@ -5,30 +5,67 @@ import pandas as pd
 import plotly.express as px
 from sklearn.linear_model import LinearRegression
 import numpy as np
-import duckdb
+import pyarrow as pa
+import pyarrow.compute as pc
+from utils.alignment import align_prices
+from utils.arrow_io import to_pandas
+from utils.compact import as_datetime
+from utils.comovement import rolling_comovement, latest_matrix, pair_list
+from utils.data_source import price_source
+from utils.downsample import downsample_frame
+from utils.prefetch import load_asset_ids, load_asset_prices, warm_up
+from utils.tracing import traced, note_cache_miss
+from utils.diagnostics import begin_rerun, render_diagnostics_panel, plotly_chart
 
 # ---------- Data Loading ----------
+def load_price_data_for_asset(asset_id: str, version):
+    # shared across server processes; the filter is a cheap per-rerun copy of one asset
+    table = load_asset_prices(asset_id, ("asset_id", "date", "close", "log_return"), version)
+    return table.filter(pc.is_valid(table["log_return"]))
+
+# Date x asset log returns, NaN where an asset has no row (no forward fill:
+# a stale price would read as a zero return and bias the co-movement).
+# Dates with fewer than two returns pair nothing and are dropped, so a window
+# counts shared trading days.
+@traced("load_return_panel", cache=True)
 @st.cache_data
-def load_metadata():
-    query = "SELECT * FROM 'data/asset_metadata.parquet'"
-    return duckdb.query(query).to_df()
+def load_return_panel(assets, version):
+    note_cache_miss()
+    table = price_source().load(None if assets is None else list(assets), columns=["asset_id", "date", "log_return"])
+    returns = align_prices(table, None if assets is None else list(assets), values="log_return",
+                           how="ffill", limit=0, dropna=False)
+    return returns.dropna(thresh=2)
+
+@traced("load_basket_matrix", cache=True)
+@st.cache_data
+def load_basket_matrix(assets, window, stat, version):
+    note_cache_miss()
+    return latest_matrix(load_return_panel(assets, version), window, min_periods=window // 2, stat=stat)
 
+@traced("load_target_comovement", cache=True)
 @st.cache_data
-def load_price_data_for_asset(asset_id: str):
-    query = f"""
-        SELECT * FROM 'data/price_data.parquet'
-        WHERE asset_id = '{asset_id}'
-    """
-    df = duckdb.query(query).to_df()
-    df["date"] = pd.to_datetime(df["date"])
-    return df.dropna(subset=["log_return"])
+def load_target_comovement(target, window, top_n, version):
+    note_cache_miss()
+    # one pass per (asset, target) pair over the whole universe; keeps the
+    # latest values and the full history of the top_n strongest pairs only
+    returns = load_return_panel(None, version)
+    returns = returns[returns[target].notna()]  # windows run over the target's trading days
+    corr, beta = rolling_comovement(returns, pair_list(returns.columns, target), window, min_periods=window // 2)
+    latest = pd.DataFrame({"correlation": corr.iloc[-1].values, "beta": beta.iloc[-1].values},
+                          index=corr.columns.get_level_values("asset")).dropna()
+    latest = latest.reindex(latest["correlation"].abs().sort_values(ascending=False).index)
+    top = [(a, target) for a in latest.index[:top_n]]
+    history = corr[top].droplevel("against", axis=1)
+    return latest, history
 
 # ---------- UI ----------
 st.set_page_config(page_title="🧬 Historical Simulation Tool", layout="wide")
+begin_rerun("Historical_Simulation")
+warm_up()
 st.title("🧬 Asset Historical Simulation Tool")
 
-metadata_df = load_metadata()
-asset_ids = sorted(metadata_df["asset_id"].unique())
+price_version = price_source().version()
+asset_ids = load_asset_ids(price_version)
 
 col1, col2 = st.columns(2)
 with col1:
@@ -37,16 +74,21 @@ with col2:
     proxy_asset = st.selectbox("Select Proxy Asset", asset_ids)
 
 if target_asset and proxy_asset and target_asset != proxy_asset:
-    target_df = load_price_data_for_asset(target_asset)
-    proxy_df = load_price_data_for_asset(proxy_asset)
-
-    # Merge data for comparison
-    merged = pd.merge(
-        target_df[["date", "log_return", "close"]],
-        proxy_df[["date", "log_return", "close"]],
-        on="date",
-        suffixes=("_target", "_proxy")
-    )
+    target_table = load_price_data_for_asset(target_asset, price_version)
+    proxy_table = load_price_data_for_asset(proxy_asset, price_version)
+
+    # Align on common dates straight from Arrow (index is built once and reused for both columns)
+    pair_table = pa.concat_tables([target_table, proxy_table])
+    pair = [target_asset, proxy_asset]
+    returns = align_prices(pair_table, pair, values="log_return", how="intersection")
+    closes = align_prices(pair_table, pair, values="close", how="intersection")
+    merged = pd.DataFrame({
+        "date": returns.index,
+        "log_return_target": returns[target_asset].values,
+        "log_return_proxy": returns[proxy_asset].values,
+        "close_target": closes[target_asset].values,
+        "close_proxy": closes[proxy_asset].values,
+    })
 
     # Train regression model
     X = merged[["log_return_proxy"]].rename(columns={"log_return_proxy": "log_return"})
@@ -57,13 +99,13 @@ if target_asset and proxy_asset and target_asset != proxy_asset:
 
     st.subheader("⏳ Price Evolution Over Time")
     fig_time = px.line(
-        merged,
+        downsample_frame(merged, "date", ["close_target", "close_proxy"]),
         x="date",
         y=["close_target", "close_proxy"],
         labels={"value": "Price", "variable": "Asset"},
         title="Actual Price History Comparison"
     )
-    st.plotly_chart(fig_time, use_container_width=True)
+    plotly_chart(fig_time, use_container_width=True)
 
     st.subheader("📈 Return Relationship Analysis")
     st.write(f"**R² Score:** {r_squared:.4f}")
@@ -81,25 +123,31 @@ if target_asset and proxy_asset and target_asset != proxy_asset:
                 "log_return_target": "Target Returns"
             }
         )
-        st.plotly_chart(fig_scatter, use_container_width=True)
+        plotly_chart(fig_scatter, use_container_width=True)
 
     with col2:
-        merged['rolling_corr'] = merged['log_return_target'].rolling(30).corr(merged['log_return_proxy'])
+        window = st.slider("Rolling window (days)", 10, 250, 30, key="pair_window")
+        corr, beta = rolling_comovement(returns, [(target_asset, proxy_asset)], window)
+        merged['rolling_corr'] = corr.iloc[:, 0].values
+        merged['rolling_beta'] = beta.iloc[:, 0].values
+        rolling = merged.dropna(subset=["rolling_corr"])
         fig_corr = px.line(
-            merged,
+            downsample_frame(rolling, "date", ["rolling_corr", "rolling_beta"]),
             x="date",
-            y="rolling_corr",
-            title="30-Day Rolling Correlation",
-            labels={"rolling_corr": "Correlation"}
+            y=["rolling_corr", "rolling_beta"],
+            title=f"{window}-Day Rolling Correlation & Beta",
+            labels={"value": "Value", "variable": "Statistic"}
         )
-        st.plotly_chart(fig_corr, use_container_width=True)
+        plotly_chart(fig_corr, use_container_width=True)
 
     # --- Simulation ---
     st.subheader("🧪 Historical Simulation")
     extension_range = st.slider("Days to simulate before target starts", 30, 500, 180)
 
-    earliest_target_date = target_df["date"].min()
-    proxy_history = proxy_df[proxy_df["date"] < earliest_target_date].sort_values("date").tail(extension_range)
+    target_df, proxy_df = to_pandas(target_table), to_pandas(proxy_table)
+    # as_datetime: the bound and the comparison work whatever type the date column comes back as
+    earliest_target_date = pd.Timestamp(as_datetime(target_df["date"]).min())
+    proxy_history = proxy_df[as_datetime(proxy_df["date"]) < earliest_target_date].sort_values("date").tail(extension_range)
 
     if not proxy_history.empty:
         proxy_history = proxy_history.copy()
@@ -119,7 +167,7 @@ if target_asset and proxy_asset and target_asset != proxy_asset:
         st.success(f"✅ Simulated {len(proxy_history)} days of data before {earliest_target_date.date()}.")
 
         fig_combined = px.line(
-            combined,
+            downsample_frame(combined, "date", "simulated_price", group="is_simulated"),
             x="date",
             y="simulated_price",
             color="is_simulated",
@@ -127,15 +175,70 @@ if target_asset and proxy_asset and target_asset != proxy_asset:
             title="Combined Actual + Simulated Price History",
             color_discrete_map={True: "orange", False: "blue"}
         )
-        st.plotly_chart(fig_combined, use_container_width=True)
+        plotly_chart(fig_combined, use_container_width=True)
 
         fig_returns = px.line(
-            proxy_history,
+            downsample_frame(proxy_history, "date", "log_return_target_sim"),
             x="date",
             y="log_return_target_sim",
             title="Simulated Daily Returns Over Time",
             labels={"log_return_target_sim": "Log Return"}
         )
-        st.plotly_chart(fig_returns, use_container_width=True)
+        plotly_chart(fig_returns, use_container_width=True)
     else:
         st.warning("❌ Not enough proxy data before target's start date.")
+
+# ---------- Co-movement ----------
+st.subheader("🕸️ Co-movement")
+mode = st.radio("Compare", ["Pairs within a basket", "One asset against the universe"], horizontal=True)
+window = st.slider("Window (days)", 20, 250, 60, key="comove_window")
+
+if mode == "Pairs within a basket":
+    basket = st.multiselect("Basket", asset_ids, max_selections=300, key="comove_basket")
+    stat = st.radio("Statistic", ["corr", "beta"], horizontal=True,
+                    format_func=lambda s: "Correlation" if s == "corr" else "Beta (row on column)")
+    if len(basket) >= 2:
+        basket = tuple(sorted(basket))
+        matrix = load_basket_matrix(basket, window, stat, price_version)
+        fig_heat = px.imshow(
+            matrix,
+            zmin=-1 if stat == "corr" else None,
+            zmax=1 if stat == "corr" else None,
+            color_continuous_scale="RdBu_r",
+            title=f"Latest {window}-Day {'Correlation' if stat == 'corr' else 'Beta'}",
+        )
+        plotly_chart(fig_heat, use_container_width=True)
+
+        # how the strongest relationships got here
+        strongest = matrix.where(np.triu(np.ones(matrix.shape, dtype=bool), k=1)).stack()
+        strongest = strongest.reindex(strongest.abs().sort_values(ascending=False).index)
+        pairs = list(strongest.index[:5])
+        if pairs:
+            corr, beta = rolling_comovement(load_return_panel(basket, price_version), pairs, window,
+                                            min_periods=window // 2)
+            history = (corr if stat == "corr" else beta).dropna(how="all")
+            history.columns = [f"{a} / {b}" for a, b in history.columns]
+            fig_pairs = px.line(
+                downsample_frame(history, y=list(history.columns)),
+                labels={"value": stat, "index": "Date", "variable": "Pair"},
+                title=f"Rolling {window}-Day {'Correlation' if stat == 'corr' else 'Beta'}: Strongest Pairs",
+            )
+            plotly_chart(fig_pairs, use_container_width=True)
+    else:
+        st.info("Pick at least two assets.")
+else:
+    anchor = st.selectbox("Asset", asset_ids, key="comove_anchor")
+    top_n = st.slider("Pairs to chart", 1, 10, 5)
+    if anchor:
+        latest, history = load_target_comovement(anchor, window, top_n, price_version)
+        st.dataframe(latest.head(50), use_container_width=True)
+        history = history.dropna(how="all")
+        if not history.empty:
+            fig_top = px.line(
+                downsample_frame(history, y=list(history.columns)),
+                labels={"value": "Correlation", "index": "Date", "variable": "Asset"},
+                title=f"Rolling {window}-Day Correlation with {anchor}: Strongest Relationships",
+            )
+            plotly_chart(fig_top, use_container_width=True)
+
+render_diagnostics_panel()
@@ -4,15 +4,27 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 from datetime import datetime
-import duckdb
 import os
+from utils.asset_stats import refresh_asset_stats, update_asset_stats
+from utils.downsample import downsample_frame
+from utils.tracing import span
+from utils.db_writer import get_writer, reader
+from utils.data_source import IMPORT_DB_PATH, DuckDBSource
+from utils.stream_import import DEFAULT_CHUNK_ROWS, stream_import
+from utils.prefetch import warm_up
+from utils.diagnostics import begin_rerun, render_diagnostics_panel, plotly_chart
 
 # --------- DuckDB Setup ---------
-DB_PATH = "portfolio_data.duckdb"
-con = duckdb.connect(DB_PATH)
+DB_PATH = IMPORT_DB_PATH
+PRICE_COLUMNS = ["asset_id", "date", "open", "high", "low", "close",
+                 "volume", "open_interest", "daily_pct_change", "log_return"]
+
+# One writer thread per process writes the file; every reader (any page, any process)
+# reads the Parquet snapshots it publishes, price_data through utils.data_source.
+writer = get_writer(DB_PATH, snapshot_tables=["asset_metadata", "price_data"])
 
 # Create tables if they don't exist
-con.execute("""
+writer.execute("""
 CREATE TABLE IF NOT EXISTS asset_metadata (
     asset_id TEXT PRIMARY KEY,
     assigned_ticker TEXT,
@@ -25,7 +37,7 @@ CREATE TABLE IF NOT EXISTS asset_metadata (
 )
 """)
 
-con.execute("""
+writer.execute("""
 CREATE TABLE IF NOT EXISTS price_data (
     asset_id TEXT,
     date DATE,
@@ -40,8 +52,20 @@ CREATE TABLE IF NOT EXISTS price_data (
 )
 """)
 
+
+def save_metadata(con, metadata_row):
+    con.execute("""
+        INSERT OR REPLACE INTO asset_metadata (
+            asset_id, assigned_ticker, description,
+            series_type, is_percentage, import_yield,
+            asset_class, asset_category
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, metadata_row)
+
 # --------- Setup ---------
 st.set_page_config(page_title="💹 Colorful Portfolio Import Tool", layout="wide")
+begin_rerun("Import_Tool")
+warm_up()
 st.markdown("<h1 style='text-align: center; color: #5D3FD3;'>🎨 Portfolio Import & Visualizer Tool</h1>", unsafe_allow_html=True)
 st.markdown("<p style='text-align: center; font-size: 18px;'>Import financial data, validate it, and visualize performance over time with flair.</p>", unsafe_allow_html=True)
 
@@ -66,10 +90,129 @@ with st.expander("Data File Configuration"):
         asset_class = st.checkbox("Asset Class", key="asset_class")
         asset_category = st.selectbox("Asset Category", ["None", "Equity", "Fixed Income", "Commodity", "Currency", "Other"], key="asset_category")
 
+        st.markdown("### Import Mode")
+        streaming = st.checkbox("Streaming mode (large files)", key="streaming_mode",
+                                help="Reads the file in chunks, validates and profiles each one and writes valid "
+                                     "chunks straight to DuckDB, so memory stays flat whatever the file size.")
+        if streaming:
+            server_path = st.text_input("Or a CSV path on the server (beyond the upload limit)", key="server_path")
+            chunk_rows = st.number_input("Rows per chunk", min_value=10_000, max_value=2_000_000,
+                                         value=DEFAULT_CHUNK_ROWS, step=50_000, key="chunk_rows")
+            tolerance = st.slider("Bad rows tolerated per chunk (%)", 0.0, 10.0, 0.0, 0.5, key="tolerance") / 100
+            allow_partial = st.checkbox("Store the valid chunks even if some are rejected", key="allow_partial",
+                                        help="The import replaces the asset's stored history, so by default "
+                                             "a rejected chunk means nothing is stored.")
+
+metadata_row = (
+    series_name,
+    assigned_ticker,
+    description,
+    series_type,
+    percentage_values,
+    import_yield,
+    asset_class,
+    asset_category
+)
+
+
+def render_stream_report(profile, asset_display_name):
+    rejected = len(profile.rejected)
+    st.markdown("### 🧾 Import Report")
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Rows read", f"{profile.rows_read:,}")
+    c2.metric("Rows stored", f"{profile.rows_written:,}")
+    c3.metric("Bad rows dropped", f"{profile.rows_dropped:,}")
+    c4.metric("Chunks rejected", f"{rejected} of {profile.chunks}")
+    if profile.rejected:
+        st.warning("Some chunks failed validation (see the reasons below).")
+        st.dataframe(pd.DataFrame(profile.rejected, columns=["chunk", "first_line", "reason"]),
+                     use_container_width=True)
+    if profile.rows_valid == 0:
+        st.error("❌ No valid rows in the file.")
+        return
+    st.caption(f"Dates {profile.first_date:%Y-%m-%d} → {profile.last_date:%Y-%m-%d}")
+
+    st.markdown("### 🔍 Preview of Uploaded Data")
+    st.dataframe(profile.head, use_container_width=True)
+    with st.expander(f"Random sample ({len(profile.preview()):,} rows)"):
+        st.dataframe(profile.preview(), use_container_width=True)
+
+    st.markdown("### 📊 Summary Statistics")
+    st.caption("Quartiles are estimated from the random sample; the other statistics are exact.")
+    st.dataframe(profile.summary(), use_container_width=True)
+
+    series = profile.series.frame()
+    period = "day" if profile.series.days == 1 else f"{profile.series.days}-day period"
+    st.markdown("### 📈 Price Chart (OHLC)")
+    fig_ohlc = px.line(downsample_frame(series, "date", ["open", "high", "low", "close"]), x="date", y=["open", "high", "low", "close"],
+                       title=f"📊 OHLC Prices for {asset_display_name} (per {period})",
+                       labels={"date": "Date", "value": "Price"},
+                       template="plotly_dark")
+    plotly_chart(fig_ohlc, use_container_width=True)
+
+    st.markdown("### 📊 Trading Volume")
+    fig_volume = px.bar(downsample_frame(series, "date", "volume", method="minmax"), x="date", y="volume",
+                        title=f"📊 Trading Volume for {asset_display_name} (per {period})",
+                        labels={"date": "Date", "volume": "Volume"},
+                        template="plotly_dark")
+    plotly_chart(fig_volume, use_container_width=True)
+
+    st.markdown("### 🔁 Return Series")
+    selected_return = st.selectbox("Choose return series to visualize", ["Daily Percentage", "Log Return"],
+                                   key="stream_return")
+    return_col = "daily_pct_change" if selected_return == "Daily Percentage" else "log_return"
+    fig_returns = px.line(downsample_frame(series, "date", return_col), x="date", y=return_col,
+                          title=f"📉 {selected_return} over Time (mean per {period})",
+                          labels={"date": "Date", return_col: "Return"},
+                          template="plotly_white")
+    plotly_chart(fig_returns, use_container_width=True)
+
+
+# --------- Streaming Import Section ---------
+if streaming:
+    source = server_path.strip() if server_path.strip() else import_file
+    col1, col2 = st.columns(2)
+    run_import = col1.button("🚀 Stream into DuckDB", key="stream_btn", disabled=source is None)
+    run_profile = col2.button("🔍 Profile only", key="profile_btn", disabled=source is None)
+    if run_import or run_profile:
+        if isinstance(source, str) and not os.path.isfile(source):
+            st.error(f"❌ File not found on the server: {source}")
+        else:
+            bar = st.progress(0.0, text="Reading chunks...")
+            try:
+                if hasattr(source, "seek"):
+                    source.seek(0)
+                profile = stream_import(
+                    source,
+                    asset_id=series_name or None,
+                    writer=writer if run_import else None,
+                    finalize=(lambda con: save_metadata(con, metadata_row)) if series_name else None,
+                    chunk_rows=int(chunk_rows),
+                    tolerance=tolerance,
+                    allow_partial=allow_partial,
+                    progress=lambda done: bar.progress(done, text=f"Read {done:.0%} of the file"),
+                )
+                bar.progress(1.0, text="Done")
+                if run_import and profile.rows_written:
+                    # stats from the stored history, streamed back one asset at a time
+                    assets = sorted(profile.assets)
+                    refresh_asset_stats(assets, DuckDBSource(DB_PATH).stream(assets, columns=["asset_id", "date", "close"]))
+                    st.success(f"✅ {profile.rows_written:,} rows saved to DuckDB! The series is now available on every page.")
+                elif run_import and profile.rejected:
+                    st.error("❌ Nothing was stored: rejected chunks would have left a hole in the stored history. "
+                             "Fix the file, raise the tolerance, or allow storing the valid chunks.")
+                st.session_state["stream_profile"] = profile
+            except Exception as e:
+                st.error(f"❌ Error processing file: {str(e)}")
+    if "stream_profile" in st.session_state:
+        render_stream_report(st.session_state["stream_profile"], series_name or "the imported file")
+
 # --------- Upload and Processing Section ---------
-if import_file:
+if import_file and not streaming:
     try:
-        df = pd.read_csv(import_file)
+        with span("read_csv") as s:
+            df = pd.read_csv(import_file)
+            s.set(rows_out=len(df), bytes=getattr(import_file, "size", None))
         df.columns = df.columns.str.lower().str.replace(' ', '_')
         
         expected_columns = {
@@ -89,23 +232,25 @@ if import_file:
             st.dataframe(df.head(), use_container_width=True)
 
             st.markdown("### 📊 Summary Statistics")
-            st.dataframe(df.describe(include='all'), use_container_width=True)
+            with span("describe", rows_in=len(df)):
+                summary = df.describe(include='all')
+            st.dataframe(summary, use_container_width=True)
 
             st.markdown("### 📈 Price Chart (OHLC)")
             asset_display_name = series_name if series_name else df["asset_id"].iloc[0]
-            fig_ohlc = px.line(df, x="date", y=["open", "high", "low", "close"], 
+            fig_ohlc = px.line(downsample_frame(df, "date", ["open", "high", "low", "close"]), x="date", y=["open", "high", "low", "close"], 
                                title=f"📊 OHLC Prices for {asset_display_name}",
                                labels={"date": "Date", "value": "Price"},
                                template="plotly_dark")
-            st.plotly_chart(fig_ohlc, use_container_width=True)
+            plotly_chart(fig_ohlc, use_container_width=True)
 
             if 'volume' in df.columns:
                 st.markdown("### 📊 Trading Volume")
-                fig_volume = px.bar(df, x="date", y="volume", 
+                fig_volume = px.bar(downsample_frame(df, "date", "volume", method="minmax"), x="date", y="volume", 
                                     title=f"📊 Trading Volume for {asset_display_name}",
                                     labels={"date": "Date", "volume": "Volume"},
                                     template="plotly_dark")
-                st.plotly_chart(fig_volume, use_container_width=True)
+                plotly_chart(fig_volume, use_container_width=True)
 
             st.markdown("### 🔁 Return Series")
             return_options = []
@@ -119,11 +264,11 @@ if import_file:
                                                [opt[0] for opt in return_options])
                 return_col = [opt[1] for opt in return_options if opt[0] == selected_return][0]
                 
-                fig_returns = px.line(df, x="date", y=return_col, 
+                fig_returns = px.line(downsample_frame(df, "date", return_col), x="date", y=return_col, 
                                       title=f"📉 {selected_return} over Time",
                                       labels={"date": "Date", return_col: "Return"},
                                       template="plotly_white")
-                st.plotly_chart(fig_returns, use_container_width=True)
+                plotly_chart(fig_returns, use_container_width=True)
             else:
                 st.warning("No return series found in the data (daily_pct_change or log_return)")
 
@@ -134,33 +279,28 @@ if import_file:
 st.markdown("---")
 col1, col2 = st.columns(2)
 with col1:
-    if st.button("💾 Save Configuration", key="save_btn"):
+    if streaming:
+        st.caption("In streaming mode the import above stores the data as it reads it.")
+    if st.button("💾 Save Configuration", key="save_btn", disabled=streaming):
         if 'df' in locals() and not df.empty:
             try:
-                # Save metadata
-                con.execute("""
-                    INSERT OR REPLACE INTO asset_metadata (
-                        asset_id, assigned_ticker, description,
-                        series_type, is_percentage, import_yield,
-                        asset_class, asset_category
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    series_name,
-                    assigned_ticker,
-                    description,
-                    series_type,
-                    percentage_values,
-                    import_yield,
-                    asset_class,
-                    asset_category
-                ))
-
-                # Save price data
                 df['asset_id'] = series_name
-                con.execute("DELETE FROM price_data WHERE asset_id = ?", (series_name,))
-                con.execute("INSERT INTO price_data SELECT * FROM df")
+                incoming = df[PRICE_COLUMNS]
+
+                # Metadata and prices are replaced in the same queued transaction
+                def save(con):
+                    save_metadata(con, metadata_row)
+                    con.execute("DELETE FROM price_data WHERE asset_id = ?", (series_name,))
+                    con.register("incoming", incoming)
+                    try:
+                        con.execute(f"INSERT INTO price_data SELECT {', '.join(PRICE_COLUMNS)} FROM incoming")
+                    finally:
+                        con.unregister("incoming")
 
-                st.success("✅ Configuration and data saved to DuckDB!")
+                writer.submit(save).result()
+                update_asset_stats(df, replace=True)
+
+                st.success("✅ Configuration and data saved to DuckDB! The series is now available on every page.")
             except Exception as e:
                 st.error(f"❌ Failed to save to DuckDB: {e}")
         else:
@@ -172,7 +312,8 @@ with col2:
 # --------- Preview Saved Assets ---------
 st.markdown("### 📋 Assets Stored in Database")
 try:
-    assets_df = con.execute("SELECT * FROM asset_metadata").df()
+    with reader(DB_PATH) as cur:
+        assets_df = cur.execute("SELECT * FROM asset_metadata").df()
     st.dataframe(assets_df, use_container_width=True)
 except Exception as e:
     st.error(f"Could not fetch data: {e}")
@@ -186,3 +327,5 @@ st.markdown(
     "</div>",
     unsafe_allow_html=True
 )
+
+render_diagnostics_panel()
@@ -1,49 +1,97 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import duckdb
 from st_aggrid import AgGrid, GridOptionsBuilder
+from utils.downsample import downsample_frame
+from utils.asset_stats import STATS_PATH
+from utils.arrow_io import to_pandas
+from utils.data_source import price_source
+from utils.prefetch import load_asset_prices, load_screener_metadata, warm_up
+from utils.screener_query import (
+    METADATA_PATH, filter_frame,
+    count_assets, fetch_page, group_counts, distinct_values
+)
+from utils.tracing import traced, note_cache_miss
+from utils.db_writer import get_writer, reader
+from utils.diagnostics import begin_rerun, render_diagnostics_panel, plotly_chart
 
 # ---------- Data Loading ----------
+def stats_version():
+    return STATS_PATH.stat().st_mtime if STATS_PATH.exists() else None
+
+def data_version():
+    meta_mtime = METADATA_PATH.stat().st_mtime if METADATA_PATH.exists() else None
+    return meta_mtime, stats_version()
+
+# ---------- Server-side Queries ----------
+# `version` only keys the caches so new metadata/stats files invalidate them
+@traced("load_distinct_values", cache=True)
+@st.cache_data
+def load_distinct_values(column, version):
+    note_cache_miss()
+    return distinct_values(column)
+
+@traced("load_count", cache=True)
+@st.cache_data
+def load_count(filters, version):
+    note_cache_miss()
+    return count_assets(filters)
+
+@traced("load_page", cache=True)
 @st.cache_data
-def load_metadata():
-    query = "SELECT * FROM 'data/asset_metadata.parquet'"
-    return duckdb.query(query).to_df()
+def load_page(filters, page, page_size, sort_by, descending, version):
+    note_cache_miss()
+    return fetch_page(filters, page, page_size, sort_by or None, descending)
 
+@traced("load_group_counts", cache=True)
 @st.cache_data
-def load_price_data_for_asset(asset_id: str):
-    query = f"""
-        SELECT * FROM 'data/price_data.parquet'
-        WHERE asset_id = '{asset_id}'
-    """
-    return duckdb.query(query).to_df()
+def load_group_counts(filters, column, version):
+    note_cache_miss()
+    return group_counts(filters, column)
 
 # ---------- Persistent Save ----------
+SELECTED_ASSETS_DB = 'data/selected_assets.duckdb'
+
 def save_selected_assets(selected_assets):
-    con = duckdb.connect(database='data/selected_assets.duckdb')  # Save in a DuckDB file
-    con.execute("CREATE TABLE IF NOT EXISTS selected_assets (asset_id TEXT)")
-    con.execute("DELETE FROM selected_assets")
-    for asset_id in selected_assets:
-        con.execute("INSERT INTO selected_assets VALUES (?)", (asset_id,))
-    con.close()
+    # Queued on the single writer for the file; replaced in one transaction
+    def replace(con):
+        con.execute("CREATE TABLE IF NOT EXISTS selected_assets (asset_id TEXT)")
+        con.execute("DELETE FROM selected_assets")
+        con.executemany("INSERT INTO selected_assets VALUES (?)", [(a,) for a in selected_assets])
+    get_writer(SELECTED_ASSETS_DB, snapshot_tables=["selected_assets"]).submit(replace).result()
 
 def load_selected_assets():
-    con = duckdb.connect(database='data/selected_assets.duckdb')  # Same file for loading
-    try:
-        df = con.execute("SELECT asset_id FROM selected_assets").fetchdf()
-        return df['asset_id'].tolist()
-    except:
-        return []
-    finally:
-        con.close()
+    with reader(SELECTED_ASSETS_DB) as cur:
+        try:
+            df = cur.execute("SELECT asset_id FROM selected_assets").fetchdf()
+            return df['asset_id'].tolist()
+        except:
+            return []
 
 
 # ---------- Main App ----------
 def main():
     st.set_page_config(page_title="📊 Market Screener", layout="wide")
+    begin_rerun("Market_Screener")
+    warm_up()
     st.title("📊 Market Screener and Search Tool")
 
-    metadata = load_metadata()
+    server_side = st.sidebar.toggle(
+        "⚡ Server-side paging",
+        help="Filter, sort and page inside DuckDB; only the current page is sent to the browser."
+    )
+    version = data_version()
+
+    if server_side:
+        metadata = None
+        has_stats = STATS_PATH.exists()
+        def options(column):
+            return [""] + load_distinct_values(column, version)
+    else:
+        metadata = load_screener_metadata(stats_version())
+        has_stats = "return_5y" in metadata.columns
+        def options(column):
+            return [""] + sorted(metadata[column].dropna().unique().tolist())
 
     # Search Filters
     with st.expander("🔍 Search Filters", expanded=True):
@@ -59,47 +107,81 @@ def main():
         if st.button("Clear All"):
             asset_id_input = code_input = name_input = description_input = ""
 
-    filtered = metadata.copy()
-    if asset_id_input:
-        filtered = filtered[filtered["asset_id"].astype(str).str.contains(asset_id_input, case=False, na=False)]
-    if code_input:
-        filtered = filtered[filtered["code"].astype(str).str.contains(code_input, case=False, na=False)]
-    if name_input:
-        filtered = filtered[filtered["name"].astype(str).str.contains(name_input, case=False, na=False)]
-    if description_input:
-        filtered = filtered[filtered["description"].astype(str).str.contains(description_input, case=False, na=False)]
+    filters = {
+        "text": {"asset_id": asset_id_input, "code": code_input,
+                 "name": name_input, "description": description_input},
+        "equals": {}, "min": {}, "max": {},
+    }
 
     # Advanced Filters
     with st.expander("⚙️ Advanced Filters"):
         col1, col2, col3 = st.columns(3)
-        asset_types = [""] + sorted(metadata["asset_type"].dropna().unique().tolist())
-        exchanges = [""] + sorted(metadata["exchange"].dropna().unique().tolist())
-        categories = [""] + sorted(metadata["category"].dropna().unique().tolist())
-
         with col1:
-            selected_asset_type = st.selectbox("Asset Type", asset_types)
+            filters["equals"]["asset_type"] = st.selectbox("Asset Type", options("asset_type"))
         with col2:
-            selected_exchange = st.selectbox("Exchange", exchanges)
+            filters["equals"]["exchange"] = st.selectbox("Exchange", options("exchange"))
         with col3:
-            selected_category = st.selectbox("Category", categories)
+            filters["equals"]["category"] = st.selectbox("Category", options("category"))
 
-        if selected_asset_type:
-            filtered = filtered[filtered["asset_type"] == selected_asset_type]
-        if selected_exchange:
-            filtered = filtered[filtered["exchange"] == selected_exchange]
-        if selected_category:
-            filtered = filtered[filtered["category"] == selected_category]
+    # Performance Filters (precomputed per-asset stats)
+    sort_by, sort_desc = "", True
+    if has_stats:
+        with st.expander("📈 Performance Filters"):
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                min_return_1y = st.number_input("Min 1Y Return (%)", value=None, step=1.0)
+                min_return_5y = st.number_input("Min 5Y Return (%)", value=None, step=1.0)
+            with col2:
+                min_return_10y = st.number_input("Min 10Y Return (%)", value=None, step=1.0)
+                max_volatility = st.number_input("Max Volatility (%)", value=None, min_value=0.0, step=1.0)
+            with col3:
+                max_drawdown_limit = st.number_input("Max Drawdown no worse than (%)", value=None, max_value=0.0, step=1.0)
+                min_coverage = st.slider("Min Data Coverage (%)", 0, 100, 0)
+            with col4:
+                sort_options = ["", "return_1m", "return_1y", "return_5y", "return_10y",
+                                "volatility", "max_drawdown", "coverage", "row_count", "last_date"]
+                sort_by = st.selectbox("Sort By", sort_options)
+                sort_desc = st.checkbox("Descending", value=True)
+
+        def pct(value):
+            return None if value is None else value / 100
+
+        filters["min"].update({
+            "return_1y": pct(min_return_1y),
+            "return_5y": pct(min_return_5y),
+            "return_10y": pct(min_return_10y),
+            "max_drawdown": pct(max_drawdown_limit),
+            "coverage": pct(min_coverage) if min_coverage else None,
+        })
+        filters["max"]["volatility"] = pct(max_volatility)
 
     # Display Table
     st.markdown("### 🧾 Asset Results")
-    gb = GridOptionsBuilder.from_dataframe(filtered)
-    gb.configure_pagination()
+    if server_side:
+        total = load_count(filters, version)
+        col1, col2 = st.columns([1, 3])
+        with col1:
+            page_size = st.selectbox("Rows per page", [25, 50, 100, 250], index=2)
+        num_pages = max(1, -(-total // page_size))
+        with col2:
+            page = st.number_input(f"Page (of {num_pages:,}, {total:,} assets)",
+                                   min_value=1, max_value=num_pages, value=1) - 1
+        page_df = load_page(filters, page, page_size, sort_by, sort_desc, version)
+    else:
+        filtered = filter_frame(metadata, filters)
+        if sort_by:
+            filtered = filtered.sort_values(sort_by, ascending=not sort_desc, na_position="last")
+        page_df = filtered
+
+    gb = GridOptionsBuilder.from_dataframe(page_df)
+    if not server_side:
+        gb.configure_pagination()
     gb.configure_default_column(groupable=True, filterable=True, editable=False)
     gb.configure_selection('multiple')
     grid_options = gb.build()
 
     grid_response = AgGrid(
-        filtered,
+        page_df,
         gridOptions=grid_options,
         height=400,
         enable_enterprise_modules=False,
@@ -115,19 +197,27 @@ def main():
     # Summary Charts
     st.markdown("### 📊 Summary Visualizations")
 
-    if not filtered.empty and "asset_type" in filtered.columns:
+    if server_side:
+        type_counts = load_group_counts(filters, "asset_type", version)
+        exchange_counts = load_group_counts(filters, "exchange", version)
+    else:
+        type_counts = filtered["asset_type"].value_counts().reset_index()
+        exchange_counts = filtered["exchange"].value_counts().reset_index()
+    type_counts.columns = ["Asset Type", "Count"]
+    exchange_counts.columns = ["Exchange", "Count"]
+
+    if not type_counts.empty:
         pie_fig = px.pie(
-            filtered,
-            names="asset_type",
+            type_counts,
+            names="Asset Type",
+            values="Count",
             title="Asset Type Distribution",
             hole=0.4,
             template="plotly_white"
         )
-        st.plotly_chart(pie_fig, use_container_width=True)
+        plotly_chart(pie_fig, use_container_width=True)
 
-    if "exchange" in filtered.columns:
-        exchange_counts = filtered["exchange"].value_counts().reset_index()
-        exchange_counts.columns = ["Exchange", "Count"]
+    if not exchange_counts.empty:
         exchange_bar = px.bar(
             exchange_counts,
             x="Exchange",
@@ -136,7 +226,7 @@ def main():
             labels={"Exchange": "Exchange", "Count": "Number of Assets"},
             template="plotly_white"
         )
-        st.plotly_chart(exchange_bar, use_container_width=True)
+        plotly_chart(exchange_bar, use_container_width=True)
 
     # Price Charts
     if selected_asset_ids:
@@ -146,9 +236,10 @@ def main():
 
         time_range = st.radio("Select Time Range:", ['1Y', '5Y', '10Y', 'All'], horizontal=True)
         combined_df = pd.DataFrame()
+        price_version = price_source().version()
 
         for asset_id in selected_asset_ids:
-            df = load_price_data_for_asset(asset_id)
+            df = to_pandas(load_asset_prices(asset_id, ("asset_id", "date", "close", "daily_pct_change"), price_version))
             if df.empty:
                 continue
             df['cumulative_return'] = (1 + df['daily_pct_change'] / 100).cumprod()
@@ -170,14 +261,16 @@ def main():
 
         if not combined_df.empty:
             chart = px.line(
-                combined_df,
+                downsample_frame(combined_df, 'date', y_axis, group='asset_id'),
                 x='date',
                 y=y_axis,
                 color='asset_id',
                 title=f"{chart_mode} over Time",
                 template="plotly_white"
             )
-            st.plotly_chart(chart, use_container_width=True)
+            plotly_chart(chart, use_container_width=True)
+
+    render_diagnostics_panel()
 
 # ---------- Run ----------
 if __name__ == "__main__":
@@ -5,77 +5,82 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import plotly.express as px
-import duckdb
 import json
+import duckdb
 from utils.backtest_engine import prepare_data, compute_portfolio_nav
 from utils.analysis_tools import compare_multiple_portfolios
+from utils.optimizer import get_moments, efficient_frontier, max_sharpe, risk_parity, to_percent_weights
+from utils.downsample import downsample_frame
+from utils.data_source import price_source
+from utils.fx import BASE_CURRENCIES
+from utils.db_writer import get_writer, reader
+from utils.prefetch import DEFAULT_START, DEFAULT_END, load_asset_ids, load_price_panel, prefetch, fetch, warm_up
+from utils.tracing import traced, note_cache_miss
+from utils.diagnostics import begin_rerun, render_diagnostics_panel, plotly_chart
 
 # ----------- DuckDB Configuration -----------
 
 DUCKDB_PATH = "data/portfolio.db"
 
-def get_duckdb_connection():
-    return duckdb.connect(database=DUCKDB_PATH)
+# All writes to portfolio.db go through one writer thread; saved_portfolios is
+# read back from its Parquet snapshot, by this page and by batch_runner
+def get_portfolio_writer():
+    return get_writer(DUCKDB_PATH, snapshot_tables=["saved_portfolios"])
 
 def initialize_db():
-    con = get_duckdb_connection()
-    con.execute("""
+    get_portfolio_writer().execute("""
         CREATE TABLE IF NOT EXISTS saved_portfolios (
             name TEXT PRIMARY KEY,
             assets TEXT, -- JSON list
             weights TEXT -- JSON list
         )
     """)
-    con.close()
 
 initialize_db()
 
-# ----------- Load Metadata -----------
+# ----------- Optimizer -----------
 
+@traced("load_frontier", cache=True)
 @st.cache_data
-def load_metadata():
-    con = get_duckdb_connection()
-    df = con.execute("SELECT * FROM 'data/asset_metadata.parquet'").df()
-    con.close()
-    return df
-
-# ----------- Load Price Data -----------
-
+def load_frontier(assets, start_date, end_date, shrinkage, max_weight, version):
+    note_cache_miss()
+    # covariance is cached per asset set / window / data version inside get_moments
+    prices = load_price_panel(tuple(assets), start_date, end_date, version)
+    mu, cov = get_moments(prices, assets, start_date, end_date, shrinkage, version)
+    points, weights = efficient_frontier(mu, cov, max_weight=max_weight)
+    return mu, cov, points, weights
+
+# Keyed like load_frontier and refined from its solves, so typing a name doesn't re-solve
+@traced("load_max_sharpe", cache=True)
 @st.cache_data
-def load_filtered_price_data(selected_assets, start_date, end_date):
-    con = get_duckdb_connection()
-    asset_list = ','.join(f"'{a}'" for a in selected_assets)
-    
-    query = f"""
-        SELECT * FROM 'data/price_data.parquet'
-        WHERE asset_id IN ({asset_list})
-        AND date BETWEEN '{start_date}' AND '{end_date}'
-    """
-    df = con.execute(query).df()
-    con.close()
-    return df
+def load_max_sharpe(assets, start_date, end_date, shrinkage, max_weight, version):
+    note_cache_miss()
+    mu, cov, points, weights = load_frontier(assets, start_date, end_date, shrinkage, max_weight, version)
+    return max_sharpe(mu, cov, max_weight=max_weight, frontier=(points, weights))
 
 # ----------- Save & Load Portfolios -----------
 
 def save_portfolio(name, assets, weights):
-    con = get_duckdb_connection()
-    con.execute("INSERT OR REPLACE INTO saved_portfolios VALUES (?, ?, ?)",
-                (name, json.dumps(assets), json.dumps(weights)))
-    con.close()
+    get_portfolio_writer().execute("INSERT OR REPLACE INTO saved_portfolios VALUES (?, ?, ?)",
+                                   (name, json.dumps(assets), json.dumps(weights)))
 
 def load_saved_portfolios():
-    con = get_duckdb_connection()
-    rows = con.execute("SELECT * FROM saved_portfolios").fetchall()
-    con.close()
+    with reader(DUCKDB_PATH) as cur:
+        try:
+            rows = cur.execute("SELECT * FROM saved_portfolios").fetchall()
+        except duckdb.CatalogException:  # no snapshot published yet (e.g. the CREATE failed)
+            return {}
     return {name: (json.loads(a), json.loads(w)) for name, a, w in rows}
 
 # ----------- UI -----------
 
 st.set_page_config(page_title="📊 Portfolio Analysis Tool", layout="wide")
+begin_rerun("Portfolio_Analysis")
+warm_up()
 st.title("📊 Portfolio Comparison & Analysis Tool")
 
-metadata = load_metadata()
-asset_options = metadata['asset_id'].unique()
+price_version = price_source().version()
+asset_options = load_asset_ids(price_version)
 
 # Load saved portfolios
 saved = load_saved_portfolios()
@@ -84,10 +89,14 @@ st.sidebar.header("💾 Saved Portfolios")
 selected_saved_names = st.sidebar.multiselect("Load saved portfolios", options=list(saved.keys()))
 portfolios = []
 
-# Load portfolios from selection
+# Load portfolios from selection; their price panels start loading in the
+# background now, for the comparison window as it currently stands
+compare_start = st.session_state.get("compare_start", DEFAULT_START)
+compare_end = st.session_state.get("compare_end", DEFAULT_END)
 for name in selected_saved_names:
     assets, weights = saved[name]
     portfolios.append((assets, weights))
+    prefetch(load_price_panel, tuple(sorted(assets)), compare_start, compare_end, price_version)
 
 st.subheader("🧺 Define New Portfolios")
 num_new = st.number_input("Number of new portfolios to create", min_value=0, max_value=5, value=0)
@@ -116,31 +125,87 @@ for i in range(num_new):
             else:
                 portfolios.append((assets, weights))
 
+st.subheader("🧮 Optimize a Portfolio")
+with st.expander("Mean-variance optimizer (long-only)"):
+    opt_assets = st.multiselect("Universe", options=asset_options, key="opt_assets")
+    col1, col2 = st.columns(2)
+    with col1:
+        opt_start = st.date_input("Estimation start", value=pd.to_datetime("2018-01-01").date(), key="opt_start")
+        opt_end = st.date_input("Estimation end", value=pd.to_datetime("2023-12-31").date(), min_value=opt_start, key="opt_end")
+    with col2:
+        method = st.radio("Allocation", ["Min variance", "Max Sharpe", "Risk parity", "Frontier point"], key="opt_method")
+        max_weight = st.slider("Max weight per asset (%)", 1, 100, 100, key="opt_max_weight") / 100
+        shrink = st.checkbox("Ledoit-Wolf shrinkage", value=True, key="opt_shrink")
+
+    if len(opt_assets) >= 2 and max_weight * len(opt_assets) >= 1:
+        try:
+            frontier_key = (sorted(opt_assets), opt_start, opt_end, "ledoit_wolf" if shrink else None, max_weight, price_version)
+            mu, cov, points, frontier_weights = load_frontier(*frontier_key)
+        except ValueError as e:
+            st.warning(f"Cannot optimize over this window: {e}")
+        else:
+            if method == "Min variance":
+                opt_weights = frontier_weights.iloc[0]
+            elif method == "Max Sharpe":
+                opt_weights = load_max_sharpe(*frontier_key)
+            elif method == "Risk parity":
+                opt_weights = risk_parity(cov, max_weight=max_weight)
+            else:
+                point = st.slider("Frontier point (low → high risk)", 0, len(points) - 1, len(points) // 2, key="opt_point")
+                opt_weights = frontier_weights.iloc[point]
+
+            opt_ret = float(mu @ opt_weights)
+            opt_vol = float(np.sqrt(opt_weights @ cov @ opt_weights))
+            fig = px.line(points, x="volatility", y="return", markers=True, title="Efficient Frontier",
+                          labels={"volatility": "Volatility (ann.)", "return": "Expected Return (ann.)"})
+            fig.add_scatter(x=[opt_vol], y=[opt_ret], mode="markers", marker=dict(size=14, symbol="star"), name=method)
+            plotly_chart(fig, use_container_width=True)
+
+            opt_names, opt_pct = to_percent_weights(opt_weights, max_weight=max_weight)
+            st.dataframe(pd.DataFrame({"Asset": opt_names, "Weight (%)": opt_pct}), use_container_width=True)
+
+            opt_name = st.text_input("Portfolio name", value=f"{method} ({len(opt_names)} assets)", key="opt_name")
+            if st.button("💾 Save Optimized Portfolio", key="opt_save"):
+                save_portfolio(opt_name, opt_names, opt_pct)
+                st.success(f"✅ Saved as '{opt_name}'")
+                st.rerun()
+    elif opt_assets:
+        st.info("Pick at least two assets, with a max weight that lets the weights reach 100%.")
+
 # ----------- Date Range -----------
 
 if portfolios:
     st.subheader("📅 Select Time Period")
-    start_date = st.date_input("Start Date", value=pd.to_datetime("2015-01-01").date())
-    end_date = st.date_input("End Date", value=pd.to_datetime("2023-12-31").date(), min_value=start_date)
+    start_date = st.date_input("Start Date", value=DEFAULT_START, key="compare_start")
+    end_date = st.date_input("End Date", value=DEFAULT_END, min_value=start_date, key="compare_end")
+    base_currency = st.selectbox("Base currency", ["Local (no conversion)"] + list(BASE_CURRENCIES), key="compare_currency")
+    base_currency = base_currency if base_currency in BASE_CURRENCIES else None
 
     if st.button("🚀 Compare Portfolios"):
-        all_assets = list(set([a for portfolio, _ in portfolios for a in portfolio]))
-        price_data = load_filtered_price_data(all_assets, start_date, end_date)
+        # one panel per portfolio, the same cache entries the sidebar prefetched
+        panels = [fetch(load_price_panel, tuple(sorted(assets)), start_date, end_date, price_version)
+                  for assets, _ in portfolios]
 
-        if price_data.empty:
+        navs = {}
+        if all(p.num_rows == 0 for p in panels):
             st.warning("No price data available.")
         else:
-            navs = {}
-            for i, (assets, weights) in enumerate(portfolios):
-                df = prepare_data(price_data, assets, start_date, end_date)
-                nav = compute_portfolio_nav(df, weights)
-                navs[f"Portfolio {i+1}"] = nav
-
+            try:
+                for i, ((assets, weights), price_data) in enumerate(zip(portfolios, panels)):
+                    df = prepare_data(price_data, assets, start_date, end_date, base_currency=base_currency)
+                    nav = compute_portfolio_nav(df, weights)
+                    navs[f"Portfolio {i+1}"] = nav
+            except ValueError as e:  # no FX series for a currency
+                st.warning(f"Cannot convert to {base_currency}: {e}")
+                navs = {}
+
+        if navs:
             # NAV Chart
             nav_df = pd.DataFrame(navs)
             st.subheader("📈 NAV Comparison")
-            fig = px.line(nav_df, x=nav_df.index, y=nav_df.columns, labels={"value": "NAV", "index": "Date"})
-            st.plotly_chart(fig, use_container_width=True)
+            chart_df = downsample_frame(nav_df)
+            fig = px.line(chart_df, x=chart_df.index, y=chart_df.columns, labels={"value": "NAV", "index": "Date"})
+            plotly_chart(fig, use_container_width=True)
 
             # Metrics Table
             metrics_df = compare_multiple_portfolios(navs)
@@ -153,4 +218,6 @@ if portfolios:
             for i, (assets, weights) in enumerate(portfolios):
                 with cols[i % len(cols)]:
                     fig = px.pie(names=assets, values=weights, title=f"Portfolio {i+1} Allocation")
-                    st.plotly_chart(fig, use_container_width=True)
+                    plotly_chart(fig, use_container_width=True)
+
+render_diagnostics_panel()
@@ -2,34 +2,21 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import numpy as np
-from datetime import date
-import os
-
-# ----------- Load Metadata -----------
-@st.cache_data
-def load_metadata():
-    return pd.read_csv("data/asset_Economic.FRED.DGS30.csv")  # Corrected file path
-
-# ----------- Load Only Required Price Data -----------
-@st.cache_data
-def load_filtered_price_data(selected_assets, start_date, end_date):
-    file_path = "data/asset_Economic.FRED.DGS30.csv"  # Corrected file path
-    if os.path.exists(file_path):
-        df = pd.read_csv(file_path)
-    else:
-        st.error(f"File not found: {file_path}")
-        return pd.DataFrame()  # Return empty DataFrame in case of error
-
-    df['date'] = pd.to_datetime(df['date'])  # Ensure the 'date' column is in datetime format
-    df = df[df["asset_id"].isin(selected_assets) & (df["date"].between(pd.to_datetime(start_date), pd.to_datetime(end_date)))]
-    return df
+from utils.alignment import align_prices
+from utils.data_source import price_source
+from utils.downsample import downsample_series
+from utils.fx import BASE_CURRENCIES, to_base_currency
+from utils.prefetch import DEFAULT_START, DEFAULT_END, load_asset_ids, load_price_panel, warm_up
+from utils.diagnostics import begin_rerun, render_diagnostics_panel, plotly_chart
 
 # ----------- UI -----------
 st.set_page_config(page_title="📈 Portfolio Backtesting Tool", layout="wide")
+begin_rerun("Portifolio_Backtest")
+warm_up()
 st.title("📈 Portfolio Backtesting Tool")
 
-metadata = load_metadata()
-asset_options = metadata['asset_id'].unique()
+price_version = price_source().version()
+asset_options = load_asset_ids(price_version)
 
 st.subheader("🧺 Define Portfolio")
 portfolio_assets = st.multiselect("Select assets for portfolio", options=asset_options)
@@ -47,18 +34,25 @@ if portfolio_assets:
         st.success("✅ Portfolio is valid. You can run the backtest.")
 
         st.subheader("📅 Select Backtest Period")
-        start_date = st.date_input("Start Date", value=date(2015, 1, 1))
-        end_date = st.date_input("End Date", value=date(2023, 12, 31), min_value=start_date)
+        start_date = st.date_input("Start Date", value=DEFAULT_START)
+        end_date = st.date_input("End Date", value=DEFAULT_END, min_value=start_date)
+        base_currency = st.selectbox("Base currency", ["Local (no conversion)"] + list(BASE_CURRENCIES))
 
         if st.button("🚀 Run Backtest"):
-            price_data = load_filtered_price_data(portfolio_assets, start_date, end_date)
+            price_data = load_price_panel(tuple(sorted(portfolio_assets)), start_date, end_date, price_version)
 
-            if price_data.empty:
+            if price_data.num_rows == 0:
                 st.warning("No price data found for selected assets and period.")
             else:
-                filtered = price_data.copy()
-                pivot = filtered.pivot(index='date', columns='asset_id', values='close')
-                pivot = pivot.fillna(method='ffill').dropna()
+                pivot = align_prices(price_data, portfolio_assets, values='close', how='ffill')
+                try:
+                    if base_currency in BASE_CURRENCIES:
+                        pivot = to_base_currency(pivot, base_currency, version=price_version)
+                except ValueError as e:  # no FX series for a currency
+                    st.warning(f"Cannot convert to {base_currency}: {e}")
+                    pivot = None
+
+            if price_data.num_rows and pivot is not None:
                 returns = pivot.pct_change().dropna()
 
                 weight_array = np.array(weights) / 100
@@ -66,11 +60,14 @@ if portfolio_assets:
                 portfolio_nav = (1 + portfolio_returns).cumprod()
 
                 st.subheader("📊 Portfolio NAV Chart")
-                fig = px.line(x=portfolio_nav.index, y=portfolio_nav.values, labels={'x': 'Date', 'y': 'Portfolio NAV'})
-                st.plotly_chart(fig, use_container_width=True)
+                chart_nav = downsample_series(portfolio_nav)
+                fig = px.line(x=chart_nav.index, y=chart_nav.values, labels={'x': 'Date', 'y': 'Portfolio NAV'})
+                plotly_chart(fig, use_container_width=True)
 
                 st.subheader("📈 Performance Metrics")
                 cagr = (portfolio_nav.iloc[-1] ** (1 / ((portfolio_nav.index[-1] - portfolio_nav.index[0]).days / 365.25))) - 1
                 max_dd = ((portfolio_nav / portfolio_nav.cummax()) - 1).min()
                 st.write(f"**CAGR:** {cagr:.2%}")
                 st.write(f"**Max Drawdown:** {max_dd:.2%}")
+
+render_diagnostics_panel()
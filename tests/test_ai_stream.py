@@ -0,0 +1,130 @@
+# tests/test_ai_stream.py
+"""
+Streaming assistant against the local mock server (utils.mock_llm_server):
+a streamed answer with a tool round, a cancelled stream, a server error,
+a slow tool next to another stream, and a consumer whose producer is gone.
+"""
+
+import time
+from concurrent.futures import Future
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.ai_agent import ResultCache, StubModel, build_messages
+from utils.ai_stream import StreamHandle, StreamingPool, stream_ai_response
+from utils.mock_llm_server import MockLLMServer
+
+NAVS = pd.DataFrame({"Growth": np.linspace(100, 150, 300)},
+                    index=pd.bdate_range("2020-01-01", periods=300))
+METADATA = pd.DataFrame({"asset_id": ["SPY"]})
+
+
+class LongAnswer:
+    def __call__(self, messages, tools):
+        return {"content": " ".join(f"word{i}" for i in range(200)), "tool_calls": []}
+
+
+class Failing:
+    def __call__(self, messages, tools):
+        raise RuntimeError("model exploded")
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    started = []
+
+    def start(model, **kwargs):
+        server = MockLLMServer(model, **kwargs).start()
+        pool = StreamingPool(base_url=server.base_url, timeout=5)
+        started.append((server, pool))
+        return server, pool
+
+    yield start
+    for server, pool in started:
+        pool.shutdown()
+        server.stop()
+
+
+def ask(pool, cache, question="How is the Growth portfolio doing?"):
+    return stream_ai_response(question, METADATA, None, NAVS, pool=pool, cache=cache)
+
+
+def test_stream_runs_tools_and_caches_answer(serve):
+    server, pool = serve(StubModel(["Growth"]))
+    cache = ResultCache()
+
+    handle = ask(pool, cache)
+    chunks = list(handle)
+
+    assert handle.error is None and not handle.cancelled
+    assert len(chunks) > 1
+    assert handle.text == "".join(chunks)
+    assert '"CAGR"' in handle.text
+    assert server.requests == 2  # tool call, then the answer
+
+    again = ask(pool, cache, "how is the growth portfolio doing")
+    assert list(again) == [handle.text]
+    assert server.requests == 2
+
+
+def test_cancel_stops_stream_and_skips_cache(serve):
+    server, pool = serve(LongAnswer(), token_delay=0.01)
+    cache = ResultCache()
+
+    handle = ask(pool, cache)
+    for _ in handle:
+        handle.cancel()
+
+    assert handle.cancelled and handle.done
+    assert handle.text.startswith("word0")
+    assert len(handle.text.split()) < 200
+    assert not [key for key in cache._entries if key[0] == "answer"]
+
+
+def test_server_error_surfaces_on_handle(serve):
+    server, pool = serve(Failing())
+
+    handle = ask(pool, ResultCache())
+    text = "".join(handle)
+
+    assert handle.error is not None
+    assert text.startswith("⚠️ Error:")
+    assert "model exploded" in text
+
+
+def test_slow_tool_does_not_stall_other_streams(serve):
+    server, pool = serve(StubModel(["Growth"]))
+
+    def slow_tool(name, args):
+        time.sleep(1.5)
+        return "slow result"
+
+    slow = pool.submit(build_messages("How is the Growth portfolio doing?", NAVS), run_tool=slow_tool)
+    time.sleep(0.3)  # the slow stream is inside its tool call now
+    start = time.monotonic()
+    quick = pool.submit(build_messages("Hello", NAVS), run_tool=slow_tool)
+    assert "".join(quick) == "I don't know."
+    assert time.monotonic() - start < 1.0
+    assert "".join(slow) == "slow result"
+
+
+def test_consumer_gives_up_on_a_silent_producer():
+    handle = StreamHandle(idle_timeout=0.2)
+    handle._future = Future()  # never resolves, never queues anything
+
+    chunks = list(handle)
+
+    assert len(chunks) == 1 and chunks[0].startswith("⚠️ Error:")
+    assert isinstance(handle.error, TimeoutError)
+    assert handle.cancelled
+
+
+def test_consumer_stops_when_request_was_cancelled_before_starting():
+    handle = StreamHandle()
+    handle._future = Future()
+    handle._future.cancel()
+
+    assert list(handle) == []
@@ -0,0 +1,40 @@
+# tests/test_db_writer.py
+"""
+Snapshot publishing in utils.db_writer: new tables are readable right after
+their CREATE, and superseded snapshots survive a grace period.
+"""
+
+from utils import db_writer
+from utils.db_writer import DuckDBWriter, reader, snapshot_dir
+
+
+def test_created_table_is_readable_without_a_publishing_write(tmp_path):
+    db = tmp_path / "p.db"
+    writer = DuckDBWriter(db, snapshot_tables=["saved"])
+    writer.execute("CREATE TABLE saved (name TEXT)", publish=False)
+
+    with reader(db) as cur:
+        assert cur.execute("SELECT count(*) FROM saved").fetchone() == (0,)
+
+    # later unpublished writes don't republish it
+    writer.execute("INSERT INTO saved VALUES ('a')", publish=False)
+    with reader(db) as cur:
+        assert cur.execute("SELECT count(*) FROM saved").fetchone() == (0,)
+    writer.execute("INSERT INTO saved VALUES ('b')")
+    with reader(db) as cur:
+        assert cur.execute("SELECT count(*) FROM saved").fetchone() == (2,)
+
+
+def test_superseded_snapshots_are_kept_for_the_grace_period(tmp_path, monkeypatch):
+    db = tmp_path / "p.db"
+    writer = DuckDBWriter(db, snapshot_tables=["saved"])
+    writer.execute("CREATE TABLE saved (name TEXT)")
+    for i in range(5):
+        writer.execute("INSERT INTO saved VALUES (?)", [str(i)])
+    out_dir = snapshot_dir(db) / "saved"
+    assert len(list(out_dir.glob("v*.parquet"))) == 6
+
+    monkeypatch.setattr(db_writer, "SNAPSHOT_GRACE_SECONDS", 0)
+    writer.execute("INSERT INTO saved VALUES ('last')")
+    files = list(out_dir.glob("v*.parquet"))
+    assert [f.name for f in files] == [(out_dir / "CURRENT").read_text()]
@@ -0,0 +1,50 @@
+# tests/test_optimizer.py
+"""
+Max-weight caps in the allocation helpers (utils.optimizer): saved percent
+weights and risk-parity weights stay under the cap.
+"""
+
+import numpy as np
+import pandas as pd
+
+from utils.optimizer import risk_parity, to_percent_weights
+
+
+def test_percent_weights_stay_under_cap_after_dropping_small_weights():
+    # 20 assets at the 5% cap plus dust that is dropped; renormalizing alone
+    # would push the capped weights over 5%
+    rng = np.random.default_rng(3)
+    for _ in range(200):
+        n = int(rng.integers(21, 40))
+        w = np.r_[np.full(20, 0.05), rng.uniform(0, 2e-4, n - 20)]
+        weights = pd.Series(w / w.sum(), index=[f"a{i}" for i in range(n)])
+
+        assets, pct = to_percent_weights(weights, max_weight=0.05)
+
+        assert max(pct) <= 5.0
+        assert round(sum(pct), 6) == 100.0
+        assert len(assets) == len(pct)
+
+
+def test_percent_weights_uncapped_total_exactly_100():
+    assets, pct = to_percent_weights(pd.Series([1 / 3] * 3, index=list("abc")))
+    assert assets == ["a", "b", "c"]
+    assert sorted(pct) == [33.33, 33.33, 33.34]
+
+
+def test_risk_parity_respects_max_weight():
+    rng = np.random.default_rng(0)
+    returns = rng.normal(size=(250, 12)) * rng.uniform(0.2, 3, 12) + rng.normal(size=(250, 1)) * 0.5
+    cov = np.cov(returns.T)
+    free_weights = risk_parity(cov).to_numpy()
+    cap = max(free_weights.max() * 0.7, 1 / len(cov) + 0.01)
+    assert free_weights.max() > cap  # the cap binds
+
+    w = risk_parity(cov, max_weight=cap).to_numpy()
+
+    assert abs(w.sum() - 1) < 1e-9
+    assert w.max() <= cap + 1e-12
+    # assets below the cap still share risk equally
+    free = w < cap - 1e-9
+    contributions = w[free] * (cov @ w)[free]
+    assert contributions.std() / contributions.mean() < 1e-6
@@ -0,0 +1,55 @@
+# tests/test_outliers.py
+"""
+The precomputed outlier artifact (utils.precompute) and the on-demand
+detector (utils.data_cleaner.detect_outliers) must flag the same rows,
+including for assets with missing closes.
+"""
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils import precompute
+from utils.data_cleaner import detect_outliers
+
+
+def price_table():
+    rng = np.random.default_rng(7)
+    dates = pd.bdate_range("2020-01-01", periods=400)
+    frames = []
+    for asset in ("A", "B", "C"):
+        close = 100 + rng.normal(0, 1, len(dates)).cumsum() * 0.1
+        close[200] *= 3  # one spike per asset
+        frames.append(pd.DataFrame({"asset_id": asset, "date": dates, "close": close}))
+    df = pd.concat(frames, ignore_index=True)
+    # B has NULL closes, C has NaN closes (not NULL) in the Parquet file
+    null_rows = (df["asset_id"] == "B") & (df.index % 7 == 0)
+    nan_rows = (df["asset_id"] == "C") & (df.index % 9 == 0)
+    close = df["close"].to_numpy().copy()
+    close[nan_rows.to_numpy()] = np.nan
+    mask = null_rows.to_numpy()
+    return pa.table({
+        "asset_id": pa.array(df["asset_id"]),
+        "date": pa.array(df["date"]),
+        "close": pa.array(close, mask=mask, from_pandas=False),
+    })
+
+
+def test_sql_and_python_outliers_agree_with_missing_closes(tmp_path, monkeypatch):
+    table = price_table()
+    price_path = tmp_path / "price_data.parquet"
+    pq.write_table(table, price_path)
+    monkeypatch.setattr(precompute, "PRICE_PATH", price_path)
+
+    out = tmp_path / "outliers.parquet"
+    precompute._build_outliers(out)
+    sql = pd.read_parquet(out)
+    python = detect_outliers(pd.read_parquet(price_path), z_threshold=precompute.OUTLIER_Z)
+
+    assert sorted(sql["asset_id"].unique()) == ["A", "B", "C"]
+    key = ["asset_id", "date"]
+    sql = sql.sort_values(key).reset_index(drop=True)
+    python = python.sort_values(key).reset_index(drop=True)
+    pd.testing.assert_frame_equal(sql[key], python[key], check_dtype=False)
+    np.testing.assert_allclose(sql["z_score"], python["z_score"])
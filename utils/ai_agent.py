@@ -1,33 +1,281 @@
 # utils/ai_agent.py
 
-import os
-import openai
+import re
+import json
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+from openai import OpenAI
 from utils.agent_tools import get_portfolio_list, get_portfolio_metrics, compare_two_portfolios, describe_asset
+from utils.screener_query import METADATA_PATH
 
-openai.api_key = os.getenv("OPENAI_API_KEY")  # Or set manually here
+# The OpenAI clients read OPENAI_API_KEY (and OPENAI_BASE_URL, e.g. a local mock server) from the environment
+DEFAULT_MODEL = "gpt-3.5-turbo"
 
 SYSTEM_PROMPT = """
 You are a financial portfolio assistant. You have access to portfolio NAVs, asset metadata, and price data. Answer questions clearly and concisely. If you don't know something, say so.
+Use the provided tools to look up portfolio metrics and asset details instead of guessing numbers.
 """
 
-def get_ai_response(prompt, metadata, price_data, navs):
+MAX_TOOL_STEPS = 5
+
+# ----------- Tools -----------
+
+TOOL_SPECS = [
+    {
+        "name": "get_portfolio_list",
+        "description": "List the names of all portfolios with NAV data.",
+        "parameters": {"type": "object", "properties": {}},
+    },
+    {
+        "name": "get_portfolio_metrics",
+        "description": "CAGR, max drawdown, volatility and Sharpe ratio of one portfolio.",
+        "parameters": {
+            "type": "object",
+            "properties": {"portfolio": {"type": "string", "description": "Portfolio name"}},
+            "required": ["portfolio"],
+        },
+    },
+    {
+        "name": "compare_two_portfolios",
+        "description": "Side-by-side metrics for two portfolios.",
+        "parameters": {
+            "type": "object",
+            "properties": {"p1": {"type": "string"}, "p2": {"type": "string"}},
+            "required": ["p1", "p2"],
+        },
+    },
+    {
+        "name": "describe_asset",
+        "description": "Name, exchange, type, category, currency and description of an asset.",
+        "parameters": {
+            "type": "object",
+            "properties": {"asset_id": {"type": "string"}},
+            "required": ["asset_id"],
+        },
+    },
+]
+
+
+def openai_tools(specs=TOOL_SPECS):
+    return [{"type": "function", "function": spec} for spec in specs]
+
+
+def _run_tool(name, args, metadata, navs):
+    """Executes one tool locally and returns its result as text for the model."""
+    if name == "get_portfolio_list":
+        return json.dumps(get_portfolio_list(navs))
+    if name == "get_portfolio_metrics":
+        portfolio = args.get("portfolio")
+        if navs.empty or portfolio not in navs.columns:
+            return f"Unknown portfolio '{portfolio}'."
+        return json.dumps(get_portfolio_metrics(navs[portfolio].dropna()))
+    if name == "compare_two_portfolios":
+        missing = [p for p in (args.get("p1"), args.get("p2")) if navs.empty or p not in navs.columns]
+        if missing:
+            return f"Unknown portfolio(s): {missing}."
+        return compare_two_portfolios(navs, args["p1"], args["p2"]).to_json()
+    if name == "describe_asset":
+        if metadata is None or metadata.empty:
+            return "Asset metadata is not loaded."
+        return describe_asset(args.get("asset_id"), metadata)
+    return f"Unknown tool '{name}'."
+
+
+# ----------- Models -----------
+
+class OpenAIChatModel:
+    """
+    Chat model backed by the OpenAI API (tool calling).
+
+    A model is any callable (messages, tools) -> message dict with
+    'content' and optional 'tool_calls' [{'id', 'name', 'arguments'}].
+    """
+
+    def __init__(self, model=DEFAULT_MODEL, timeout=30.0):
+        self.model = model
+        self.client = OpenAI(timeout=timeout)
+        self.cache_key = f"openai:{model}"
+
+    def __call__(self, messages, tools):
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            tools=openai_tools(tools),
+        )
+        message = response.choices[0].message
+        return {
+            "content": message.content,
+            "tool_calls": [{"id": call.id, "name": call.function.name,
+                            "arguments": json.loads(call.function.arguments or "{}")}
+                           for call in message.tool_calls or []],
+        }
+
+
+class StubModel:
+    """
+    Offline, deterministic model for tests and local use without network.
+
+    It picks tools by keyword matching against the known portfolio and asset
+    names in the question, then answers by echoing the tool results.
+    """
+
+    cache_key = "stub"
+
+    def __init__(self, portfolio_names=(), asset_ids=()):
+        self.portfolio_names = list(portfolio_names)
+        self.asset_ids = list(asset_ids)
+        self.calls = 0
+
+    def __call__(self, messages, tools):
+        self.calls += 1
+        results = [m for m in messages if m["role"] == "tool"]
+        if results:
+            return {"content": "\n\n".join(m["content"] for m in results), "tool_calls": []}
+
+        question = messages[-1]["content"].lower()
+        portfolios = [p for p in self.portfolio_names if p.lower() in question]
+        assets = [a for a in self.asset_ids if a.lower() in question]
+
+        if len(portfolios) >= 2:
+            calls = [("compare_two_portfolios", {"p1": portfolios[0], "p2": portfolios[1]})]
+        elif portfolios:
+            calls = [("get_portfolio_metrics", {"portfolio": portfolios[0]})]
+        elif assets:
+            calls = [("describe_asset", {"asset_id": a}) for a in assets]
+        elif "portfolio" in question:
+            calls = [("get_portfolio_list", {})]
+        else:
+            return {"content": "I don't know.", "tool_calls": []}
+        return {"content": None,
+                "tool_calls": [{"id": f"call_{i}", "name": n, "arguments": a} for i, (n, a) in enumerate(calls)]}
+
+
+# ----------- Result Cache -----------
+
+def normalize_question(question):
+    return re.sub(r"\s+", " ", question.strip().lower()).rstrip("?!. ")
+
+
+def data_version(price_data, nav_version=None):
+    """
+    Version of the data the tools read: the price source's version, the
+    metadata file's mtime and the caller's NAV version (e.g. the NAV file's
+    mtime). Cached results are only valid for this version.
+    """
+    price_version = price_data.version() if price_data is not None else None
+    metadata_version = METADATA_PATH.stat().st_mtime_ns if METADATA_PATH.exists() else None
+    return price_version, metadata_version, nav_version
+
+
+def model_key(model=None):
+    """Identity of a model in answer keys; None is the default OpenAI model."""
+    if model is None:
+        return f"openai:{DEFAULT_MODEL}"
+    return getattr(model, "cache_key", None) or type(model).__name__
+
+
+class ResultCache:
+    """
+    Thread-safe LRU memo for tool results and final answers, keyed by data
+    version (and, for answers, by the model that gave them).
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+default_cache = ResultCache()
+
+
+# ----------- Agent Loop -----------
+
+def build_messages(prompt, navs):
     portfolio_list = get_portfolio_list(navs)
-    full_prompt = SYSTEM_PROMPT + f"""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT + f"\nPortfolio List: {portfolio_list}"},
+        {"role": "user", "content": prompt},
+    ]
 
-Portfolio List: {portfolio_list}
-User Question: {prompt}
-"""
+
+def assistant_tool_message(content, tool_calls):
+    return {
+        "role": "assistant",
+        "content": content,
+        "tool_calls": [{"id": call["id"], "type": "function",
+                        "function": {"name": call["name"], "arguments": json.dumps(call["arguments"])}}
+                       for call in tool_calls],
+    }
+
+
+def run_tool_cached(name, args, metadata, navs, cache, version):
+    tool_key = ("tool", name, json.dumps(args, sort_keys=True), version)
+    result = cache.get(tool_key)
+    if result is None:
+        result = _run_tool(name, args, metadata, navs)
+        cache.put(tool_key, result)
+    return result
+
+
+def get_ai_response(prompt, metadata, price_data, navs, model=None, cache=None, nav_version=None):
+    """
+    Answers a question with a tool-dispatch loop: the model may request the
+    tools in TOOL_SPECS, which run locally against the given data, until it
+    returns a final answer (at most MAX_TOOL_STEPS rounds).
+
+    Tool results and answers are memoized per data version (see data_version;
+    pass the NAV file's version as nav_version), and answers also per model,
+    so a repeated question costs neither an LLM round trip nor recomputation.
+    """
+    navs = navs if navs is not None else pd.DataFrame()
+    cache = cache if cache is not None else default_cache
+    version = data_version(price_data, nav_version)
+
+    answer_key = ("answer", normalize_question(prompt), model_key(model), version)
+    cached = cache.get(answer_key)
+    if cached is not None:
+        return cached
+
+    messages = build_messages(prompt, navs)
 
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": full_prompt}
-            ]
-        )
-        return response.choices[0].message['content']
+        model = model or OpenAIChatModel()
+        for _ in range(MAX_TOOL_STEPS):
+            reply = model(messages, TOOL_SPECS)
+            if not reply.get("tool_calls"):
+                answer = reply.get("content") or ""
+                cache.put(answer_key, answer)
+                return answer
+
+            messages.append(assistant_tool_message(reply.get("content"), reply["tool_calls"]))
+            for call in reply["tool_calls"]:
+                result = run_tool_cached(call["name"], call["arguments"], metadata, navs, cache, version)
+                messages.append({"role": "tool", "tool_call_id": call["id"], "content": result})
+        return "⚠️ Error: too many tool calls without an answer."
     except Exception as e:
         return f"⚠️ Error: {str(e)}"
-
-# Optionally extend this to LangChain if more tool calling is needed
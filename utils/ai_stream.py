@@ -0,0 +1,226 @@
+# utils/ai_stream.py
+
+import os
+import json
+import queue
+import time
+import asyncio
+import threading
+
+import pandas as pd
+from openai import AsyncOpenAI
+from utils.ai_agent import (
+    DEFAULT_MODEL, MAX_TOOL_STEPS, TOOL_SPECS, default_cache, openai_tools,
+    build_messages, assistant_tool_message, run_tool_cached, normalize_question, data_version, model_key
+)
+
+MAX_CONCURRENT_REQUESTS = int(os.getenv("AI_MAX_CONCURRENT_REQUESTS", "4"))
+REQUEST_TIMEOUT = float(os.getenv("AI_REQUEST_TIMEOUT", "30"))
+# longest a consumer waits for the next chunk (a queued request or a slow tool counts) before giving up
+STREAM_IDLE_TIMEOUT = float(os.getenv("AI_STREAM_IDLE_TIMEOUT", "120"))
+POLL_SECONDS = 0.5
+
+_DONE = object()
+
+
+class StreamHandle:
+    """
+    Consumer side of one streamed answer. Iterating yields text chunks as they
+    arrive from the event loop thread; `text` accumulates what was yielded.
+    If nothing arrives for idle_timeout seconds the request is cancelled and
+    iteration ends with an error chunk, so a dead producer cannot hang a rerun.
+    """
+
+    def __init__(self, idle_timeout=STREAM_IDLE_TIMEOUT):
+        self._queue = queue.Queue()
+        self._future = None
+        self.idle_timeout = idle_timeout
+        self.text = ""
+        self.error = None
+        self.cancelled = False
+
+    @classmethod
+    def completed(cls, text):
+        handle = cls()
+        handle._queue.put(text)
+        handle._queue.put(_DONE)
+        return handle
+
+    def __iter__(self):
+        idle_since = time.monotonic()
+        while True:
+            try:
+                chunk = self._queue.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                if self._future is not None and self._future.done() and self._queue.empty():
+                    return  # cancelled before it started: nothing will be queued
+                if time.monotonic() - idle_since < self.idle_timeout:
+                    continue
+                self.cancel()
+                self.error = TimeoutError(f"no response for {self.idle_timeout:g}s")
+                chunk = f"⚠️ Error: {self.error}"
+                self.text += chunk
+                yield chunk
+                return
+            if chunk is _DONE:
+                return
+            idle_since = time.monotonic()
+            self.text += chunk
+            yield chunk
+
+    @property
+    def done(self):
+        return self._future is None or self._future.done()
+
+    def cancel(self):
+        """Stops the request; the iterator ends after the chunks already received."""
+        self.cancelled = True
+        if self._future is not None and not self._future.done():
+            self._future.cancel()
+
+
+class StreamingPool:
+    """
+    Process-wide pool for streamed chat completions.
+
+    A single background thread runs an asyncio loop with one AsyncOpenAI
+    client; a semaphore bounds how many requests are in flight across all
+    sessions, so a slow answer holds one slot, not a Streamlit script thread.
+    Tools the model calls run on worker threads, off the loop.
+    """
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_REQUESTS, timeout=REQUEST_TIMEOUT,
+                 model=DEFAULT_MODEL, base_url=None):
+        self.model = model
+        self.timeout = timeout
+        self.base_url = base_url
+        self.cache_key = f"openai:{model}" + (f"@{base_url}" if base_url else "")
+        self._client = None
+        self._loop = asyncio.new_event_loop()
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._thread = threading.Thread(target=self._loop.run_forever, name="ai-stream-pool", daemon=True)
+        self._thread.start()
+
+    def _get_client(self):
+        # Created lazily on the loop thread so it binds to this loop
+        if self._client is None:
+            self._client = AsyncOpenAI(timeout=self.timeout, base_url=self.base_url, max_retries=1)
+        return self._client
+
+    def submit(self, messages, run_tool, on_answer=None):
+        """
+        Starts streaming a completion for `messages`.
+
+        Tool calls requested by the model are executed with run_tool(name, args)
+        and the conversation continues until a plain answer is streamed.
+        on_answer(text) is called with the full answer when it completes.
+        """
+        handle = StreamHandle()
+        handle._future = asyncio.run_coroutine_threadsafe(
+            self._run(list(messages), run_tool, on_answer, handle), self._loop
+        )
+        return handle
+
+    async def _run(self, messages, run_tool, on_answer, handle):
+        try:
+            async with self._semaphore:
+                client = self._get_client()
+                for _ in range(MAX_TOOL_STEPS):
+                    content, calls = await self._stream_once(client, messages, handle)
+                    if not calls:
+                        if on_answer is not None:
+                            on_answer(content)
+                        return
+                    messages.append(assistant_tool_message(content or None, calls))
+                    for call in calls:
+                        # off the loop thread: a slow tool must not stall the other streams
+                        result = await asyncio.to_thread(run_tool, call["name"], call["arguments"])
+                        messages.append({"role": "tool", "tool_call_id": call["id"], "content": result})
+                handle._queue.put("⚠️ Error: too many tool calls without an answer.")
+        except asyncio.CancelledError:
+            handle.cancelled = True
+            raise
+        except Exception as e:
+            handle.error = e
+            handle._queue.put(f"⚠️ Error: {str(e)}")
+        finally:
+            handle._queue.put(_DONE)
+
+    async def _stream_once(self, client, messages, handle):
+        stream = await client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            tools=openai_tools(TOOL_SPECS),
+            stream=True,
+        )
+        content, calls = [], {}
+        # closing the stream releases the connection when the request is cancelled
+        async with stream:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    content.append(delta.content)
+                    handle._queue.put(delta.content)
+                for tc in delta.tool_calls or []:
+                    call = calls.setdefault(tc.index, {"id": None, "name": "", "arguments": ""})
+                    if tc.id:
+                        call["id"] = tc.id
+                    if tc.function and tc.function.name:
+                        call["name"] += tc.function.name
+                    if tc.function and tc.function.arguments:
+                        call["arguments"] += tc.function.arguments
+        parsed = [{"id": c["id"], "name": c["name"], "arguments": json.loads(c["arguments"] or "{}")}
+                  for _, c in sorted(calls.items())]
+        return "".join(content), parsed
+
+    def shutdown(self):
+        """Cancels requests still in flight, then stops the loop thread."""
+        async def drain():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._loop.shutdown_asyncgens()
+
+        try:
+            asyncio.run_coroutine_threadsafe(drain(), self._loop).result(timeout=5)
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+
+
+_default_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_streaming_pool():
+    global _default_pool
+    with _pool_lock:
+        if _default_pool is None:
+            _default_pool = StreamingPool()
+        return _default_pool
+
+
+def stream_ai_response(prompt, metadata, price_data, navs, pool=None, cache=None, nav_version=None):
+    """
+    Streaming counterpart of get_ai_response. Returns a StreamHandle right away;
+    cached answers come back as an already-completed handle.
+    """
+    navs = navs if navs is not None else pd.DataFrame()
+    cache = cache if cache is not None else default_cache
+    version = data_version(price_data, nav_version)
+
+    # model_key(None) is the default pool's model, so a hit never starts the pool
+    answer_key = ("answer", normalize_question(prompt), model_key(pool), version)
+    cached = cache.get(answer_key)
+    if cached is not None:
+        return StreamHandle.completed(cached)
+
+    pool = pool or get_streaming_pool()
+    return pool.submit(
+        build_messages(prompt, navs),
+        run_tool=lambda name, args: run_tool_cached(name, args, metadata, navs, cache, version),
+        on_answer=lambda answer: cache.put(answer_key, answer),
+    )
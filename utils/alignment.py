@@ -0,0 +1,192 @@
+# utils/alignment.py
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from utils.arrow_io import asset_codes, column_numpy, datetime_values
+from utils.tracing import traced, current_span
+
+ALIGN_MODES = ("ffill", "asof", "intersection")
+
+_INDEX_CACHE = OrderedDict()
+_INDEX_CACHE_SIZE = 32
+
+
+class AlignmentIndex:
+    """
+    Master date index for a long-format price frame (one row per asset/date).
+
+    - dates: sorted union of every observation date (datetime64[ns])
+    - assets: asset ids, in column order
+    - row_pos / col_pos: position of each input row in `dates` / `assets`
+
+    Once built, turning any value column into a wide panel is a scatter into a
+    preallocated matrix, and every alignment mode is an index lookup on it.
+    """
+
+    def __init__(self, dates, assets, row_pos, col_pos):
+        self.dates = dates
+        self.assets = assets
+        self.row_pos = row_pos
+        self.col_pos = col_pos
+        self.asset_pos = {a: i for i, a in enumerate(assets)}
+
+    def __len__(self):
+        return len(self.dates)
+
+    def matrix(self, values):
+        """Scatter a per-row value array into a (dates x assets) float matrix."""
+        values = np.asarray(values, dtype="float64")
+        if len(values) != len(self.row_pos):
+            raise ValueError("values do not match the frame this index was built from")
+        out = np.full((len(self.dates), len(self.assets)), np.nan)
+        out[self.row_pos, self.col_pos] = values
+        return out
+
+    def presence(self):
+        """Boolean (dates x assets) matrix of dates on which each asset has a row."""
+        out = np.zeros((len(self.dates), len(self.assets)), dtype=bool)
+        out[self.row_pos, self.col_pos] = True
+        return out
+
+    def columns_for(self, asset_list):
+        """Column positions for asset_list, -1 for assets not in the index."""
+        return np.array([self.asset_pos.get(a, -1) for a in asset_list], dtype="int64")
+
+
+def _last_valid_positions(matrix):
+    """
+    For each cell, the row of the most recent non-NaN value at or above it
+    in the same column (-1 if there is none yet).
+    """
+    rows = np.arange(matrix.shape[0])[:, None]
+    pos = np.where(~np.isnan(matrix), rows, -1)
+    np.maximum.accumulate(pos, axis=0, out=pos)
+    return pos
+
+
+def _gather(matrix, pos):
+    out = np.take_along_axis(matrix, np.maximum(pos, 0), axis=0)
+    out[pos < 0] = np.nan
+    return out
+
+
+def _fingerprint(dates, assets, col_pos):
+    # exact digest of the (date, asset) arrays: any difference in content or
+    # row order is a different key (a checksum of sums could collide)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.ascontiguousarray(dates).view("int64").data)
+    digest.update(np.ascontiguousarray(col_pos, dtype="int64").data)
+    return (len(dates), tuple(assets), digest.hexdigest())
+
+
+def get_alignment_index(price_df, date_col="date", asset_col="asset_id"):
+    """
+    Returns the AlignmentIndex for price_df, building it on first use.
+
+    Indexes are cached by a digest of the frame's date and asset columns, so
+    re-aligning the same panel (e.g. another value column, another mode) skips
+    the sort/factorize step entirely.
+    """
+    dates = datetime_values(price_df, date_col)
+    col_pos, assets = asset_codes(price_df, asset_col)
+    assets = list(assets)
+
+    key = _fingerprint(dates, assets, col_pos) if len(dates) else None
+    if key is not None and key in _INDEX_CACHE:
+        _INDEX_CACHE.move_to_end(key)
+        current_span().set(index_cache_hit=True)
+        return _INDEX_CACHE[key]
+    current_span().set(index_cache_hit=False)
+
+    master, row_pos = np.unique(dates, return_inverse=True)
+    index = AlignmentIndex(master, assets, row_pos.reshape(-1), col_pos)
+
+    if key is not None:
+        _INDEX_CACHE[key] = index
+        if len(_INDEX_CACHE) > _INDEX_CACHE_SIZE:
+            _INDEX_CACHE.popitem(last=False)
+    return index
+
+
+def clear_alignment_cache():
+    _INDEX_CACHE.clear()
+
+
+@traced()
+def align_prices(price_df, asset_list=None, values="close", how="ffill", limit=None,
+                 calendar=None, tolerance=None, dropna=True):
+    """
+    Pivots a long price frame into a date x asset panel.
+
+    Parameters:
+    - price_df: DataFrame or Arrow table with 'asset_id', 'date' and the
+      values column (any layout, see utils.compact / utils.arrow_io)
+    - asset_list: assets to return, in column order (default: all, sorted)
+    - values: column to pivot (default 'close')
+    - how:
+        'ffill'        -> union of dates, forward-filled up to `limit` rows
+        'asof'         -> last observation at or before each `calendar` date,
+                          no older than `tolerance` (a Timedelta or days)
+        'intersection' -> only dates on which every asset has a row
+    - calendar: target dates for 'asof', or an asset id whose dates to use
+      (default: the union of dates)
+    - dropna: drop rows where any asset is still missing
+
+    Returns:
+    - DataFrame indexed by date with one column per asset
+    """
+    if how not in ALIGN_MODES:
+        raise ValueError(f"Unknown alignment mode '{how}', expected one of {ALIGN_MODES}")
+
+    index = get_alignment_index(price_df)
+    if asset_list is None:
+        asset_list = index.assets
+    cols = index.columns_for(asset_list)
+    known = cols >= 0
+
+    raw = index.matrix(column_numpy(price_df, values))
+    panel = np.full((len(index), len(cols)), np.nan)
+    panel[:, known] = raw[:, cols[known]]
+    dates = index.dates
+
+    if how == "intersection":
+        present = np.zeros_like(panel, dtype=bool)
+        present[:, known] = index.presence()[:, cols[known]]
+        keep = present.all(axis=1)
+        panel, dates = panel[keep], dates[keep]
+
+    elif how == "ffill":
+        pos = _last_valid_positions(panel)
+        filled = _gather(panel, pos)
+        if limit is not None:
+            filled[np.arange(len(dates))[:, None] - pos > limit] = np.nan
+        panel = filled
+
+    else:  # asof
+        if calendar is None:
+            target = dates
+        elif isinstance(calendar, str):
+            cal_col = index.asset_pos.get(calendar)
+            if cal_col is None:
+                raise ValueError(f"Calendar asset '{calendar}' not found in price data")
+            target = dates[index.presence()[:, cal_col]]
+        else:
+            target = pd.to_datetime(pd.Index(calendar)).to_numpy(dtype="datetime64[ns]")
+
+        pos = _last_valid_positions(panel)
+        at = np.searchsorted(dates, target, side="right") - 1
+        src = np.where(at[:, None] >= 0, pos[np.maximum(at, 0)], -1)
+        out = _gather(panel, src)
+        if tolerance is not None:
+            if not isinstance(tolerance, pd.Timedelta):
+                tolerance = pd.Timedelta(days=tolerance)
+            age = target[:, None] - dates[np.maximum(src, 0)]
+            out[age > tolerance.to_timedelta64()] = np.nan
+        panel, dates = out, target
+
+    result = pd.DataFrame(panel, index=pd.DatetimeIndex(dates, name="date"),
+                          columns=pd.Index(list(asset_list), name="asset_id"))
+    return result.dropna() if dropna else result
@@ -2,7 +2,9 @@
 
 import numpy as np
 import pandas as pd
+from utils.tracing import traced
 
+@traced()
 def compute_advanced_metrics(nav_series, risk_free_rate=0.01):
     """
     Computes advanced portfolio performance metrics:
@@ -35,6 +37,7 @@ def compute_advanced_metrics(nav_series, risk_free_rate=0.01):
         "Sharpe Ratio": sharpe
     }
 
+@traced()
 def compare_multiple_portfolios(nav_dict, risk_free_rate=0.01):
     """
     Computes advanced metrics for multiple portfolios
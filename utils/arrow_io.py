@@ -0,0 +1,191 @@
+# utils/arrow_io.py
+"""
+Arrow result path from DuckDB into the analytics kernels.
+
+Loaders here return pyarrow Tables (or stream RecordBatches) straight from
+DuckDB, with no pandas object columns in between. Kernels in utils read
+their inputs through the column accessors below, which accept a DataFrame,
+a Table or a RecordBatch and hand back NumPy views (zero-copy for numeric
+and timestamp columns without nulls). Conversion to pandas happens only
+where a page renders a result.
+
+Large scans stream: stream_prices() yields batches ordered by asset, and
+iter_asset_chunks() regroups them so each chunk holds complete assets,
+which is what every per-asset kernel needs.
+"""
+
+import duckdb
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from utils.compact import PRICE_COLUMNS, PRICE_PATH, as_datetime, price_query
+from utils.tracing import traced
+
+DEFAULT_BATCH_ROWS = 256_000
+
+
+# ----------- DuckDB -> Arrow -----------
+
+def fetch_table(result):
+    # to_arrow_table() replaced fetch_arrow_table() in newer DuckDB releases
+    fetch = getattr(result, "to_arrow_table", None) or result.fetch_arrow_table
+    return fetch()
+
+
+def fetch_reader(result, batch_rows):
+    fetch = getattr(result, "to_arrow_reader", None) or result.fetch_record_batch
+    return fetch(batch_rows)
+
+
+def query_arrow(query, params=None):
+    """Runs query on a private connection and returns a pyarrow Table."""
+    con = duckdb.connect()
+    try:
+        return fetch_table(con.execute(query, params or []))
+    finally:
+        con.close()
+
+
+def stream_query(query, params=None, batch_rows=DEFAULT_BATCH_ROWS):
+    """
+    Yields the result of query as RecordBatches of at most batch_rows rows.
+    The connection stays open until the generator is exhausted or closed.
+    """
+    con = duckdb.connect()
+    try:
+        reader = fetch_reader(con.execute(query, params or []), batch_rows)
+        for batch in reader:
+            yield batch
+    finally:
+        con.close()
+
+
+def encode_assets(table):
+    # dictionary-encoded ids: int32 indices plus one copy of each id string
+    if "asset_id" in table.column_names and not pa.types.is_dictionary(table.schema.field("asset_id").type):
+        i = table.column_names.index("asset_id")
+        table = table.set_column(i, "asset_id", pc.dictionary_encode(table.column(i)))
+    return table
+
+
+@traced()
+def load_price_table(asset_ids=None, start_date=None, end_date=None, columns=PRICE_COLUMNS, price_path=PRICE_PATH):
+    """
+    Projected, filtered price rows as a pyarrow Table ordered by (asset_id, date),
+    asset_id dictionary-encoded. Filters as in utils.compact.price_query.
+    """
+    query, params = price_query(asset_ids, start_date, end_date, columns, price_path)
+    return encode_assets(query_arrow(query, params))
+
+
+def stream_prices(asset_ids=None, start_date=None, end_date=None, columns=PRICE_COLUMNS,
+                  price_path=PRICE_PATH, batch_rows=DEFAULT_BATCH_ROWS):
+    """Same rows as load_price_table, yielded as RecordBatches instead of materialized."""
+    query, params = price_query(asset_ids, start_date, end_date, columns, price_path)
+    return stream_query(query, params, batch_rows)
+
+
+def iter_asset_chunks(batches, asset_col="asset_id"):
+    """
+    Regroups batches sorted by asset_col into Tables that each hold complete
+    assets: the trailing asset of a batch is carried into the next chunk.
+    Slices only; no row data is copied.
+    """
+    carry = []
+    for batch in batches:
+        if batch.num_rows == 0:
+            continue
+        ids = batch.column(batch.schema.get_field_index(asset_col))
+        last = ids[batch.num_rows - 1]
+        cut = int(np.argmax(pc.equal(ids, last).to_numpy(zero_copy_only=False)))
+        if cut == 0:
+            carry.append(batch)
+            continue
+        yield pa.Table.from_batches(carry + [batch.slice(0, cut)])
+        carry = [batch.slice(cut)]
+    if carry:
+        yield pa.Table.from_batches(carry)
+
+
+# ----------- Column Accessors -----------
+
+def is_arrow(data):
+    return isinstance(data, (pa.Table, pa.RecordBatch))
+
+
+def num_rows(data):
+    return data.num_rows if is_arrow(data) else len(data)
+
+
+def _arrow_column(data, name):
+    col = data.column(data.schema.get_field_index(name))
+    if isinstance(col, pa.ChunkedArray):
+        if col.num_chunks == 1:
+            return col.chunk(0)
+        if pa.types.is_dictionary(col.type):
+            # chunks may carry different dictionaries; decode before concatenating
+            col = pa.chunked_array([c.dictionary_decode() for c in col.chunks], col.type.value_type)
+        col = col.combine_chunks()
+    return col
+
+
+def column_numpy(data, name):
+    """
+    NumPy values of one column. Numeric Arrow columns without nulls are
+    zero-copy views; nulls become NaN (floats) as in pandas.
+    """
+    if not is_arrow(data):
+        return data[name].to_numpy()
+    col = _arrow_column(data, name)
+    if pa.types.is_dictionary(col.type):
+        col = col.dictionary_decode()
+    if col.null_count and pa.types.is_integer(col.type):
+        col = col.cast(pa.float64())
+    return col.to_numpy(zero_copy_only=False)
+
+
+def datetime_values(data, name="date"):
+    """datetime64[ns] values of a date column (timestamp, date, or int32 day numbers)."""
+    return as_datetime(column_numpy(data, name))
+
+
+def asset_codes(data, name="asset_id"):
+    """
+    Factorizes the asset column.
+
+    Returns:
+    - codes: int64 position of each row's asset in `assets`
+    - assets: object array of the distinct ids present, sorted
+    """
+    if not is_arrow(data):
+        codes, assets = pd.factorize(data[name], sort=True)
+        return codes.astype("int64"), np.asarray(assets, dtype=object)
+
+    col = _arrow_column(data, name)
+    if not pa.types.is_dictionary(col.type):
+        col = pc.dictionary_encode(col)
+    indices = col.indices.to_numpy(zero_copy_only=False).astype("int64")
+    present, codes = np.unique(indices, return_inverse=True)
+    assets = np.asarray(col.dictionary.to_pylist(), dtype=object)[present]
+    order = np.argsort(assets, kind="stable")
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return rank[codes.reshape(-1)], assets[order]
+
+
+def take_rows(data, mask_or_positions):
+    """Rows of data selected by a boolean mask or integer positions, same container type."""
+    if is_arrow(data):
+        sel = np.asarray(mask_or_positions)
+        if sel.dtype == bool:
+            return data.filter(pa.array(sel))
+        return data.take(pa.array(sel))
+    if np.asarray(mask_or_positions).dtype == bool:
+        return data[np.asarray(mask_or_positions)]
+    return data.iloc[mask_or_positions]
+
+
+def to_pandas(data):
+    """Rendering boundary: Arrow -> pandas (DataFrames pass through)."""
+    return data.to_pandas() if is_arrow(data) else data
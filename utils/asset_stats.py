@@ -0,0 +1,182 @@
+# utils/asset_stats.py
+
+import numpy as np
+import pandas as pd
+import duckdb
+from pathlib import Path
+from utils.arrow_io import asset_codes, column_numpy, datetime_values, iter_asset_chunks, stream_prices
+from utils.tracing import traced
+
+data_folder = Path("data")
+PRICE_PATH = data_folder / "price_data.parquet"
+STATS_PATH = data_folder / "asset_stats.parquet"
+
+RETURN_HORIZONS = {
+    "return_1m": pd.DateOffset(months=1),
+    "return_1y": pd.DateOffset(years=1),
+    "return_5y": pd.DateOffset(years=5),
+    "return_10y": pd.DateOffset(years=10),
+}
+
+STATS_COLUMNS = [
+    "asset_id", "first_date", "last_date", "row_count", "last_close",
+    *RETURN_HORIZONS, "volatility", "max_drawdown", "coverage",
+]
+
+# Day numbers are offset so pre-1970 dates stay positive inside the composite key
+_DAY_OFFSET = 100_000
+_KEY_STRIDE = 1_000_000
+
+
+def _empty_stats():
+    return pd.DataFrame(columns=STATS_COLUMNS)
+
+
+@traced()
+def compute_asset_stats(price_df):
+    """
+    Computes one summary row per asset from a long price frame or Arrow table
+    ('asset_id', 'date', 'close'), fully vectorized across assets:
+    - first/last date, row count, last close
+    - 1M / 1Y / 5Y / 10Y price returns (close vs. last close on or before the horizon start)
+    - annualized volatility of daily returns
+    - max drawdown
+    - coverage: rows / business days between first and last date (capped at 1)
+
+    Returns:
+    - DataFrame with STATS_COLUMNS
+    """
+    codes, assets = asset_codes(price_df)
+    dates = datetime_values(price_df)
+    close = column_numpy(price_df, "close").astype("float64", copy=False)
+    valid = ~np.isnan(close)
+    if not valid.any():
+        return _empty_stats()
+    codes, dates, close = codes[valid], dates[valid], close[valid]
+
+    # Sort by (asset, date); the sort is stable, so the last duplicate row wins
+    order = np.lexsort((dates, codes))
+    codes, dates, close = codes[order], dates[order], close[order]
+    last_of_key = np.r_[(codes[1:] != codes[:-1]) | (dates[1:] != dates[:-1]), True]
+    codes, dates, close = codes[last_of_key], dates[last_of_key], close[last_of_key]
+    present, codes = np.unique(codes, return_inverse=True)
+    codes, assets = codes.reshape(-1), assets[present]
+
+    days = dates.astype("datetime64[D]").astype("int64") + _DAY_OFFSET
+    keys = codes.astype("int64") * _KEY_STRIDE + days
+
+    # Rows are sorted by (asset, date), so group bounds are cumulative counts
+    counts = np.bincount(codes, minlength=len(assets))
+    last_idx = np.cumsum(counts) - 1
+    first_idx = last_idx - counts + 1
+
+    first_date = pd.DatetimeIndex(dates[first_idx])
+    last_date = pd.DatetimeIndex(dates[last_idx])
+    last_close = close[last_idx]
+
+    stats = pd.DataFrame({
+        "asset_id": assets,
+        "first_date": first_date,
+        "last_date": last_date,
+        "row_count": counts,
+        "last_close": last_close,
+    })
+
+    asset_pos = np.arange(len(assets), dtype="int64")
+    for col, offset in RETURN_HORIZONS.items():
+        start = (last_date - offset).to_numpy(dtype="datetime64[D]").astype("int64") + _DAY_OFFSET
+        at = np.searchsorted(keys, asset_pos * _KEY_STRIDE + start, side="right") - 1
+        ok = (at >= first_idx) & (at < last_idx) & (start >= days[first_idx])
+        base = close[np.clip(at, 0, len(close) - 1)]
+        stats[col] = np.where(ok, last_close / base - 1, np.nan)
+
+    grouped_close = pd.Series(close).groupby(codes)
+    returns = grouped_close.pct_change()
+    stats["volatility"] = returns.groupby(codes).std().reindex(asset_pos).to_numpy() * np.sqrt(252)
+    drawdown = close / grouped_close.cummax().to_numpy() - 1
+    stats["max_drawdown"] = pd.Series(drawdown).groupby(codes).min().reindex(asset_pos).to_numpy()
+
+    span = np.busday_count(first_date.to_numpy(dtype="datetime64[D]"),
+                           last_date.to_numpy(dtype="datetime64[D]")) + 1
+    stats["coverage"] = np.minimum(counts / np.maximum(span, 1), 1.0)
+    return stats[STATS_COLUMNS]
+
+
+def load_asset_stats(path=STATS_PATH):
+    path = Path(path)
+    if not path.exists():
+        return _empty_stats()
+    return pd.read_parquet(path)
+
+
+def save_asset_stats(stats, path=STATS_PATH):
+    stats.to_parquet(path, index=False)
+
+
+def build_asset_stats(price_path=PRICE_PATH, stats_path=STATS_PATH):
+    """
+    Full rebuild of the stats table from the price parquet, streamed in
+    batches of complete assets so the whole price table is never resident.
+    """
+    parts = [compute_asset_stats(chunk) for chunk in iter_asset_chunks(stream_prices(price_path=price_path))]
+    parts = [p for p in parts if not p.empty]
+    stats = pd.concat(parts, ignore_index=True) if parts else _empty_stats()
+    save_asset_stats(stats, stats_path)
+    return stats
+
+
+def update_asset_stats(new_rows, replace=False, price_path=PRICE_PATH, stats_path=STATS_PATH):
+    """
+    Incrementally refreshes the stats table after an ingest.
+
+    Only the assets present in new_rows are recomputed; all other rows of the
+    stats table are kept as-is.
+
+    Parameters:
+    - new_rows: DataFrame with 'asset_id', 'date', 'close' of the ingested rows
+    - replace: True if new_rows is the complete history of its assets
+      (otherwise their existing history is read from price_path and merged)
+
+    Returns:
+    - the updated stats DataFrame
+    """
+    if new_rows.empty:
+        return load_asset_stats(stats_path)
+    affected = [str(a) for a in new_rows["asset_id"].dropna().unique()]
+    rows = new_rows[["asset_id", "date", "close"]].assign(date=lambda d: pd.to_datetime(d["date"]))
+
+    if not replace and Path(price_path).exists():
+        history = duckdb.execute(
+            f"SELECT asset_id, date, close FROM '{price_path}' WHERE asset_id IN (SELECT UNNEST(?))",
+            [affected],
+        ).df()
+        history["date"] = pd.to_datetime(history["date"])
+        # New rows win over stored ones for the same (asset, date)
+        rows = pd.concat([history, rows], ignore_index=True)
+
+    return _merge_stats(compute_asset_stats(rows), affected, stats_path)
+
+
+def refresh_asset_stats(assets, batches, stats_path=STATS_PATH):
+    """
+    Recomputes the stats of `assets` from their complete stored history,
+    streamed as batches sorted by asset (e.g. PriceSource.stream(assets,
+    columns=['asset_id', 'date', 'close'])), so only one asset is resident at a time.
+
+    Returns:
+    - the updated stats DataFrame
+    """
+    parts = [compute_asset_stats(chunk) for chunk in iter_asset_chunks(batches)]
+    parts = [p for p in parts if not p.empty]
+    fresh = pd.concat(parts, ignore_index=True) if parts else _empty_stats()
+    return _merge_stats(fresh, [str(a) for a in assets], stats_path)
+
+
+def _merge_stats(fresh, affected, stats_path):
+    # all other rows of the stats table are kept as-is
+    stats = load_asset_stats(stats_path)
+    stats = stats[~stats["asset_id"].isin(affected)]
+    stats = pd.concat([stats, fresh], ignore_index=True) if not stats.empty else fresh
+    stats = stats.sort_values("asset_id").reset_index(drop=True)
+    save_asset_stats(stats, stats_path)
+    return stats
@@ -2,16 +2,37 @@
 
 import pandas as pd
 import numpy as np
+from utils.alignment import align_prices
+from utils.arrow_io import asset_codes, datetime_values, take_rows
+from utils.fx import to_base_currency
+from utils.tracing import traced
 
-def prepare_data(price_df, asset_list, start_date, end_date):
-    filtered = price_df[
-        price_df['asset_id'].isin(asset_list) &
-        price_df['date'].between(start_date, end_date)
-    ]
-    pivot = filtered.pivot(index='date', columns='asset_id', values='close')
-    pivot = pivot.fillna(method='ffill').dropna()
-    return pivot
+@traced()
+def prepare_data(price_df, asset_list, start_date, end_date, how='ffill', limit=None, calendar=None,
+                 base_currency=None, fx_source=None):
+    """
+    Builds the date x asset close panel for a backtest, columns in asset_list order.
+    price_df may be a DataFrame or an Arrow table (see utils.arrow_io).
 
+    how / limit / calendar are passed to utils.alignment.align_prices:
+    'ffill' (default, optionally capped at `limit` rows), 'asof' onto a calendar,
+    or 'intersection' of trading dates.
+
+    base_currency converts every column into that currency (utils.fx), reading
+    FX series from fx_source (default: the app's price source); dates before
+    the first FX quote are dropped. None keeps each asset's own currency.
+    """
+    codes, assets = asset_codes(price_df)
+    dates = datetime_values(price_df)
+    keep = np.isin(assets, list(asset_list))[codes]
+    keep &= (dates >= pd.Timestamp(start_date).to_datetime64()) & (dates <= pd.Timestamp(end_date).to_datetime64())
+    filtered = take_rows(price_df, keep)
+    panel = align_prices(filtered, asset_list, values='close', how=how, limit=limit, calendar=calendar)
+    if base_currency is None:
+        return panel
+    return to_base_currency(panel, base_currency, source=fx_source).dropna()
+
+@traced()
 def compute_portfolio_nav(price_data, weights):
     returns = price_data.pct_change().dropna()
     weight_array = np.array(weights) / 100
@@ -19,6 +40,7 @@ def compute_portfolio_nav(price_data, weights):
     portfolio_nav = (1 + portfolio_returns).cumprod()
     return portfolio_nav
 
+@traced()
 def compute_metrics(nav_series):
     days = (nav_series.index[-1] - nav_series.index[0]).days
     cagr = (nav_series.iloc[-1] ** (1 / (days / 365.25))) - 1
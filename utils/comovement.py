@@ -0,0 +1,151 @@
+# utils/comovement.py
+"""
+Rolling correlation and beta between many asset pairs.
+
+Both statistics come from the same five windowed sums per pair: sum x,
+sum y, sum x^2, sum y^2 and sum xy, plus the count of dates where both
+returns exist. Each sum is a cumulative sum differenced `window` rows apart,
+so a pair costs O(T) whatever the window length. Pairs are processed in
+column blocks to bound memory.
+
+- rolling_comovement(): time-indexed rolling corr / beta for a list of pairs
+  (every pair in a basket, or each asset against one target)
+- latest_matrix(): the N x N matrix over the most recent window, for a heatmap
+
+Windows use pairwise-complete observations; a window with fewer than
+min_periods of them (default: the full window) gives NaN, as pandas'
+rolling(window).corr does.
+"""
+
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+from utils.tracing import traced, current_span
+
+DEFAULT_WINDOW = 60
+# cells (pairs x dates) per block: ~2 MB per working array, so a block stays in cache
+BLOCK_CELLS = 250_000
+
+
+def pair_list(assets, target=None):
+    """Every (a, b) pair of `assets` with a before b, or (a, target) for each other asset."""
+    assets = list(assets)
+    if target is None:
+        return list(combinations(assets, 2))
+    return [(a, target) for a in assets if a != target]
+
+
+def _centered(returns):
+    # correlation and beta are shift-invariant; centering keeps the running sums small
+    x = returns.to_numpy(dtype="float64")
+    with np.errstate(invalid="ignore"):
+        return x - np.nanmean(x, axis=0)
+
+
+def _stats(n, sx, sy, sxx, syy, sxy, min_periods):
+    """corr and beta (of x on y) from windowed sums; NaN where undefined."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = sxy - sx * sy / n
+        vx = sxx - sx * sx / n
+        vy = syy - sy * sy / n
+        # running-sum round-off can leave a flat window slightly non-zero
+        vx[vx <= 1e-12 * sxx] = np.nan
+        vy[vy <= 1e-12 * syy] = np.nan
+        corr = np.clip(cov / np.sqrt(vx * vy), -1.0, 1.0)
+        beta = cov / vy
+    short = n < min_periods
+    corr[short] = np.nan
+    beta[short] = np.nan
+    return corr, beta
+
+
+@traced()
+def rolling_comovement(returns, pairs, window=DEFAULT_WINDOW, min_periods=None):
+    """
+    Rolling correlation and beta for each pair.
+
+    Parameters:
+    - returns: date x asset DataFrame of periodic returns (NaN where missing)
+    - pairs: list of (asset, against) tuples, e.g. from pair_list()
+    - window: rows per window
+    - min_periods: fewest pairwise-complete rows for a value (default: window)
+
+    Returns:
+    - (corr, beta): DataFrames indexed by date with (asset, against) columns;
+      beta is the slope of asset's returns on against's
+    """
+    if window < 2:
+        raise ValueError("window must be at least 2 rows")
+    min_periods = window if min_periods is None else max(int(min_periods), 2)
+    pos = returns.columns.get_indexer([a for pair in pairs for a in pair])
+    if (pos < 0).any():
+        unknown = sorted({a for pair in pairs for a in pair} - set(returns.columns))
+        raise ValueError(f"Assets not in the return panel: {unknown}")
+    left, right = pos[0::2], pos[1::2]
+
+    # asset-major rows, so every pair's series is contiguous
+    x = np.ascontiguousarray(_centered(returns).T)
+    valid = ~np.isnan(x)
+    x[~valid] = 0.0
+
+    t = x.shape[1]
+    w = min(window, t)  # a longer window just covers every row so far
+    block = max(1, BLOCK_CELLS // max(t, 1))
+    c = np.zeros((min(block, len(pairs)), t + 1))
+
+    def windowed(values):
+        # sum over rows (i - window, i] = C[i + 1] - C[i + 1 - window], C with a leading zero
+        p = len(values)
+        np.cumsum(values, axis=1, out=c[:p, 1:])
+        out = np.empty_like(values)
+        out[:, :w] = c[:p, 1:w + 1]
+        np.subtract(c[:p, w + 1:], c[:p, 1:t + 1 - w], out=out[:, w:])
+        return out
+
+    corr = np.empty((len(pairs), t))
+    beta = np.empty((len(pairs), t))
+    for lo in range(0, len(pairs), block):
+        i, j = left[lo:lo + block], right[lo:lo + block]
+        both = valid[i] & valid[j]
+        a = x[i] * both
+        b = x[j] * both
+        corr[lo:lo + block], beta[lo:lo + block] = _stats(
+            windowed(both.astype("float64")), windowed(a), windowed(b),
+            windowed(a * a), windowed(b * b), windowed(a * b), min_periods)
+
+    current_span().set(pairs=len(pairs), rows=t, window=window)
+    columns = pd.MultiIndex.from_tuples([tuple(p) for p in pairs], names=["asset", "against"])
+    return (pd.DataFrame(corr.T, index=returns.index, columns=columns),
+            pd.DataFrame(beta.T, index=returns.index, columns=columns))
+
+
+@traced()
+def latest_matrix(returns, window=DEFAULT_WINDOW, min_periods=None, stat="corr"):
+    """
+    Correlation or beta matrix over the last `window` rows.
+
+    Parameters:
+    - returns: date x asset DataFrame of periodic returns (NaN where missing)
+    - window, min_periods: as in rolling_comovement
+    - stat: 'corr', or 'beta' (row asset regressed on column asset)
+
+    Returns:
+    - asset x asset DataFrame
+    """
+    if stat not in ("corr", "beta"):
+        raise ValueError(f"Unknown stat '{stat}', expected 'corr' or 'beta'")
+    min_periods = window if min_periods is None else max(int(min_periods), 2)
+    x = _centered(returns.iloc[-window:])
+    valid = (~np.isnan(x)).astype("float64")
+    x0 = np.nan_to_num(x)
+    # pairwise-complete sums for every pair at once: entry (i, j) sums over
+    # the rows where both i and j are present
+    n = valid.T @ valid
+    sx = x0.T @ valid
+    sxx = (x0 * x0).T @ valid
+    sxy = x0.T @ x0
+    corr, beta = _stats(n, sx, sx.T, sxx, sxx.T, sxy, min_periods)
+    out = corr if stat == "corr" else beta
+    np.fill_diagonal(out, np.where(np.diag(n) >= min_periods, 1.0, np.nan))
+    return pd.DataFrame(out, index=returns.columns, columns=returns.columns)
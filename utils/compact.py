@@ -0,0 +1,76 @@
+# utils/compact.py
+"""
+Projection and date helpers for reading price_data.parquet.
+
+Price rows are loaded as Arrow tables (utils.arrow_io), which keep asset_id
+dictionary-encoded and read only the projected columns:
+
+- PRICE_COLUMNS: the default projection
+- price_filters() / price_query(): the filtered, projected SQL the loaders run
+- as_datetime(): datetime64[ns] values of a date column, whether it holds
+  timestamps, dates or int32 day numbers since 1970-01-01
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+data_folder = Path("data")
+PRICE_PATH = data_folder / "price_data.parquet"
+
+PRICE_COLUMNS = ("asset_id", "date", "close")
+
+
+# ----------- Dates -----------
+
+def from_day_numbers(days):
+    """int32 day numbers -> datetime64[ns] array."""
+    return np.asarray(days, dtype="int64").astype("datetime64[D]").astype("datetime64[ns]")
+
+
+def as_datetime(dates):
+    """datetime64[ns] values of a date column (timestamps, dates or day numbers); a Series keeps its index."""
+    if isinstance(dates, pd.Series):
+        if pd.api.types.is_integer_dtype(dates.dtype):
+            return pd.Series(from_day_numbers(dates.to_numpy()), index=dates.index, name=dates.name)
+        return pd.to_datetime(dates)
+    values = np.asarray(dates)
+    if np.issubdtype(values.dtype, np.integer):
+        return from_day_numbers(values)
+    return pd.to_datetime(values).to_numpy(dtype="datetime64[ns]")
+
+
+# ----------- Query -----------
+
+def price_filters(asset_ids=None, start_date=None, end_date=None):
+    """WHERE conditions and parameters for an asset list and inclusive date bounds."""
+    where, params = [], []
+    if asset_ids is not None:
+        where.append("asset_id IN (SELECT UNNEST(?))")
+        params.append(list(asset_ids))
+    if start_date is not None:
+        where.append("date >= ?")
+        params.append(pd.Timestamp(start_date))
+    if end_date is not None:
+        where.append("date <= ?")
+        params.append(pd.Timestamp(end_date))
+    return where, params
+
+
+def price_query(asset_ids=None, start_date=None, end_date=None, columns=PRICE_COLUMNS, price_path=PRICE_PATH):
+    """
+    SQL and parameters reading `columns` of price_data.parquet, filtered in
+    DuckDB and ordered by (asset_id, date).
+
+    Parameters:
+    - asset_ids: assets to load (default: all)
+    - start_date / end_date: inclusive date bounds (optional)
+    - columns: projection (default PRICE_COLUMNS)
+    """
+    where, params = price_filters(asset_ids, start_date, end_date)
+    query = f"SELECT {', '.join(columns)} FROM '{price_path}'"
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    query += " ORDER BY asset_id, date"
+    return query, params
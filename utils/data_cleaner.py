@@ -1,26 +1,45 @@
 # utils/data_cleaner.py
 
+import numpy as np
 import pandas as pd
-from scipy.stats import zscore
+from utils.arrow_io import asset_codes, column_numpy, datetime_values, take_rows, to_pandas
+from utils.tracing import traced
 
+@traced()
 def detect_missing_data(df, max_gap_days=6):
     """
     Detect assets with gaps in trading data greater than max_gap_days.
+    Accepts a DataFrame or an Arrow table.
     Returns list of asset_ids with such gaps.
     """
-    missing_assets = []
-    for asset_id, group in df.groupby("asset_id"):
-        sorted_dates = group['date'].sort_values()
-        gaps = sorted_dates.diff().dt.days.fillna(1)
-        if (gaps > max_gap_days).any():
-            missing_assets.append(asset_id)
-    return missing_assets
+    codes, assets = asset_codes(df)
+    days = datetime_values(df).astype("datetime64[D]").astype("int64")
+    order = np.lexsort((days, codes))
+    codes, days = codes[order], days[order]
+    same_asset = codes[1:] == codes[:-1]
+    gapped = np.unique(codes[1:][same_asset & (np.diff(days) > max_gap_days)])
+    return [str(a) for a in assets[gapped]]
 
+@traced()
 def detect_outliers(df, z_threshold=5):
     """
     Detect price outliers based on Z-score of 'close' within each asset group.
+    Accepts a DataFrame or an Arrow table.
     Returns DataFrame of outlier rows with a 'z_score' column.
     """
-    df = df.copy()
-    df['z_score'] = df.groupby('asset_id')['close'].transform(zscore)
-    return df[abs(df['z_score']) > z_threshold]
+    codes, assets = asset_codes(df)
+    close = column_numpy(df, "close").astype("float64", copy=False)
+    # population z-score per asset over its non-missing closes, like AVG and
+    # STDDEV_POP in utils.precompute; rows with a missing close are never flagged
+    valid = ~np.isnan(close)
+    counts = np.bincount(codes, weights=valid, minlength=len(assets))
+    mean = np.bincount(codes, weights=np.where(valid, close, 0.0), minlength=len(assets)) / np.maximum(counts, 1)
+    dev = close - mean[codes]
+    sq = np.where(valid, dev * dev, 0.0)
+    std = np.sqrt(np.bincount(codes, weights=sq, minlength=len(assets)) / np.maximum(counts, 1))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = dev / std[codes]
+    hits = np.flatnonzero(np.abs(z) > z_threshold)
+    out = to_pandas(take_rows(df, hits)).copy()
+    out['z_score'] = z[hits]
+    return out
@@ -0,0 +1,276 @@
+# utils/data_source.py
+"""
+One interface over every place price rows live.
+
+- ParquetSource:      data/price_data.parquet (or a directory of Parquet files)
+- CsvDirectorySource: per-asset CSV files named asset_<asset_id>.csv
+- DuckDBSource:       a table in a DuckDB file, e.g. what Import_Tool writes
+- CompositeSource:    several of the above as one; each asset is served by
+                      the first source that has it
+
+Every backend runs in DuckDB, so asset and date predicates and the column
+projection are pushed into the scan (Parquet row-group pruning, per-asset
+CSV file pruning, DuckDB table filters) instead of reading whole files into
+pandas. Results come back as Arrow tables or RecordBatch streams with the
+same schema from every backend (see utils.arrow_io).
+
+Pages use price_source(), the default composite of all three, so imported
+data is visible everywhere; version() keys st.cache_data loaders.
+"""
+
+import abc
+from itertools import chain
+from pathlib import Path
+
+import pyarrow as pa
+from utils.arrow_io import DEFAULT_BATCH_ROWS, encode_assets, query_arrow, stream_query
+from utils.compact import PRICE_COLUMNS, price_filters
+from utils.db_writer import snapshot_path
+
+DATA_DIR = Path("data")
+PRICE_PATH = DATA_DIR / "price_data.parquet"
+IMPORT_DB_PATH = Path("portfolio_data.duckdb")
+
+# Arrow type of every price column, whatever the backend stores
+PRICE_TYPES = {
+    "asset_id": pa.string(),
+    "date": pa.timestamp("ns"),
+    "open": pa.float64(),
+    "high": pa.float64(),
+    "low": pa.float64(),
+    "close": pa.float64(),
+    "volume": pa.float64(),
+    "open_interest": pa.float64(),
+    "daily_pct_change": pa.float64(),
+    "log_return": pa.float64(),
+}
+
+_SQL_TYPES = {"asset_id": "VARCHAR", "date": "TIMESTAMP_NS"}
+
+
+def _empty(columns):
+    return encode_assets(pa.table({c: pa.array([], type=PRICE_TYPES.get(c, pa.float64())) for c in columns}))
+
+
+def price_sql(relation, asset_ids=None, start_date=None, end_date=None, columns=PRICE_COLUMNS):
+    """
+    SELECT over `relation` with the projection and predicates pushed into it.
+    Columns are cast to PRICE_TYPES so every backend returns the same schema.
+    """
+    select = ", ".join(f"CAST({c} AS {_SQL_TYPES.get(c, 'DOUBLE')}) AS {c}" for c in columns)
+    where, params = price_filters(asset_ids, start_date, end_date)
+    query = f"SELECT {select} FROM {relation}"
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    return query + " ORDER BY asset_id, date", params
+
+
+class PriceSource(abc.ABC):
+    """
+    Base class. Subclasses provide relation(asset_ids) -- a DuckDB FROM clause,
+    or None when there is nothing to read -- and version().
+    """
+
+    @abc.abstractmethod
+    def relation(self, asset_ids=None):
+        """DuckDB FROM clause over the rows of asset_ids (all if None), or None."""
+
+    @abc.abstractmethod
+    def version(self):
+        """Hashable value that changes whenever the source's data does."""
+
+    def _table(self, query, params):
+        return query_arrow(query, params)
+
+    def _batches(self, query, params, batch_rows):
+        return stream_query(query, params, batch_rows)
+
+    def load(self, asset_ids=None, start_date=None, end_date=None, columns=PRICE_COLUMNS):
+        """Matching rows as an Arrow table ordered by (asset_id, date), asset_id dictionary-encoded."""
+        columns = list(columns)
+        if asset_ids is not None and not len(asset_ids):
+            return _empty(columns)
+        relation = self.relation(asset_ids)
+        if relation is None:
+            return _empty(columns)
+        return encode_assets(self._table(*price_sql(relation, asset_ids, start_date, end_date, columns)))
+
+    def stream(self, asset_ids=None, start_date=None, end_date=None, columns=PRICE_COLUMNS,
+               batch_rows=DEFAULT_BATCH_ROWS):
+        """Same rows as load(), yielded as RecordBatches grouped by asset."""
+        if asset_ids is not None and not len(asset_ids):
+            return iter(())
+        relation = self.relation(asset_ids)
+        if relation is None:
+            return iter(())
+        query, params = price_sql(relation, asset_ids, start_date, end_date, list(columns))
+        return self._batches(query, params, batch_rows)
+
+    def list_assets(self):
+        relation = self.relation()
+        if relation is None:
+            return []
+        table = self._table(f"SELECT DISTINCT CAST(asset_id AS VARCHAR) AS asset_id FROM {relation} ORDER BY 1", [])
+        return table.column("asset_id").to_pylist()
+
+
+class ParquetSource(PriceSource):
+    """A Parquet file, or every *.parquet file under a directory."""
+
+    def __init__(self, path=PRICE_PATH):
+        self.path = Path(path)
+
+    def _files(self):
+        if self.path.is_dir():
+            return sorted(self.path.rglob("*.parquet"))
+        return [self.path] if self.path.exists() else []
+
+    def relation(self, asset_ids=None):
+        if not self._files():
+            return None
+        pattern = self.path / "**" / "*.parquet" if self.path.is_dir() else self.path
+        return f"read_parquet('{pattern}', union_by_name=true)"
+
+    def version(self):
+        return tuple((str(f), f.stat().st_mtime_ns) for f in self._files())
+
+
+class CsvDirectorySource(PriceSource):
+    """
+    One CSV per asset, named asset_<asset_id>.csv (the layout of
+    data/asset_Economic.FRED.DGS30.csv). An asset predicate selects the files
+    to open before anything is read.
+    """
+
+    def __init__(self, directory=DATA_DIR, prefix="asset_"):
+        self.directory = Path(directory)
+        self.prefix = prefix
+
+    def _files(self, asset_ids=None):
+        if asset_ids is None:
+            return sorted(self.directory.glob(f"{self.prefix}*.csv"))
+        files = (self.directory / f"{self.prefix}{a}.csv" for a in asset_ids)
+        return [f for f in files if f.exists()]
+
+    def relation(self, asset_ids=None):
+        files = self._files(asset_ids)
+        if not files:
+            return None
+        listed = ", ".join(f"'{f}'" for f in files)
+        return f"read_csv([{listed}], header=true, union_by_name=true)"
+
+    def version(self):
+        return tuple((f.name, f.stat().st_mtime_ns) for f in self._files())
+
+
+class DuckDBSource(PriceSource):
+    """
+    A table in a DuckDB file, read through the latest Parquet snapshot its
+    writer published (utils.db_writer), so reads never take the file's lock
+    and every process sees the same data.
+    """
+
+    def __init__(self, db_path=IMPORT_DB_PATH, table="price_data"):
+        self.db_path = Path(db_path)
+        self.table = table
+
+    def _snapshot(self):
+        return snapshot_path(self.db_path, self.table)
+
+    def relation(self, asset_ids=None):
+        path = self._snapshot()
+        return f"read_parquet('{path}')" if path is not None else None
+
+    def version(self):
+        # snapshot names are unique per publish and mean the same in every process
+        path = self._snapshot()
+        return str(path) if path is not None else None
+
+
+class CompositeSource(PriceSource):
+    """
+    Several sources as one. Each asset is read from the first source that
+    lists it, so e.g. an imported series overrides the bundled one.
+    """
+
+    def __init__(self, sources):
+        self.sources = list(sources)
+        self._owners = (None, None)
+
+    def version(self):
+        return tuple(s.version() for s in self.sources)
+
+    def _assignments(self):
+        # asset -> index of its owning source, recomputed when any source changes
+        version = self.version()
+        if self._owners[0] != version:
+            owners = {}
+            for i, source in enumerate(self.sources):
+                for asset in source.list_assets():
+                    owners.setdefault(asset, i)
+            self._owners = (version, owners)
+        return self._owners[1]
+
+    def relation(self, asset_ids=None):
+        # one FROM clause with each asset from its owner; load() and stream() query
+        # the sources separately instead
+        parts = []
+        for source, ids in self._split(asset_ids):
+            relation = source.relation(ids)
+            if relation is not None:
+                listed = ", ".join("'" + a.replace("'", "''") + "'" for a in ids)
+                parts.append(f"(SELECT * FROM {relation} WHERE CAST(asset_id AS VARCHAR) IN ({listed}))")
+        if not parts:
+            return None
+        return parts[0] if len(parts) == 1 else "(" + " UNION ALL BY NAME ".join(parts) + ")"
+
+    def _split(self, asset_ids):
+        owners = self._assignments()
+        wanted = owners if asset_ids is None else [a for a in asset_ids if a in owners]
+        parts = [[] for _ in self.sources]
+        for asset in wanted:
+            parts[owners[asset]].append(asset)
+        return [(source, ids) for source, ids in zip(self.sources, parts) if ids]
+
+    def load(self, asset_ids=None, start_date=None, end_date=None, columns=PRICE_COLUMNS):
+        columns = list(columns)
+        tables = [source.load(ids, start_date, end_date, columns) for source, ids in self._split(asset_ids)]
+        if not tables:
+            return _empty(columns)
+        if len(tables) == 1:
+            return tables[0]
+        # re-encode ids over the union of the per-source dictionaries
+        if "asset_id" in columns:
+            i = columns.index("asset_id")
+            tables = [t.set_column(i, "asset_id", t.column(i).cast(pa.string())) for t in tables]
+        return encode_assets(pa.concat_tables(tables).combine_chunks())
+
+    def stream(self, asset_ids=None, start_date=None, end_date=None, columns=PRICE_COLUMNS,
+               batch_rows=DEFAULT_BATCH_ROWS):
+        # sources own disjoint assets, so the chained batches stay grouped by asset
+        return chain.from_iterable(
+            source.stream(ids, start_date, end_date, columns, batch_rows) for source, ids in self._split(asset_ids)
+        )
+
+    def list_assets(self):
+        return sorted(self._assignments())
+
+    def assets_by_source(self):
+        """[(source, asset ids it serves)] for every source that serves any."""
+        return self._split(None)
+
+
+_default_source = None
+
+
+def price_source():
+    """The app-wide source: imported DuckDB data, then the Parquet store, then per-asset CSVs."""
+    global _default_source
+    if _default_source is None:
+        _default_source = CompositeSource([DuckDBSource(), ParquetSource(), CsvDirectorySource()])
+    return _default_source
+
+
+def batch_source(price_path=PRICE_PATH, import_db=IMPORT_DB_PATH, csv_dir=DATA_DIR):
+    """The same layering over explicit paths (e.g. for batch jobs run from elsewhere)."""
+    return CompositeSource([DuckDBSource(import_db), ParquetSource(price_path), CsvDirectorySource(csv_dir)])
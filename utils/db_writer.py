@@ -0,0 +1,274 @@
+# utils/db_writer.py
+"""
+Single-writer access to DuckDB database files.
+
+DuckDB allows one read-write handle per file, and while a process holds it
+no other process can open the file at all, not even read-only. So:
+
+- all mutations for a file go through one DuckDBWriter thread per process,
+  which drains its queue and commits queued operations together in one
+  transaction. The read-write handle is opened when a batch arrives and
+  closed once the queue is idle, so several server processes take turns on
+  the file lock (a writer finding it held retries for up to
+  LOCK_TIMEOUT_SECONDS);
+- after a commit the writer publishes versioned Parquet snapshots of the
+  file's snapshot tables. Operations submitted with publish=False (e.g.
+  the chunks of a streaming import) skip this until a later batch publishes,
+  except for snapshot tables that have never been published (e.g. just
+  created), which every commit publishes. Superseded snapshots are deleted
+  SNAPSHOT_GRACE_SECONDS after their successor, so readers in any process
+  that resolved an older one can finish scanning it;
+- every reader, in any process, uses reader(path) or read_snapshot(path,
+  table), which read those snapshots and never touch the database file.
+  A table is only readable once it has been published.
+
+Writes from one process are visible to its readers as soon as the
+submit() future resolves (snapshots are published before that).
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from pathlib import Path
+
+import duckdb
+import pandas as pd
+
+MAX_BATCH = 64
+LINGER_SECONDS = 0.005
+# how long a superseded snapshot stays readable after the next one is published
+SNAPSHOT_GRACE_SECONDS = 600
+# how long a batch waits for another process to release the file
+LOCK_TIMEOUT_SECONDS = 30
+# longest a busy writer keeps the file before letting other processes in
+MAX_HOLD_SECONDS = 1.0
+
+logger = logging.getLogger(__name__)
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def snapshot_dir(db_path):
+    db_path = Path(db_path)
+    return db_path.parent / "snapshots" / db_path.stem
+
+
+class DuckDBWriter:
+    """
+    Owns this process's read-write connection to one database file, open
+    only while a batch commits.
+
+    Operations are callables taking the connection; each submit() returns a
+    Future resolved once the operation's batch has committed.
+    """
+
+    def __init__(self, db_path, snapshot_tables=()):
+        self.db_path = str(db_path)
+        self.snapshot_tables = set(snapshot_tables)
+        self.con = None  # open only while batches are queued
+        self._opened = 0.0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name=f"duckdb-writer:{self.db_path}", daemon=True)
+        self._thread.start()
+
+    # ----------- Submit -----------
+
+    def submit(self, op, publish=True):
+        """
+        Queues op(con). With publish=False the batch's commit does not rewrite
+        the Parquet snapshots (unless another operation in it asks to).
+        """
+        future = Future()
+        self._queue.put((op, future, publish))
+        return future
+
+    def execute(self, sql, params=None, wait=True, publish=True):
+        future = self.submit(lambda con: con.execute(sql, params or []).fetchall(), publish)
+        return future.result() if wait else future
+
+    def executemany(self, sql, rows, wait=True):
+        rows = list(rows)
+        future = self.submit(lambda con: con.executemany(sql, rows).fetchall())
+        return future.result() if wait else future
+
+    def add_snapshot_tables(self, *tables):
+        self.snapshot_tables.update(tables)
+
+    # ----------- Writer Thread -----------
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + LINGER_SECONDS
+            while len(batch) < MAX_BATCH:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                if self.con is None:
+                    self.con = self._connect()
+                    self._opened = time.monotonic()
+                results = self._commit(batch)
+            except Exception as e:  # never let the thread die: later submits would hang
+                logger.exception("DuckDB writer for %s failed a batch", self.db_path)
+                results = [(future, None, e) for _, future, _ in batch]
+                self._close()
+            # back-to-back batches reuse the handle; it is released once the queue
+            # is idle (or held too long), before anyone waiting is resumed
+            if self._queue.empty() or time.monotonic() - self._opened > MAX_HOLD_SECONDS:
+                self._close()
+            for future, result, error in results:
+                if future.done():
+                    continue
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+
+    def _close(self):
+        if self.con is None:
+            return
+        try:
+            self.con.close()
+        except duckdb.Error:
+            logger.exception("Closing %s failed", self.db_path)
+        self.con = None
+
+    def _connect(self):
+        # another server process may be in the middle of its own batch
+        deadline = time.monotonic() + LOCK_TIMEOUT_SECONDS
+        delay = 0.01
+        while True:
+            try:
+                return duckdb.connect(self.db_path)
+            except duckdb.IOException as e:
+                if "lock" not in str(e).lower() or time.monotonic() >= deadline:
+                    raise
+                time.sleep(delay)
+                delay = min(delay * 2, 0.5)
+
+    def _commit(self, batch):
+        publish = any(p for _, _, p in batch)
+        try:
+            self.con.execute("BEGIN TRANSACTION")
+            results = [op(self.con) for op, _, _ in batch]
+            self.con.execute("COMMIT")
+        except Exception:
+            self._rollback()
+            # isolate the failing operation(s); the rest still commit
+            results = []
+            for op, future, _ in batch:
+                try:
+                    self.con.execute("BEGIN TRANSACTION")
+                    result = op(self.con)
+                    self.con.execute("COMMIT")
+                    results.append((future, result, None))
+                except Exception as e:
+                    self._rollback()
+                    results.append((future, None, e))
+        else:
+            results = [(future, result, None) for (_, future, _), result in zip(batch, results)]
+
+        try:
+            self._publish_snapshots(everything=publish)
+        except Exception:
+            # the data is committed; readers just see the previous snapshot until the next one
+            logger.exception("Publishing snapshots of %s failed", self.db_path)
+        return results
+
+    def _rollback(self):
+        try:
+            self.con.execute("ROLLBACK")
+        except duckdb.Error:
+            pass  # no transaction left open (e.g. the failure was in BEGIN or COMMIT itself)
+
+    def _publish_snapshots(self, everything=True):
+        # without `everything`, only tables that have no snapshot yet, so a table is
+        # readable as soon as it exists
+        tables = self.snapshot_tables if everything else {
+            t for t in self.snapshot_tables if snapshot_path(self.db_path, t) is None}
+        if not tables:
+            return
+        existing = {row[0] for row in self.con.execute("SELECT table_name FROM duckdb_tables()").fetchall()}
+        for table in tables & existing:
+            out_dir = snapshot_dir(self.db_path) / table
+            out_dir.mkdir(parents=True, exist_ok=True)
+            version = time.time_ns()
+            self.con.execute(f"COPY \"{table}\" TO '{out_dir / f'v{version}.parquet'}' (FORMAT PARQUET)")
+            pointer = out_dir / "CURRENT"
+            tmp = out_dir / "CURRENT.tmp"
+            tmp.write_text(f"v{version}.parquet")
+            tmp.replace(pointer)
+            _prune_snapshots(out_dir)
+
+
+def _prune_snapshots(out_dir):
+    # a snapshot is only deleted once its successor has been current for the grace
+    # period; count-based pruning could delete a file another process is scanning
+    versions = sorted((int(p.stem[1:]), p) for p in out_dir.glob("v*.parquet") if p.stem[1:].isdigit())
+    cutoff = time.time_ns() - SNAPSHOT_GRACE_SECONDS * 1_000_000_000
+    for (_, old), (newer, _) in zip(versions, versions[1:]):
+        if newer < cutoff:
+            old.unlink(missing_ok=True)
+
+
+def get_writer(db_path, snapshot_tables=()):
+    """The process-wide writer for db_path (created on first use)."""
+    key = str(Path(db_path).resolve())
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None:
+            writer = _writers[key] = DuckDBWriter(db_path, snapshot_tables)
+        else:
+            writer.add_snapshot_tables(*snapshot_tables)
+        return writer
+
+
+_read_base = None
+_read_base_lock = threading.Lock()
+
+
+@contextmanager
+def reader(db_path):
+    """
+    A read-only cursor over the latest published snapshot of every table of
+    db_path (one view per table). Never opens the database file.
+    """
+    global _read_base
+    with _read_base_lock:
+        if _read_base is None:
+            # one in-memory database per process; each cursor's TEMP views are its own
+            _read_base = duckdb.connect()
+        cur = _read_base.cursor()
+    try:
+        root = snapshot_dir(db_path)
+        for table_dir in sorted(root.iterdir()) if root.is_dir() else ():
+            path = snapshot_path(db_path, table_dir.name)
+            if path is not None:
+                cur.execute(f'CREATE TEMP VIEW "{table_dir.name}" AS SELECT * FROM read_parquet(\'{path}\')')
+        yield cur
+    finally:
+        cur.close()
+
+
+def snapshot_path(db_path, table):
+    """Path of the latest published Parquet snapshot of `table`, or None."""
+    out_dir = snapshot_dir(db_path) / table
+    pointer = out_dir / "CURRENT"
+    if not pointer.exists():
+        return None
+    return out_dir / pointer.read_text().strip()
+
+
+def read_snapshot(db_path, table):
+    """
+    Latest published Parquet snapshot of `table`, or None if there is none.
+    Safe from any process, even while the writer holds the database.
+    """
+    path = snapshot_path(db_path, table)
+    return None if path is None else pd.read_parquet(path)
@@ -0,0 +1,72 @@
+# utils/diagnostics.py
+"""
+Hidden per-rerun diagnostics panel.
+
+Open any page with ?diagnostics=1 (or set APP_DIAGNOSTICS=1) to trace that
+rerun and show its span tree in the sidebar. Set TRACE_EXPORT=<path> to also
+append every traced rerun to a JSON-lines file.
+"""
+
+import os
+import threading
+
+import pandas as pd
+import streamlit as st
+from utils.tracing import span, is_enabled, enable_for_thread, start_trace, collect, to_jsonl, export_jsonl
+
+_local = threading.local()
+
+
+def diagnostics_requested():
+    return os.getenv("APP_DIAGNOSTICS") == "1" or st.query_params.get("diagnostics") == "1"
+
+
+def begin_rerun(page):
+    """Call once near the top of a page, after st.set_page_config."""
+    active = diagnostics_requested()
+    enable_for_thread(active)
+    start_trace()
+    _local.root = None
+    if active:
+        _local.root = span(f"rerun:{page}")
+        _local.root.__enter__()
+
+
+def plotly_chart(fig, **kwargs):
+    """st.plotly_chart inside a span that records the serialized figure size."""
+    with span("plotly_chart") as s:
+        if is_enabled():
+            s.set(bytes=len(fig.to_json()), traces=len(fig.data))
+        st.plotly_chart(fig, **kwargs)
+
+
+def render_diagnostics_panel():
+    """Call at the end of a page: closes the rerun span and renders the sidebar panel."""
+    root = getattr(_local, "root", None)
+    if root is None:
+        return
+    root.__exit__(None, None, None)
+    _local.root = None
+    roots = collect()
+
+    records = []
+    for tree in roots:
+        for depth, s in tree.walk():
+            records.append({
+                "span": "  " * depth + s.name,
+                "ms": round(s.duration_ms or 0, 2),
+                "rows_in": s.attrs.get("rows_in"),
+                "rows_out": s.attrs.get("rows_out"),
+                "bytes": s.attrs.get("bytes"),
+                "cache_hit": s.attrs.get("cache_hit"),
+            })
+
+    export_path = os.getenv("TRACE_EXPORT")
+    if export_path:
+        export_jsonl(roots, export_path)
+
+    with st.sidebar.expander("🩺 Diagnostics", expanded=True):
+        st.dataframe(pd.DataFrame(records), use_container_width=True, hide_index=True)
+        st.download_button("Export spans (JSONL)", to_jsonl(roots), file_name="spans.jsonl",
+                           mime="application/x-ndjson")
+    enable_for_thread(False)
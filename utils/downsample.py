@@ -0,0 +1,126 @@
+# utils/downsample.py
+
+import numpy as np
+import pandas as pd
+from utils.tracing import traced
+
+# Roughly the pixel width of a wide chart; more points than this are not visible
+DEFAULT_POINTS = 2000
+
+METHODS = ("lttb", "minmax")
+
+
+def _as_float(x):
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype("datetime64[ns]").astype("int64").astype("float64")
+    return x.astype("float64")
+
+
+def lttb_indices(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: picks n_out row positions that preserve
+    the visual shape of the line (peaks and troughs survive).
+    First and last points are always kept. x must be sorted.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x, y = _as_float(x), np.asarray(y, dtype="float64")
+
+    # n_out - 2 buckets between the fixed first and last points
+    edges = np.linspace(1, n - 1, n_out - 1).astype("int64")
+    out = np.empty(n_out, dtype="int64")
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt_lo, nxt_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[nxt_lo:nxt_hi].mean() if nxt_hi > nxt_lo else x[-1]
+        avg_y = y[nxt_lo:nxt_hi].mean() if nxt_hi > nxt_lo else y[-1]
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def minmax_indices(y, n_buckets):
+    """
+    Keeps the min and max row of each of n_buckets equal-sized buckets
+    (plus first and last), so every spike and drawdown stays visible.
+    Returns sorted row positions, at most 2 * n_buckets + 2 of them.
+    """
+    n = len(y)
+    if 2 * n_buckets >= n or n_buckets < 1:
+        return np.arange(n)
+    y = np.asarray(y, dtype="float64")
+    bucket = np.arange(n) * n_buckets // n
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    lows = np.minimum.reduceat(y, starts)[bucket]
+    highs = np.maximum.reduceat(y, starts)[bucket]
+
+    # first matching row per bucket for each extreme
+    is_low = np.flatnonzero(y == lows)
+    is_high = np.flatnonzero(y == highs)
+    first_low = is_low[np.unique(bucket[is_low], return_index=True)[1]]
+    first_high = is_high[np.unique(bucket[is_high], return_index=True)[1]]
+    return np.unique(np.concatenate([[0, n - 1], first_low, first_high]))
+
+
+def downsample_indices(x, y, n_points=DEFAULT_POINTS, method="lttb"):
+    if method not in METHODS:
+        raise ValueError(f"Unknown downsampling method '{method}', expected one of {METHODS}")
+    if method == "minmax":
+        return minmax_indices(y, max(1, n_points // 2))
+    return lttb_indices(x, y, n_points)
+
+
+@traced()
+def downsample_frame(df, x=None, y=None, n_points=DEFAULT_POINTS, method="lttb", group=None):
+    """
+    Reduces a chart frame to about n_points rows per series before plotting.
+
+    Parameters:
+    - df: DataFrame in long (one y column + `group`) or wide (several y columns) form
+    - x: x-axis column (default: the index); rows must be sorted by it within each series
+    - y: column or list of columns plotted; for several columns the kept rows
+      are the union of each column's picks, so all traces share x values
+    - n_points: target points per series
+    - method: 'lttb' (line shape) or 'minmax' (bars / outlier views)
+    - group: column that splits df into separate series (e.g. 'asset_id')
+
+    Returns:
+    - the subset of df rows to plot, in original order
+    """
+    if df is None or len(df) <= n_points:
+        return df
+    if y is None:
+        y = [c for c in df.columns if c != x and c != group]
+    y_cols = [y] if isinstance(y, str) else list(y)
+
+    if group is not None:
+        parts = [downsample_frame(part, x, y_cols, n_points, method)
+                 for _, part in df.groupby(group, sort=False)]
+        return pd.concat(parts) if parts else df
+
+    x_values = df.index.to_numpy() if x is None else df[x].to_numpy()
+    keep = []
+    for col in y_cols:
+        values = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype="float64")
+        valid = np.flatnonzero(~np.isnan(values))
+        if len(valid) == 0:
+            continue
+        picked = downsample_indices(x_values[valid], values[valid], n_points, method)
+        keep.append(valid[picked])
+    if not keep:
+        return df.iloc[:0]
+    return df.iloc[np.unique(np.concatenate(keep))]
+
+
+def downsample_series(series, n_points=DEFAULT_POINTS, method="lttb"):
+    """Series (e.g. a NAV indexed by date) version of downsample_frame."""
+    if series is None or len(series) <= n_points:
+        return series
+    s = series.dropna()
+    picked = downsample_indices(s.index.to_numpy(), s.to_numpy(), n_points, method)
+    return s.iloc[picked]
@@ -0,0 +1,177 @@
+# utils/fx.py
+"""
+Base-currency conversion of price panels.
+
+FX rates are ordinary price series (FRED's daily noon rates, e.g.
+Economic.FRED.DEXUSEU), loaded through the same price source as every other
+asset. Each is quoted against the pivot currency (USD); any other pair is
+triangulated through it:
+
+    base per unit of c = (pivot per unit of c) / (pivot per unit of base)
+
+fx_matrix() aligns the rates onto a panel's dates (last quote at or before
+each date) and caches the result; to_base_currency() then converts the whole
+panel with one broadcast multiply.
+
+Currencies come from the metadata's currency_code. Assets without one (e.g.
+imported series) are taken to be in the base currency already.
+"""
+
+from collections import OrderedDict
+from datetime import timedelta
+from pathlib import Path
+
+import duckdb
+import numpy as np
+import pandas as pd
+from utils.alignment import align_prices
+from utils.arrow_io import asset_codes
+from utils.data_source import price_source
+from utils.screener_query import METADATA_PATH
+from utils.tracing import traced, current_span
+
+PIVOT_CURRENCY = "USD"
+
+# currency -> (FX series asset id, True if quoted as pivot per unit of the currency)
+FX_SERIES = {
+    "EUR": ("Economic.FRED.DEXUSEU", True),
+    "GBP": ("Economic.FRED.DEXUSUK", True),
+    "AUD": ("Economic.FRED.DEXUSAL", True),
+    "NZD": ("Economic.FRED.DEXUSNZ", True),
+    "JPY": ("Economic.FRED.DEXJPUS", False),
+    "CAD": ("Economic.FRED.DEXCAUS", False),
+    "CHF": ("Economic.FRED.DEXSZUS", False),
+    "CNY": ("Economic.FRED.DEXCHUS", False),
+    "HKD": ("Economic.FRED.DEXHKUS", False),
+    "INR": ("Economic.FRED.DEXINUS", False),
+}
+BASE_CURRENCIES = (PIVOT_CURRENCY,) + tuple(sorted(FX_SERIES))
+
+# FX quotes are loaded from this far before the panel so its first date has a rate
+FX_LOOKBACK_DAYS = 14
+
+_FX_CACHE = OrderedDict()
+_FX_CACHE_SIZE = 32
+_CURRENCIES = [None, {}]
+
+
+def _currency_map(metadata_path):
+    # asset_id -> currency_code for the whole metadata file, reloaded when it changes
+    mtime = metadata_path.stat().st_mtime_ns
+    if _CURRENCIES[0] != (metadata_path, mtime):
+        con = duckdb.connect()
+        try:
+            rows = con.execute(f"SELECT asset_id, upper(trim(currency_code)) FROM '{metadata_path}'").fetchall()
+        finally:
+            con.close()
+        _CURRENCIES[:] = [(metadata_path, mtime), {a: c or None for a, c in rows}]
+    return _CURRENCIES[1]
+
+
+def asset_currencies(assets, metadata_path=METADATA_PATH):
+    """currency_code of each asset, in order; None where the metadata has none."""
+    assets = list(assets)
+    if not Path(metadata_path).exists():
+        return [None] * len(assets)
+    codes = _currency_map(Path(metadata_path))
+    return [codes.get(a) for a in assets]
+
+
+def _fx_series_id(currency):
+    if currency not in FX_SERIES:
+        raise ValueError(f"No FX series configured for currency '{currency}'")
+    return FX_SERIES[currency][0]
+
+
+def _pivot_rates(currencies, dates, source):
+    """dates x currencies panel of pivot units per unit of each currency."""
+    quoted = [c for c in currencies if c != PIVOT_CURRENCY]
+    rates = np.ones((len(dates), len(currencies)))
+    if not quoted:
+        return rates
+
+    series = [_fx_series_id(c) for c in quoted]
+    start = pd.Timestamp(dates[0]).date() - timedelta(days=FX_LOOKBACK_DAYS)
+    table = source.load(series, start, pd.Timestamp(dates[-1]).date())
+    missing = sorted(set(series) - set(asset_codes(table)[1]))
+    if missing:
+        raise ValueError(f"FX series {missing} have no prices up to {pd.Timestamp(dates[-1]).date()}")
+
+    quotes = align_prices(table, series, how="asof", calendar=dates, dropna=False).to_numpy()
+    invert = np.array([not FX_SERIES[c][1] for c in quoted])
+    quotes[:, invert] = 1.0 / quotes[:, invert]
+    rates[:, [currencies.index(c) for c in quoted]] = quotes
+    return rates
+
+
+@traced()
+def fx_matrix(currencies, base, dates, source=None, version=None):
+    """
+    Conversion rates onto `dates`.
+
+    Parameters:
+    - currencies: currency codes to convert from
+    - base: currency to convert into
+    - dates: DatetimeIndex of the panel being converted
+    - source: price source holding the FX series (default: price_source())
+    - version: the source's version(), keys the cache (default: looked up)
+
+    Returns:
+    - DataFrame indexed by dates, one column per currency: units of `base`
+      per unit of that currency. NaN before a currency's first quote.
+    """
+    source = source or price_source()
+    if version is None:
+        version = source.version()
+    dates = pd.DatetimeIndex(dates)
+    currencies = list(dict.fromkeys(currencies))
+    key = (tuple(currencies), base, len(dates), hash(dates.asi8.tobytes()), version)
+    if key in _FX_CACHE:
+        _FX_CACHE.move_to_end(key)
+        current_span().set(fx_cache_hit=True)
+        return _FX_CACHE[key]
+
+    current_span().set(fx_cache_hit=False)
+    needed = list(dict.fromkeys(currencies + [base]))
+    pivot = _pivot_rates(needed, dates, source)
+    # triangulate through the pivot: (pivot per c) / (pivot per base)
+    cross = pivot[:, [needed.index(c) for c in currencies]] / pivot[:, [needed.index(base)]]
+    result = pd.DataFrame(cross, index=dates, columns=pd.Index(currencies, name="currency"))
+
+    _FX_CACHE[key] = result
+    if len(_FX_CACHE) > _FX_CACHE_SIZE:
+        _FX_CACHE.popitem(last=False)
+    return result
+
+
+@traced()
+def to_base_currency(panel, base, currencies=None, source=None, version=None):
+    """
+    Converts a date x asset price panel (prepare_data / align_prices output)
+    into `base`.
+
+    Parameters:
+    - panel: DataFrame indexed by date, one column per asset
+    - base: target currency, one of BASE_CURRENCIES
+    - currencies: currency of each column (default: from the asset metadata;
+      None means already in `base`)
+    - source, version: where the FX series are read from, as in fx_matrix
+
+    Returns:
+    - DataFrame of the same shape; dates before an FX series' first quote are NaN
+    """
+    if currencies is None:
+        currencies = asset_currencies(panel.columns)
+    currencies = [c or base for c in currencies]
+    if panel.empty or all(c == base for c in currencies):
+        return panel
+
+    fx = fx_matrix(sorted(set(currencies)), base, panel.index, source, version)
+    cols = fx.columns.get_indexer(currencies)
+    # one multiply: each column scaled by its currency's rate on every date
+    converted = panel.to_numpy(dtype="float64") * fx.to_numpy()[:, cols]
+    return pd.DataFrame(converted, index=panel.index, columns=panel.columns)
+
+
+def clear_fx_cache():
+    _FX_CACHE.clear()
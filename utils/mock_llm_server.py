@@ -0,0 +1,127 @@
+# utils/mock_llm_server.py
+
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.ai_agent import StubModel
+
+
+class MockLLMServer:
+    """
+    Local OpenAI-compatible chat completions endpoint for offline runs and tests.
+
+    Replies are produced by a model callable (default: StubModel) and served
+    either as one JSON response or, with "stream": true, as server-sent-event
+    chunks, one word per chunk with an optional token_delay between them.
+    A model that raises is answered with an HTTP 500 carrying its message.
+
+    Usage:
+        server = MockLLMServer(StubModel(["Growth"])).start()
+        pool = StreamingPool(base_url=server.base_url)   # or OPENAI_BASE_URL=server.base_url
+        ...
+        server.stop()
+    """
+
+    def __init__(self, model=None, host="127.0.0.1", port=0, token_delay=0.0, first_token_delay=0.0):
+        self.model = model or StubModel()
+        self.token_delay = token_delay
+        self.first_token_delay = first_token_delay
+        self.requests = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                server.requests += 1
+                tools = [t["function"] for t in body.get("tools") or []]
+                try:
+                    reply = server.model(body["messages"], tools)
+                except Exception as e:
+                    self._error(500, str(e))
+                    return
+                if body.get("stream"):
+                    self._stream(body.get("model", "mock"), reply)
+                else:
+                    self._complete(body.get("model", "mock"), reply)
+
+            def _tool_calls(self, reply):
+                return [{"index": i, "id": c["id"], "type": "function",
+                         "function": {"name": c["name"], "arguments": json.dumps(c["arguments"])}}
+                        for i, c in enumerate(reply.get("tool_calls") or [])]
+
+            def _error(self, status, message):
+                payload = json.dumps({"error": {"message": message, "type": "server_error"}}).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _complete(self, model, reply):
+                calls = self._tool_calls(reply)
+                message = {"role": "assistant", "content": reply.get("content")}
+                if calls:
+                    message["tool_calls"] = [{k: v for k, v in c.items() if k != "index"} for c in calls]
+                payload = json.dumps({
+                    "id": "mock", "object": "chat.completion", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "message": message,
+                                 "finish_reason": "tool_calls" if calls else "stop"}],
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _stream(self, model, reply):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+
+                def send(delta, finish=None):
+                    chunk = {"id": "mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                             "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+
+                time.sleep(server.first_token_delay)
+                calls = self._tool_calls(reply)
+                if calls:
+                    send({"role": "assistant", "tool_calls": calls})
+                    send({}, "tool_calls")
+                else:
+                    words = (reply.get("content") or "").split(" ")
+                    for i, word in enumerate(words):
+                        send({"content": word if i == 0 else " " + word})
+                        time.sleep(server.token_delay)
+                    send({}, "stop")
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+        return Handler
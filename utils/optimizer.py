@@ -0,0 +1,365 @@
+# utils/optimizer.py
+"""
+Covariance estimation and long-only mean-variance allocation.
+
+- estimate_moments: annualized mean returns and covariance from a return
+  panel, optionally shrunk (Ledoit-Wolf toward a scaled identity, or a fixed
+  intensity); get_moments caches them per asset set, window and data version
+- min_variance / max_sharpe / risk_parity: long-only allocations, each
+  weight in [0, max_weight], weights summing to 1
+- efficient_frontier: the long-only frontier traced by warm-started solves
+  of  min 1/2 w'Cw - tau * mu'w  over an increasing tau grid
+
+Everything is NumPy: the quadratic programs are solved by accelerated
+projected gradient on the (capped) simplex, which converges in a handful of
+iterations from the neighbouring frontier point.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from utils.alignment import align_prices
+from utils.tracing import traced, current_span
+
+TRADING_DAYS = 252
+RISK_FREE_RATE = 0.01
+FRONTIER_POINTS = 50
+
+_MOMENTS_CACHE = OrderedDict()
+_MOMENTS_CACHE_SIZE = 16
+
+
+# ----------- Covariance -----------
+
+def ledoit_wolf(returns):
+    """
+    Ledoit-Wolf (2004) shrinkage of the sample covariance toward mu * I.
+
+    Parameters:
+    - returns: (T x N) array of demeaned-or-not periodic returns, no NaN
+
+    Returns:
+    - (shrunk covariance, shrinkage intensity in [0, 1])
+    """
+    x = returns - returns.mean(axis=0)
+    t, n = x.shape
+    sample = x.T @ x / t
+    mu = np.trace(sample) / n
+    target = mu * np.eye(n)
+    d2 = np.sum((sample - target) ** 2) / n
+    # sum_k ||x_k x_k' - S||^2, expanded so no (T x N x N) array is built
+    norms = np.sum(x * x, axis=1)
+    spread = np.sum(norms ** 2) - 2 * np.sum((x @ sample) * x) + t * np.sum(sample ** 2)
+    b2 = min(spread / (n * t * t), d2)
+    delta = b2 / d2 if d2 > 0 else 1.0
+    return delta * target + (1 - delta) * sample, delta
+
+
+@traced()
+def estimate_moments(returns, shrinkage=None):
+    """
+    Annualized expected returns and covariance of a date x asset return panel.
+
+    Parameters:
+    - returns: DataFrame of periodic (daily) returns, rows with NaN are dropped
+    - shrinkage: None (sample covariance), 'ledoit_wolf', or a fixed
+      intensity in [0, 1] toward the average-variance identity
+
+    Returns:
+    - (mu Series, cov DataFrame), both indexed by asset
+    """
+    clean = returns.dropna()
+    if len(clean) < 2:
+        raise ValueError("need at least 2 complete return rows to estimate a covariance")
+    x = clean.to_numpy(dtype="float64")
+    if shrinkage == "ledoit_wolf":
+        cov, delta = ledoit_wolf(x)
+    else:
+        cov = np.cov(x, rowvar=False, ddof=1).reshape(x.shape[1], x.shape[1])
+        delta = float(shrinkage or 0.0)
+        if delta:
+            cov = delta * np.trace(cov) / len(cov) * np.eye(len(cov)) + (1 - delta) * cov
+    current_span().set(shrinkage=round(float(delta), 4), rows=len(x), assets=x.shape[1])
+    assets = clean.columns
+    return (pd.Series(x.mean(axis=0) * TRADING_DAYS, index=assets),
+            pd.DataFrame(cov * TRADING_DAYS, index=assets, columns=assets))
+
+
+def return_panel(price_data, assets):
+    """Daily simple returns of `assets` from a long price frame or Arrow table (ffill-aligned)."""
+    return align_prices(price_data, list(assets), values="close", how="ffill").pct_change().iloc[1:]
+
+
+def get_moments(price_data, assets, start_date, end_date, shrinkage=None, version=None):
+    """
+    Cached estimate_moments for one asset set and window.
+
+    The key is (sorted assets, window, shrinkage, version); pass the price
+    source's version() so new data invalidates it. price_data is only read
+    on a miss.
+    """
+    key = (tuple(sorted(assets)), str(start_date), str(end_date), shrinkage, version)
+    if key in _MOMENTS_CACHE:
+        _MOMENTS_CACHE.move_to_end(key)
+        current_span().set(moments_cache_hit=True)
+        mu, cov = _MOMENTS_CACHE[key]
+    else:
+        current_span().set(moments_cache_hit=False)
+        mu, cov = estimate_moments(return_panel(price_data, sorted(assets)), shrinkage)
+        _MOMENTS_CACHE[key] = (mu, cov)
+        if len(_MOMENTS_CACHE) > _MOMENTS_CACHE_SIZE:
+            _MOMENTS_CACHE.popitem(last=False)
+    order = list(assets)
+    return mu[order], cov.loc[order, order]
+
+
+def clear_moments_cache():
+    _MOMENTS_CACHE.clear()
+
+
+# ----------- Solvers -----------
+
+def project_simplex(v, upper=1.0):
+    """Euclidean projection of v onto {w : 0 <= w <= upper, sum(w) = 1}."""
+    n = len(v)
+    if upper * n < 1 - 1e-12:
+        raise ValueError(f"max weight {upper} is infeasible for {n} assets")
+    if upper >= 1:
+        u = np.sort(v)[::-1]
+        css = np.cumsum(u) - 1
+        k = np.nonzero(u - css / np.arange(1, n + 1) > 0)[0][-1]
+        return np.maximum(v - css[k] / (k + 1), 0)
+    # capped simplex: bisection on the shift theta, sum(clip(v - theta)) is monotone
+    lo, hi = v.min() - upper, v.max()
+    for _ in range(60):
+        theta = (lo + hi) / 2
+        if np.clip(v - theta, 0, upper).sum() > 1:
+            lo = theta
+        else:
+            hi = theta
+    return np.clip(v - (lo + hi) / 2, 0, upper)
+
+
+def _solve(cov, mu, tau, w0, upper, lipschitz, tol=1e-9, max_iter=20000):
+    """
+    FISTA for  min 1/2 w'Cw - tau * mu'w  on the capped simplex, from w0.
+    Returns (weights, iterations).
+    """
+    step = 1.0 / lipschitz
+    w = project_simplex(w0, upper)
+    y, t = w, 1.0
+    for i in range(1, max_iter + 1):
+        w_next = project_simplex(y - step * (cov @ y - tau * mu), upper)
+        if np.max(np.abs(w_next - w)) < tol:
+            return w_next, i
+        t_next = (1 + np.sqrt(1 + 4 * t * t)) / 2
+        y = w_next + ((t - 1) / t_next) * (w_next - w)
+        # restart momentum when it stops helping (keeps warm starts fast)
+        if (w_next - w) @ (cov @ w_next - tau * mu) > 0:
+            y, t_next = w_next, 1.0
+        w, t = w_next, t_next
+    return w, max_iter
+
+
+def _prepare(mu, cov, max_weight):
+    cov = np.asarray(cov, dtype="float64")
+    mu = np.zeros(len(cov)) if mu is None else np.asarray(mu, dtype="float64")
+    lipschitz = max(np.linalg.eigvalsh(cov)[-1], 1e-12)
+    w0 = project_simplex(np.full(len(cov), 1.0 / len(cov)), max_weight)
+    return mu, cov, lipschitz, w0
+
+
+def _as_series(w, like):
+    index = like.index if isinstance(like, (pd.Series, pd.DataFrame)) else None
+    return pd.Series(w, index=index, name="weight")
+
+
+@traced()
+def min_variance(cov, max_weight=1.0):
+    """Long-only minimum-variance weights (Series if cov is a DataFrame)."""
+    mu, c, lip, w0 = _prepare(None, cov, max_weight)
+    w, _ = _solve(c, mu, 0.0, w0, max_weight, lip)
+    return _as_series(w, cov)
+
+
+@traced()
+def risk_parity(cov, budgets=None, max_weight=1.0, tol=1e-10, max_iter=1000):
+    """
+    Long-only equal-risk-contribution weights (or contributions proportional
+    to `budgets`), by cyclical coordinate descent on
+    1/2 y'Cy - s * sum(b * log y).
+
+    Weights above `max_weight` are pinned at the cap and the remaining budget
+    is shared by the other assets, which keep risk contributions proportional
+    to their budgets; the multiplier s is rescaled each sweep so the free
+    weights fill what the pinned ones leave.
+    """
+    c = np.asarray(cov, dtype="float64")
+    n = len(c)
+    if max_weight * n < 1 - 1e-12:
+        raise ValueError(f"max weight {max_weight} is infeasible for {n} assets")
+    b = np.full(n, 1.0 / n) if budgets is None else np.asarray(budgets, dtype="float64") / np.sum(budgets)
+    diag = np.diag(c)
+    pinned = np.zeros(n, dtype=bool)
+    y = 1.0 / np.sqrt(diag)
+    y /= y.sum()
+    while True:
+        free = np.flatnonzero(~pinned)
+        y[pinned] = max_weight
+        target = 1.0 - max_weight * pinned.sum()
+        if free.size == 0:
+            break
+        s = 1.0
+        for _ in range(max_iter):
+            prev = y.copy()
+            for i in free:
+                others = c[i] @ y - diag[i] * y[i]
+                y[i] = (-others + np.sqrt(others * others + 4 * diag[i] * s * b[i])) / (2 * diag[i])
+            total = y[free].sum()
+            if not pinned.any():
+                y, s = y / total, s / total ** 2
+            else:
+                s *= (target / total) ** 2
+            if np.max(np.abs(y - prev)) < tol * np.max(np.abs(y)):
+                break
+        over = ~pinned & (y > max_weight)
+        if not over.any():
+            break
+        pinned |= over
+    if free.size:
+        y[free] *= target / y[free].sum()
+    return _as_series(y, cov)
+
+
+def _frontier_taus(mu, cov, lipschitz, w0, upper, n_points):
+    # smallest tau that reaches the maximum attainable return, by doubling
+    order = np.argsort(mu)[::-1]
+    best, left = 0.0, 1.0
+    for i in order:
+        take = min(upper, left)
+        best += take * mu[i]
+        left -= take
+        if left <= 1e-12:
+            break
+    tau, w = 1e-6 * lipschitz / max(np.ptp(mu), 1e-12), w0
+    for _ in range(60):
+        w, _ = _solve(cov, mu, tau, w, upper, lipschitz, tol=1e-7)
+        if mu @ w >= best - 1e-6 * max(abs(best), 1e-12):
+            break
+        tau *= 2
+    return np.r_[0.0, np.geomspace(tau * 1e-4, tau, n_points - 1)]
+
+
+@traced()
+def efficient_frontier(mu, cov, n_points=FRONTIER_POINTS, max_weight=1.0, risk_free_rate=RISK_FREE_RATE):
+    """
+    Long-only efficient frontier, from minimum variance to maximum return.
+
+    Each point warm-starts from the previous one's weights, so a frontier
+    costs little more than its first solve.
+
+    Returns:
+    - points: DataFrame with 'return', 'volatility', 'sharpe', 'iterations'
+      and 'tau' (the risk-aversion parameter each point was solved at)
+    - weights: DataFrame (point x asset)
+    """
+    m, c, lip, w0 = _prepare(mu, cov, max_weight)
+    taus = _frontier_taus(m, c, lip, w0, max_weight, n_points)
+    rows, weights, w, total = [], [], w0, 0
+    for tau in taus:
+        w, iters = _solve(c, m, tau, w, max_weight, lip)
+        total += iters
+        ret, vol = float(m @ w), float(np.sqrt(max(w @ c @ w, 0.0)))
+        rows.append({"return": ret, "volatility": vol,
+                     "sharpe": (ret - risk_free_rate) / vol if vol > 0 else np.nan, "iterations": iters,
+                     "tau": tau})
+        weights.append(w)
+    current_span().set(points=len(taus), iterations=total)
+    columns = mu.index if isinstance(mu, pd.Series) else None
+    return pd.DataFrame(rows), pd.DataFrame(weights, columns=columns)
+
+
+@traced()
+def max_sharpe(mu, cov, max_weight=1.0, risk_free_rate=RISK_FREE_RATE, n_points=FRONTIER_POINTS, frontier=None):
+    """
+    Long-only maximum-Sharpe weights: the best frontier point, refined by a
+    golden-section search over tau between its neighbours (Sharpe is
+    unimodal along the frontier).
+
+    Pass frontier=(points, weights) from efficient_frontier with the same
+    max_weight to reuse its solves instead of tracing the frontier again.
+    """
+    m, c, lip, w0 = _prepare(mu, cov, max_weight)
+
+    def sharpe(w):
+        return (m @ w - risk_free_rate) / np.sqrt(max(w @ c @ w, 1e-18))
+
+    def sharpe_at(tau, start):
+        w, _ = _solve(c, m, tau, start, max_weight, lip)
+        return sharpe(w), w
+
+    if frontier is not None:
+        points, weights = frontier
+        taus, ws = points["tau"].to_numpy(), list(np.asarray(weights, dtype="float64"))
+        scores = [sharpe(w) for w in ws]
+    else:
+        taus = _frontier_taus(m, c, lip, w0, max_weight, n_points)
+        scores, ws, w = [], [], w0
+        for tau in taus:
+            s, w = sharpe_at(tau, w)
+            scores.append(s)
+            ws.append(w)
+    k = int(np.argmax(scores))
+    lo, hi = taus[max(k - 1, 0)], taus[min(k + 1, len(taus) - 1)]
+    best_s, best_w = scores[k], ws[k]
+    g = (np.sqrt(5) - 1) / 2
+    for _ in range(40):
+        a, b = hi - g * (hi - lo), lo + g * (hi - lo)
+        sa, wa = sharpe_at(a, best_w)
+        sb, wb = sharpe_at(b, best_w)
+        if sa >= sb:
+            hi = b
+            if sa > best_s:
+                best_s, best_w = sa, wa
+        else:
+            lo = a
+            if sb > best_s:
+                best_s, best_w = sb, wb
+        if hi - lo < 1e-9 * max(hi, 1e-12):
+            break
+    return _as_series(best_w, mu)
+
+
+def to_percent_weights(weights, min_weight=1e-4, decimals=2, max_weight=1.0):
+    """
+    Optimizer weights -> (assets, percent weights) for save_portfolio.
+
+    Drops weights below min_weight and renormalizes, moving any weight pushed
+    above max_weight onto the assets with room under it. Rounds by largest
+    remainder, so the percents total exactly 100 and none exceeds the cap.
+    """
+    weights = weights[weights >= min_weight]
+    w = weights.to_numpy(dtype="float64") / weights.sum()
+    for _ in range(len(w)):
+        over = w > max_weight
+        if not over.any():
+            break
+        excess = (w[over] - max_weight).sum()
+        w[over] = max_weight
+        room = w < max_weight
+        w[room] += excess * w[room] / w[room].sum()
+
+    # whole units of 10**-decimals percent; each unit of residue goes to the
+    # largest remainder that still has room under the cap
+    scale = 10 ** decimals
+    units = w * 100 * scale
+    cap = np.floor(max_weight * 100 * scale + 1e-6)
+    out = np.minimum(np.floor(units + 1e-6), cap)
+    order = np.argsort(-(units - out), kind="stable")
+    while out.sum() < 100 * scale:
+        room = order[out[order] < cap]
+        if not room.size:
+            break
+        out[room[:int(100 * scale - out.sum())]] += 1
+    return list(weights.index), [round(float(u) / scale, decimals) for u in out]
@@ -2,6 +2,7 @@
 
 import pandas as pd
 from pathlib import Path
+from utils.asset_stats import compute_asset_stats, save_asset_stats
 
 data_folder = Path("data")
 
@@ -16,5 +17,7 @@ def load_price_data():
 def save_metadata(df):
     df.to_parquet(data_folder / "asset_metadata.parquet", index=False)
 
-def save_price_data(df):
+def save_price_data(df, update_stats=True):
     df.to_parquet(data_folder / "price_data.parquet", index=False)
+    if update_stats:
+        save_asset_stats(compute_asset_stats(df))
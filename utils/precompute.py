@@ -0,0 +1,376 @@
+# utils/precompute.py
+"""
+Dependency-tracked precompute scheduler for derived datasets.
+
+Derived artifacts (returns, per-asset stats, cleaning flags, correlations,
+portfolio NAVs) are nodes in a DAG whose leaves are sources: files, or
+callables returning a version (e.g. a price source's). Each node's
+fingerprint hashes its build version and its dependencies' fingerprints, so
+after an ingest only the nodes downstream of a changed source are stale.
+Independent stale nodes are rebuilt concurrently; fingerprints and build
+durations are kept in a JSON manifest next to the outputs.
+
+    python -m utils.precompute            # rebuild whatever is stale
+    python -m utils.precompute --status   # show freshness only
+
+Pages call is_fresh(name) / load_fresh_artifact(name) and fall back to
+on-demand computation when an artifact is stale or missing.
+"""
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+
+import duckdb
+import pandas as pd
+
+from utils.asset_stats import STATS_PATH, build_asset_stats
+from utils.data_source import batch_source
+from utils.saved_portfolios import DataError, load_saved_portfolios, run_backtest
+
+data_folder = Path("data")
+DERIVED_DIR = data_folder / "derived"
+MANIFEST_PATH = DERIVED_DIR / "manifest.json"
+
+PRICE_PATH = data_folder / "price_data.parquet"
+METADATA_PATH = data_folder / "asset_metadata.parquet"
+PORTFOLIO_DB_PATH = data_folder / "portfolio.db"
+
+MAX_GAP_DAYS = 6
+OUTLIER_Z = 5
+NAV_RANGE = ("2015-01-01", "2023-12-31")
+
+
+class Artifact:
+    """
+    One node of the DAG.
+
+    - name: unique id
+    - output: file the build writes
+    - deps: names of other artifacts or source ids
+    - build: callable(output_path) that writes the artifact
+    - version: bump when the build logic changes to force a rebuild
+    """
+
+    def __init__(self, name, output, deps, build, version="1"):
+        self.name = name
+        self.output = Path(output)
+        self.deps = list(deps)
+        self.build = build
+        self.version = version
+
+
+def file_fingerprint(path):
+    path = Path(path)
+    if not path.exists():
+        return "missing"
+    stat = path.stat()
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def source_fingerprint(source):
+    """A path's file_fingerprint, or the hashed version a callable source returns."""
+    if callable(source):
+        return hashlib.sha1(json.dumps(source(), default=str).encode()).hexdigest()
+    return file_fingerprint(source)
+
+
+class Scheduler:
+    def __init__(self, artifacts, sources, manifest_path=MANIFEST_PATH, max_workers=4):
+        self.artifacts = {a.name: a for a in artifacts}
+        self.sources = dict(sources)  # source id -> path, or callable returning a version
+        self.manifest_path = Path(manifest_path)
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        for a in artifacts:
+            unknown = [d for d in a.deps if d not in self.artifacts and d not in self.sources]
+            if unknown:
+                raise ValueError(f"Artifact '{a.name}' depends on unknown nodes {unknown}")
+        self._order = self._toposort()
+
+    def _toposort(self):
+        order, state = [], {}
+
+        def visit(name):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ValueError(f"Dependency cycle through '{name}'")
+            state[name] = "visiting"
+            for dep in self.artifacts[name].deps:
+                if dep in self.artifacts:
+                    visit(dep)
+            state[name] = "done"
+            order.append(name)
+
+        for name in self.artifacts:
+            visit(name)
+        return order
+
+    # ----------- Fingerprints & Manifest -----------
+
+    def fingerprints(self):
+        """Current fingerprint of every source and artifact."""
+        prints = {s: source_fingerprint(p) for s, p in self.sources.items()}
+        for name in self._order:
+            a = self.artifacts[name]
+            payload = json.dumps([a.version, [(d, prints[d]) for d in a.deps]])
+            prints[name] = hashlib.sha1(payload.encode()).hexdigest()
+        return prints
+
+    def read_manifest(self):
+        if not self.manifest_path.exists():
+            return {}
+        return json.loads(self.manifest_path.read_text())
+
+    def _record(self, name, entry):
+        with self._lock:
+            manifest = self.read_manifest()
+            manifest[name] = entry
+            self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.manifest_path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(manifest, indent=2))
+            tmp.replace(self.manifest_path)
+
+    def status(self):
+        """{artifact: {'fresh': bool, 'built_at', 'duration_s'}}"""
+        prints, manifest = self.fingerprints(), self.read_manifest()
+        out = {}
+        for name in self._order:
+            entry = manifest.get(name, {})
+            fresh = entry.get("fingerprint") == prints[name] and self.artifacts[name].output.exists()
+            out[name] = {"fresh": fresh, "built_at": entry.get("built_at"), "duration_s": entry.get("duration_s")}
+        return out
+
+    def is_fresh(self, name):
+        return self.status()[name]["fresh"]
+
+    # ----------- Build -----------
+
+    def stale(self, only=None, force=False):
+        """Stale artifacts (plus everything they feed), restricted to `only` and its dependencies."""
+        status = self.status()
+        wanted = set(self._order)
+        if only:
+            wanted = set()
+            stack = list(only)
+            while stack:
+                name = stack.pop()
+                if name in wanted or name not in self.artifacts:
+                    continue
+                wanted.add(name)
+                stack.extend(d for d in self.artifacts[name].deps if d in self.artifacts)
+        return [n for n in self._order if n in wanted and (force or not status[n]["fresh"])]
+
+    def run(self, only=None, force=False, log=print):
+        """
+        Rebuilds stale artifacts, running every node whose dependencies are
+        ready concurrently. A failed node skips its dependents.
+
+        Returns:
+        - {artifact: 'built' | 'failed: ...' | 'skipped'}
+        """
+        todo = self.stale(only, force)
+        prints = self.fingerprints()
+        results = {}
+        if not todo:
+            return results
+
+        pending = set(todo)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                for name in [n for n in self._order if n in pending]:
+                    deps = [d for d in self.artifacts[name].deps if d in self.artifacts]
+                    if any(results.get(d, "").startswith(("failed", "skipped")) for d in deps):
+                        results[name] = "skipped"
+                        pending.discard(name)
+                    elif not any(d in pending or d in running.values() for d in deps):
+                        pending.discard(name)
+                        running[pool.submit(self._build_one, name, prints[name])] = name
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        duration = future.result()
+                        results[name] = "built"
+                        log(f"built {name} in {duration:.2f}s")
+                    except Exception as e:
+                        results[name] = f"failed: {type(e).__name__}: {e}"
+                        log(f"FAILED {name}: {e}")
+        return results
+
+    def _build_one(self, name, fingerprint):
+        artifact = self.artifacts[name]
+        artifact.output.parent.mkdir(parents=True, exist_ok=True)
+        start = time.perf_counter()
+        artifact.build(artifact.output)
+        duration = time.perf_counter() - start
+        self._record(name, {"fingerprint": fingerprint, "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                            "duration_s": round(duration, 3)})
+        return duration
+
+
+# ----------- Default Artifacts -----------
+
+def _sql(query, params=None):
+    # Builds run on worker threads; each gets its own connection, closed once the result is fetched
+    con = duckdb.connect()
+    try:
+        return con.execute(query, params or []).df()
+    finally:
+        con.close()
+
+
+def _build_returns(out):
+    _sql(f"""
+        COPY (
+            SELECT asset_id, date, close,
+                   (close / LAG(close) OVER w - 1) * 100 AS daily_pct_change,
+                   LN(close / LAG(close) OVER w) AS log_return
+            FROM '{PRICE_PATH}'
+            WINDOW w AS (PARTITION BY asset_id ORDER BY date)
+            ORDER BY asset_id, date
+        ) TO '{out}' (FORMAT PARQUET)
+    """)
+
+
+def _build_asset_stats(out):
+    build_asset_stats(PRICE_PATH, out)
+
+
+def _build_missing_data(out):
+    # Same rule as utils.data_cleaner.detect_missing_data
+    _sql(f"""
+        COPY (
+            SELECT asset_id, MAX(gap_days) AS max_gap_days
+            FROM (
+                SELECT asset_id, DATE_DIFF('day', LAG(date) OVER (PARTITION BY asset_id ORDER BY date), date) AS gap_days
+                FROM '{PRICE_PATH}'
+            )
+            GROUP BY asset_id
+            HAVING MAX(gap_days) > {MAX_GAP_DAYS}
+            ORDER BY asset_id
+        ) TO '{out}' (FORMAT PARQUET)
+    """)
+
+
+def _build_outliers(out):
+    # Same rule as utils.data_cleaner.detect_outliers: population z-score per asset
+    # over its non-missing closes (NaN is treated as NULL, which AVG/STDDEV_POP skip)
+    _sql(f"""
+        COPY (
+            SELECT asset_id, date, close, z_score FROM (
+                SELECT asset_id, date, close,
+                       (c - AVG(c) OVER a) / STDDEV_POP(c) OVER a AS z_score
+                FROM (SELECT asset_id, date, close, CASE WHEN isnan(close) THEN NULL ELSE close END AS c FROM '{PRICE_PATH}')
+                WINDOW a AS (PARTITION BY asset_id)
+            )
+            WHERE ABS(z_score) > {OUTLIER_Z}
+            ORDER BY asset_id, date
+        ) TO '{out}' (FORMAT PARQUET)
+    """)
+
+
+def _saved_portfolios():
+    if not PORTFOLIO_DB_PATH.exists():
+        return {}
+    return load_saved_portfolios(PORTFOLIO_DB_PATH)
+
+
+def _build_portfolio_correlation(out):
+    assets = sorted({a for assets, _ in _saved_portfolios().values() for a in assets})
+    returns = _sql(
+        f"SELECT asset_id, date, log_return FROM '{DERIVED_DIR / 'returns.parquet'}' "
+        "WHERE asset_id IN (SELECT UNNEST(?))",
+        [assets],
+    )
+    wide = returns.pivot_table(index="date", columns="asset_id", values="log_return")
+    wide.corr().reset_index().to_parquet(out, index=False)
+
+
+def compute_portfolio_navs():
+    """
+    NAV of every saved portfolio over NAV_RANGE: a 'date' column plus one
+    column per portfolio (portfolios without price data are left out).
+    """
+    navs = {}
+    for name, (assets, weights) in _saved_portfolios().items():
+        try:
+            navs[name], _ = run_backtest(name, assets, weights, *NAV_RANGE, price_path=PRICE_PATH)
+        except DataError:
+            continue
+    nav_df = pd.DataFrame(navs)
+    nav_df.index.name = "date"
+    return nav_df.reset_index()
+
+
+def _build_portfolio_navs(out):
+    compute_portfolio_navs().to_parquet(out, index=False)
+
+
+def default_scheduler(max_workers=4):
+    sources = {
+        "price_data": PRICE_PATH,
+        # what run_backtest reads: the Parquet store plus imported series and per-asset CSVs
+        "backtest_prices": lambda: batch_source(PRICE_PATH).version(),
+        "asset_metadata": METADATA_PATH,
+        "saved_portfolios": PORTFOLIO_DB_PATH,
+    }
+    artifacts = [
+        Artifact("returns", DERIVED_DIR / "returns.parquet", ["price_data"], _build_returns),
+        Artifact("asset_stats", STATS_PATH, ["price_data"], _build_asset_stats),
+        Artifact("missing_data", DERIVED_DIR / "missing_data.parquet", ["price_data"], _build_missing_data),
+        Artifact("outliers", DERIVED_DIR / "outliers.parquet", ["price_data"], _build_outliers),
+        Artifact("portfolio_correlation", DERIVED_DIR / "portfolio_correlation.parquet",
+                 ["returns", "saved_portfolios"], _build_portfolio_correlation),
+        Artifact("portfolio_navs", DERIVED_DIR / "portfolio_navs.parquet",
+                 ["backtest_prices", "saved_portfolios"], _build_portfolio_navs),
+    ]
+    return Scheduler(artifacts, sources, max_workers=max_workers)
+
+
+def is_fresh(name):
+    return default_scheduler().is_fresh(name)
+
+
+def artifact_fingerprint(name):
+    """Fingerprint of the inputs an artifact is built from; changes whenever it goes stale."""
+    return default_scheduler().fingerprints()[name]
+
+
+def load_fresh_artifact(name):
+    """The artifact as a DataFrame if it is fresh, else None (caller computes on demand)."""
+    scheduler = default_scheduler()
+    if not scheduler.is_fresh(name):
+        return None
+    return pd.read_parquet(scheduler.artifacts[name].output)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild stale derived datasets.")
+    parser.add_argument("--only", nargs="*", help="artifacts to build (with their dependencies)")
+    parser.add_argument("--force", action="store_true", help="rebuild even if fresh")
+    parser.add_argument("--status", action="store_true", help="only print freshness")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args(argv)
+
+    scheduler = default_scheduler(args.workers)
+    if not args.status:
+        results = scheduler.run(args.only, args.force)
+        if not results:
+            print("All artifacts fresh.")
+        if any(r != "built" for r in results.values()):
+            raise SystemExit(1)
+    for name, s in scheduler.status().items():
+        print(f"{name:24} {'fresh' if s['fresh'] else 'STALE':6} built {s['built_at'] or '-'} ({s['duration_s'] or '-'}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+# utils/prefetch.py
+"""
+Background warm-up and prefetch of the app's cached data.
+
+The loaders every page shares live here (load_metadata, load_screener_metadata,
+load_asset_ids, load_price_panel), so one st.cache_data entry serves all
+pages and can be filled before anyone asks for it:
+
+- warm_up(): once per server process, loads metadata, the asset list and the
+  price panels of the hottest assets (saved portfolios and the screener's
+  saved selection) in the background
+- prefetch(fn, *args): starts fn(*args) on a bounded thread pool; identical
+  in-flight requests are deduplicated, and a full queue drops the request
+  (prefetch is best effort)
+- fetch(fn, *args): the foreground call; waits for a matching in-flight
+  prefetch instead of starting a second scan, else calls fn directly
+
+The loaders keep their results in the cross-process shared cache
+(utils.shared_cache) rather than st.cache_data, so a finished prefetch is a
+hit for every server process, and each process maps the same pages.
+"""
+
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from pathlib import Path
+
+import duckdb
+import pandas as pd
+import streamlit as st
+from utils.arrow_io import query_arrow
+from utils.data_source import price_source
+from utils.db_writer import reader
+from utils.screener_query import metadata_relation
+from utils.shared_cache import as_frame, shared_table
+from utils.tracing import traced, note_cache_miss
+
+try:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+except ImportError:  # older Streamlit
+    add_script_run_ctx = get_script_run_ctx = None
+
+METADATA_PATH = Path("data/asset_metadata.parquet")
+PORTFOLIO_DB_PATH = "data/portfolio.db"
+SELECTED_ASSETS_DB = "data/selected_assets.duckdb"
+
+# Date range the comparison pages start with; warm-up prefetches panels for it
+DEFAULT_START = date(2015, 1, 1)
+DEFAULT_END = date(2023, 12, 31)
+
+MAX_WORKERS = 4
+MAX_IN_FLIGHT = 16
+
+
+# ----------- Shared Loaders -----------
+
+def _mtime(path):
+    path = Path(path)
+    return path.stat().st_mtime_ns if path.exists() else None
+
+@traced("load_metadata", cache=True)
+def load_metadata():
+    if not METADATA_PATH.exists():
+        return pd.DataFrame()
+    def build():
+        note_cache_miss()
+        return query_arrow(f"SELECT * FROM '{METADATA_PATH}'")
+    return as_frame(shared_table("metadata", (), _mtime(METADATA_PATH), build))
+
+@traced("load_screener_metadata", cache=True)
+def load_screener_metadata(stats_mtime=None):
+    # stats_mtime keys the entry so a refreshed stats table is picked up
+    def build():
+        note_cache_miss()
+        return query_arrow(f"SELECT * FROM {metadata_relation()}")
+    return as_frame(shared_table("screener_metadata", (), (_mtime(METADATA_PATH), stats_mtime), build))
+
+@traced("load_asset_ids", cache=True)
+@st.cache_data
+def load_asset_ids(version):
+    note_cache_miss()
+    # `version` only keys the cache: it changes when any price source changes
+    return price_source().list_assets()
+
+@traced("load_price_panel", cache=True)
+def load_price_panel(assets, start_date, end_date, version):
+    # asset/date predicates and the projection run inside the source's scan;
+    # the table is shared read-only by every server process
+    def build():
+        note_cache_miss()
+        return price_source().load(list(assets), start_date, end_date)
+    return shared_table("price_panel", (tuple(assets), str(start_date), str(end_date)), version, build)
+
+@traced("load_asset_prices", cache=True)
+def load_asset_prices(asset_id, columns, version):
+    """Full history of one asset (shared like load_price_panel)."""
+    def build():
+        note_cache_miss()
+        return price_source().load([asset_id], columns=list(columns))
+    return shared_table("asset_prices", (asset_id, tuple(columns)), version, build)
+
+
+# ----------- Prefetch Pool -----------
+
+def _freeze(value):
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class Prefetcher:
+    """Bounded thread pool that deduplicates requests by (function, arguments)."""
+
+    def __init__(self, max_workers=MAX_WORKERS, max_in_flight=MAX_IN_FLIGHT):
+        self.max_in_flight = max_in_flight
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def _key(self, fn, args):
+        return (fn.__module__, getattr(fn, "__qualname__", repr(fn)), _freeze(args))
+
+    def submit(self, fn, *args):
+        """Starts fn(*args) unless the same call is already running; None if the pool is full."""
+        key = self._key(fn, args)
+        ctx = get_script_run_ctx() if get_script_run_ctx else None
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                return future
+            if len(self._in_flight) >= self.max_in_flight:
+                return None
+            future = self._in_flight[key] = self._pool.submit(self._run, ctx, fn, args)
+        future.add_done_callback(lambda _: self._forget(key))
+        return future
+
+    def _run(self, ctx, fn, args):
+        if ctx is not None and add_script_run_ctx:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        return fn(*args)
+
+    def _forget(self, key):
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+    def fetch(self, fn, *args):
+        """fn(*args), joining a matching in-flight prefetch if there is one."""
+        with self._lock:
+            future = self._in_flight.get(self._key(fn, args))
+        if future is not None:
+            try:
+                return future.result()
+            except Exception:
+                pass  # fall through and surface the error from a foreground call
+        return fn(*args)
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._in_flight)
+
+
+_prefetcher = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher():
+    global _prefetcher
+    with _prefetcher_lock:
+        if _prefetcher is None:
+            _prefetcher = Prefetcher()
+        return _prefetcher
+
+
+def prefetch(fn, *args):
+    return get_prefetcher().submit(fn, *args)
+
+
+def fetch(fn, *args):
+    return get_prefetcher().fetch(fn, *args)
+
+
+# ----------- Warm-up -----------
+
+def hot_asset_sets():
+    """Asset sets worth having resident: each saved portfolio, then the screener's saved selection."""
+    sets = []
+    for path, query in ((PORTFOLIO_DB_PATH, "SELECT assets FROM saved_portfolios"),
+                        (SELECTED_ASSETS_DB, "SELECT list(asset_id) FROM selected_assets")):
+        if not Path(path).exists():
+            continue
+        try:
+            with reader(path) as cur:
+                rows = cur.execute(query).fetchall()
+        except duckdb.Error:
+            continue  # table not created yet
+        for (assets,) in rows:
+            assets = json.loads(assets) if isinstance(assets, str) else assets
+            if assets:
+                sets.append(tuple(sorted(assets)))
+    return sets
+
+
+@st.cache_resource
+def _warm_up_once():
+    version = price_source().version()
+    prefetch(load_metadata)
+    prefetch(load_asset_ids, version)
+    stats = Path("data/asset_stats.parquet")
+    prefetch(load_screener_metadata, stats.stat().st_mtime if stats.exists() else None)
+    prefetch(_warm_hot_assets, version)
+    return True
+
+
+def _warm_hot_assets(version):
+    for assets in hot_asset_sets():
+        prefetch(load_price_panel, assets, DEFAULT_START, DEFAULT_END, version)
+
+
+def warm_up():
+    """Call from every page (after begin_rerun); only the first call in a process does anything."""
+    _warm_up_once()
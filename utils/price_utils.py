@@ -2,7 +2,9 @@
 
 import pandas as pd
 import numpy as np
+from utils.tracing import traced
 
+@traced()
 def calculate_returns(df):
     """
     Given a DataFrame with 'asset_id', 'date', and 'close', compute:
@@ -15,6 +17,7 @@ def calculate_returns(df):
     df['log_return'] = np.log(df['close'] / df.groupby('asset_id')['close'].shift(1))
     return df
 
+@traced()
 def calculate_cumulative_return(df):
     """
     Adds a cumulative return column for each asset.
@@ -0,0 +1,70 @@
+# utils/saved_portfolios.py
+"""
+Saved portfolios outside the UI: reading them and backtesting one over a
+date range. Shared by batch_runner and the precompute scheduler.
+"""
+
+import json
+
+import duckdb
+
+from utils.backtest_engine import prepare_data, compute_portfolio_nav
+from utils.analysis_tools import compute_advanced_metrics
+from utils.arrow_io import asset_codes
+from utils.data_source import batch_source
+from utils.db_writer import read_snapshot
+
+DUCKDB_PATH = "data/portfolio.db"
+PRICE_PATH = "data/price_data.parquet"
+
+
+class DataError(Exception):
+    """A portfolio could not be backtested from the available data."""
+
+
+def load_saved_portfolios(db_path=DUCKDB_PATH):
+    # Prefer the snapshot the app's writer publishes: it never contends for the file lock
+    snapshot = read_snapshot(db_path, "saved_portfolios")
+    if snapshot is not None:
+        rows = snapshot[["name", "assets", "weights"]].itertuples(index=False)
+    else:
+        con = duckdb.connect(database=str(db_path), read_only=True)
+        try:
+            rows = con.execute("SELECT name, assets, weights FROM saved_portfolios").fetchall()
+        finally:
+            con.close()
+    return {name: (json.loads(a), json.loads(w)) for name, a, w in rows}
+
+
+def load_prices(assets, start_date, end_date, price_path=PRICE_PATH):
+    # The Parquet store plus imported series (via the import DB's snapshot) and per-asset CSVs
+    return batch_source(price_path).load(assets, start_date, end_date)
+
+
+def run_backtest(name, assets, weights, start_date, end_date, price_path=PRICE_PATH, base_currency=None):
+    """
+    Backtests one portfolio over one date range, in base_currency if given
+    (else each asset's own currency).
+
+    Returns:
+    - (nav Series, metrics dict)
+
+    Raises:
+    - DataError if prices are missing or the aligned panel is empty
+    """
+    if len(assets) != len(weights):
+        raise DataError(f"{name}: {len(assets)} assets but {len(weights)} weights")
+    prices = load_prices(assets, start_date, end_date, price_path)
+    missing = sorted(set(assets) - set(asset_codes(prices)[1]))
+    if missing:
+        raise DataError(f"{name}: no price data for {missing} between {start_date} and {end_date}")
+
+    try:
+        panel = prepare_data(prices, assets, start_date, end_date,
+                             base_currency=base_currency, fx_source=batch_source(price_path))
+    except ValueError as e:  # no FX series for a currency
+        raise DataError(f"{name}: {e}")
+    nav = compute_portfolio_nav(panel, weights)
+    if len(nav) < 2:
+        raise DataError(f"{name}: fewer than 2 aligned dates between {start_date} and {end_date}")
+    return nav, compute_advanced_metrics(nav)
@@ -0,0 +1,156 @@
+# utils/screener_query.py
+
+import threading
+from pathlib import Path
+
+import duckdb
+from utils.asset_stats import STATS_PATH
+from utils.tracing import traced
+
+METADATA_PATH = Path("data") / "asset_metadata.parquet"
+
+_local = threading.local()
+
+
+def _connection():
+    # One in-memory connection per script thread; DuckDB connections are not thread-safe
+    con = getattr(_local, "con", None)
+    if con is None:
+        con = _local.con = duckdb.connect()
+    return con
+
+
+def metadata_relation(metadata_path=METADATA_PATH, stats_path=STATS_PATH):
+    """
+    SQL relation for the screener universe: metadata, left-joined to the
+    per-asset stats table when it exists.
+    """
+    if not Path(stats_path).exists():
+        return f"(SELECT * FROM '{metadata_path}')"
+    return f"""(
+        SELECT m.*, s.* EXCLUDE (asset_id)
+        FROM '{metadata_path}' m
+        LEFT JOIN '{stats_path}' s USING (asset_id)
+    )"""
+
+
+def relation_columns(relation=None):
+    relation = relation or metadata_relation()
+    return [row[0] for row in _connection().execute(f"DESCRIBE SELECT * FROM {relation}").fetchall()]
+
+
+def build_where(filters, columns):
+    """
+    Translates a screener filter dict into a parameterized WHERE clause.
+
+    filters:
+    - 'text':   {column: substring}  -> case-insensitive contains
+    - 'equals': {column: value}
+    - 'min':    {column: lower bound} (inclusive)
+    - 'max':    {column: upper bound} (inclusive)
+
+    Empty values are ignored; unknown columns raise ValueError.
+
+    Returns:
+    - (sql, params) where sql is '' or 'WHERE ...'
+    """
+    clauses, params = [], []
+
+    def check(column):
+        if column not in columns:
+            raise ValueError(f"Unknown screener column '{column}'")
+        return f'"{column}"'
+
+    for column, value in (filters.get("text") or {}).items():
+        if value:
+            clauses.append(f"strpos(lower(CAST({check(column)} AS VARCHAR)), lower(?)) > 0")
+            params.append(str(value))
+    for column, value in (filters.get("equals") or {}).items():
+        if value not in (None, ""):
+            clauses.append(f"{check(column)} = ?")
+            params.append(value)
+    for column, value in (filters.get("min") or {}).items():
+        if value is not None:
+            clauses.append(f"{check(column)} >= ?")
+            params.append(value)
+    for column, value in (filters.get("max") or {}).items():
+        if value is not None:
+            clauses.append(f"{check(column)} <= ?")
+            params.append(value)
+
+    sql = "WHERE " + " AND ".join(clauses) if clauses else ""
+    return sql, params
+
+
+@traced()
+def count_assets(filters, relation=None):
+    relation = relation or metadata_relation()
+    where, params = build_where(filters, relation_columns(relation))
+    return _connection().execute(f"SELECT COUNT(*) FROM {relation} {where}", params).fetchone()[0]
+
+
+@traced()
+def fetch_page(filters, page=0, page_size=100, sort_by=None, descending=False, relation=None):
+    """
+    Returns one page of the filtered universe as a DataFrame. Filtering,
+    ordering and LIMIT/OFFSET all run inside DuckDB, so only page_size rows
+    are materialized.
+    """
+    relation = relation or metadata_relation()
+    columns = relation_columns(relation)
+    where, params = build_where(filters, columns)
+
+    order = '"asset_id"'
+    if sort_by:
+        if sort_by not in columns:
+            raise ValueError(f"Unknown screener column '{sort_by}'")
+        order = f'"{sort_by}" {"DESC" if descending else "ASC"} NULLS LAST, "asset_id"'
+
+    query = f"SELECT * FROM {relation} {where} ORDER BY {order} LIMIT ? OFFSET ?"
+    return _connection().execute(query, params + [int(page_size), int(page) * int(page_size)]).df()
+
+
+@traced()
+def group_counts(filters, column, relation=None):
+    """
+    Asset counts per value of `column` for the filtered universe (GROUP BY in DuckDB).
+    """
+    relation = relation or metadata_relation()
+    columns = relation_columns(relation)
+    where, params = build_where(filters, columns)
+    if column not in columns:
+        raise ValueError(f"Unknown screener column '{column}'")
+    query = f"""
+        SELECT "{column}", COUNT(*) AS count
+        FROM {relation} {where}
+        GROUP BY "{column}"
+        ORDER BY count DESC
+    """
+    return _connection().execute(query, params).df()
+
+
+def distinct_values(column, relation=None):
+    relation = relation or metadata_relation()
+    if column not in relation_columns(relation):
+        raise ValueError(f"Unknown screener column '{column}'")
+    query = f'SELECT DISTINCT "{column}" FROM {relation} WHERE "{column}" IS NOT NULL ORDER BY 1'
+    return [row[0] for row in _connection().execute(query).fetchall()]
+
+
+def filter_frame(df, filters):
+    """
+    In-memory (pandas) equivalent of build_where, for the client-side screener mode.
+    """
+    for column, value in (filters.get("text") or {}).items():
+        if value:
+            df = df[df[column].astype("string").str.contains(str(value), case=False, na=False, regex=False)]
+    for column, value in (filters.get("equals") or {}).items():
+        if value not in (None, ""):
+            df = df[df[column] == value]
+    for column, value in (filters.get("min") or {}).items():
+        if value is not None:
+            df = df[df[column] >= value]
+    for column, value in (filters.get("max") or {}).items():
+        if value is not None:
+            df = df[df[column] <= value]
+    return df
@@ -0,0 +1,294 @@
+# utils/shared_cache.py
+"""
+Cross-process cache of Arrow tables in shared memory.
+
+Several Streamlit server processes each keeping their own st.cache_data copy
+of the same price panels multiplies resident memory by the worker count (and
+st.cache_data pickles, so even one process holds a copy per hit). Here a
+loaded table is published once as an uncompressed Arrow IPC file under
+/dev/shm (memory-mapped files under data/shared_cache where there is no
+/dev/shm), and every process attaches to it read-only with pa.memory_map:
+the table's buffers are the shared pages themselves, with no copy.
+
+Layout, one slot per (name, arguments):
+
+    <root>/<name>/<args digest>/<version digest>.arrow
+    <root>/<name>/<args digest>/<version digest>.refs/<pid>
+
+- versioned invalidation: the data version (e.g. price_source().version())
+  is part of the file name, so new data is a new file; publishing it marks
+  the slot's older versions stale
+- reference counting: a process holding an entry has a <pid> file in its
+  .refs directory; stale or over-budget entries are only unlinked when no
+  live process holds them (holders that died are ignored)
+- a per-slot lock file keeps two processes from building the same entry at
+  once; the second one attaches to what the first published
+
+Unlinking a file another process still maps is harmless on POSIX (the pages
+stay valid until unmapped), so reference counts bound memory rather than
+guard correctness.
+"""
+
+import atexit
+import hashlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+from utils.tracing import current_span
+
+try:
+    import fcntl
+except ImportError:  # no POSIX locks: concurrent first loads may both build
+    fcntl = None
+
+SHM_ROOT = Path("/dev/shm")
+FALLBACK_ROOT = Path("data") / "shared_cache"
+# RAM the cache may use before unreferenced entries are evicted (oldest first)
+DEFAULT_BUDGET_BYTES = 2 * 1024 ** 3
+# entries one process keeps attached; older ones are released (and become evictable)
+MAX_ATTACHED = 64
+
+
+def default_root():
+    override = os.environ.get("PORTFOLIO_SHARED_CACHE")
+    if override:
+        return Path(override)
+    if SHM_ROOT.is_dir() and os.access(SHM_ROOT, os.W_OK):
+        return SHM_ROOT / f"portfolio-cache-{os.getuid() if hasattr(os, 'getuid') else 'user'}"
+    return FALLBACK_ROOT
+
+
+def _digest(value):
+    # repr of tuples/strings/dates/numbers is stable across processes (unlike hash())
+    return hashlib.sha1(repr(value).encode()).hexdigest()[:20]
+
+
+def _alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # exists, owned by someone else
+    except OSError:
+        return True
+    return True
+
+
+class SharedTableCache:
+    """Arrow tables shared between processes; get() loads, publishes or attaches."""
+
+    def __init__(self, root=None, budget_bytes=DEFAULT_BUDGET_BYTES, max_attached=MAX_ATTACHED):
+        self.root = Path(root) if root is not None else default_root()
+        self.budget_bytes = budget_bytes
+        self.max_attached = max_attached
+        self._attached = OrderedDict()  # entry path -> Table
+        self._loading = {}  # entry path -> lock held by the thread loading it
+        self._lock = threading.RLock()  # guards the two dicts only, never held across a load
+
+    # ----------- Paths -----------
+
+    def _slot(self, name, args):
+        return self.root / name / _digest(args)
+
+    def _entry(self, name, args, version):
+        return self._slot(name, args) / f"{_digest(version)}.arrow"
+
+    @staticmethod
+    def _refs(entry):
+        return entry.with_suffix(".refs")
+
+    # ----------- Public API -----------
+
+    def get(self, name, args, version, build):
+        """
+        The table for (name, args) at `version`: this process's attached copy,
+        else the published one, else build() -- which must return a pa.Table --
+        published for every other process. Returns a read-only, memory-mapped Table.
+        """
+        entry = self._entry(name, args, version)
+        table = self._attached_table(entry)
+        if table is not None:
+            return table
+
+        # one loader per entry in this process (the slot flock covers other
+        # processes); loads of different entries run concurrently
+        with self._lock:
+            entry_lock = self._loading.setdefault(entry, threading.Lock())
+        try:
+            with entry_lock:
+                table = self._attached_table(entry)
+                if table is not None:
+                    return table
+
+                status = "mapped"
+                for attempt in range(2):
+                    if not entry.exists():
+                        with self._slot_lock(entry.parent):
+                            if not entry.exists():  # nobody published it while we waited
+                                status = "built"
+                                self._publish(entry, build())
+                                self._sweep(entry.parent, keep=entry)
+                                self._evict()
+                    try:
+                        table = self._attach(entry)
+                        break
+                    except FileNotFoundError:
+                        # evicted by another process between the check and the map
+                        self.release(entry)
+                        if attempt:
+                            raise
+                current_span().set(shared_cache=status)
+                return table
+        finally:
+            with self._lock:
+                if self._loading.get(entry) is entry_lock:
+                    del self._loading[entry]
+
+    def _attached_table(self, entry):
+        with self._lock:
+            table = self._attached.get(entry)
+            if table is not None:
+                self._attached.move_to_end(entry)
+                current_span().set(shared_cache="attached")
+            return table
+
+    def release(self, entry):
+        """Drops this process's hold on an entry (the mapping lives on while the Table is referenced)."""
+        with self._lock:
+            self._attached.pop(entry, None)
+            (self._refs(entry) / str(os.getpid())).unlink(missing_ok=True)
+
+    def release_all(self):
+        with self._lock:
+            for entry in list(self._attached):
+                self.release(entry)
+
+    def holders(self, entry):
+        """Live processes holding an entry."""
+        refs = self._refs(entry)
+        if not refs.is_dir():
+            return []
+        pids = []
+        for marker in refs.iterdir():
+            try:
+                pid = int(marker.name)
+            except ValueError:
+                continue
+            if _alive(pid):
+                pids.append(pid)
+            else:
+                marker.unlink(missing_ok=True)
+        return pids
+
+    def entries(self):
+        """Every published entry file, oldest access first."""
+        if not self.root.is_dir():
+            return []
+        files = [f for f in self.root.glob("*/*/*.arrow")]
+        return sorted(files, key=lambda f: f.stat().st_atime_ns if f.exists() else 0)
+
+    def size_bytes(self):
+        return sum(f.stat().st_size for f in self.entries() if f.exists())
+
+    def clear(self):
+        """Removes every entry no live process holds."""
+        self.release_all()
+        for entry in self.entries():
+            self._remove_if_unheld(entry)
+
+    # ----------- Internals -----------
+
+    @contextmanager
+    def _slot_lock(self, slot):
+        slot.mkdir(parents=True, exist_ok=True)
+        if fcntl is None:
+            yield
+            return
+        with open(slot / ".lock", "a+") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def _publish(self, entry, table):
+        tmp = entry.with_name(f".{entry.stem}.{os.getpid()}.tmp")
+        # uncompressed IPC file: readers map the buffers instead of decoding them
+        with pa.OSFile(str(tmp), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp, entry)  # atomic: readers never see a partial file
+
+    def _attach(self, entry):
+        refs = self._refs(entry)
+        refs.mkdir(exist_ok=True)
+        (refs / str(os.getpid())).touch()
+        table = pa.ipc.open_file(pa.memory_map(str(entry), "r")).read_all()
+        os.utime(entry)  # access time for eviction order (tmpfs may not track atime)
+        with self._lock:
+            self._attached[entry] = table
+            # a process only needs the newest version of a slot; the old one goes
+            # once its last holder lets go
+            older = [e for e in self._attached if e.parent == entry.parent and e != entry]
+            for other in older:
+                self.release(other)
+            while len(self._attached) > self.max_attached:
+                self.release(next(iter(self._attached)))
+        for other in older:
+            self._remove_if_unheld(other)
+        return table
+
+    def _remove_if_unheld(self, entry):
+        if self.holders(entry):
+            return False
+        entry.unlink(missing_ok=True)
+        shutil.rmtree(self._refs(entry), ignore_errors=True)
+        return True
+
+    def _sweep(self, slot, keep):
+        # older versions of this slot are stale once a newer one is published
+        for entry in slot.glob("*.arrow"):
+            if entry != keep:
+                self._remove_if_unheld(entry)
+
+    def _evict(self):
+        entries = self.entries()
+        total = sum(f.stat().st_size for f in entries if f.exists())
+        for entry in entries:
+            if total <= self.budget_bytes:
+                break
+            size = entry.stat().st_size if entry.exists() else 0
+            if self._remove_if_unheld(entry):
+                total -= size
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_shared_cache():
+    """The process-wide cache (its holds are released at interpreter exit)."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SharedTableCache()
+            atexit.register(_cache.release_all)
+        return _cache
+
+
+def shared_table(name, args, version, build):
+    return get_shared_cache().get(name, args, version, build)
+
+
+def as_frame(table):
+    """DataFrame view of a shared table: ArrowDtype columns keep pointing at the shared buffers."""
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
@@ -2,7 +2,9 @@
 
 import pandas as pd
 import statsmodels.api as sm
+from utils.tracing import traced
 
+@traced()
 def get_correlated_proxies(price_data, target_asset, proxy_assets):
     """
     Returns a list of (proxy_asset, correlation) tuples ranked by absolute correlation
@@ -20,6 +22,7 @@ def get_correlated_proxies(price_data, target_asset, proxy_assets):
 
     return sorted(correlations, key=lambda x: abs(x[1]), reverse=True)
 
+@traced()
 def run_log_return_regression(price_data, target_asset, proxy_asset):
     """
     Performs linear regression of target log returns ~ proxy log returns.
@@ -0,0 +1,420 @@
+# utils/stream_import.py
+"""
+Streaming import of large price CSVs with bounded memory.
+
+The Import Tool's default path reads the whole upload, sorts it and runs
+describe() on it, so peak memory grows with the file. stream_import() instead
+reads fixed-size chunks and does everything in one pass:
+
+- validate_chunk(): normalizes column names, coerces dates and numbers and
+  counts the rows that fail; a chunk with more bad rows than the tolerance
+  is rejected as a whole (and reported), otherwise its bad rows are dropped;
+  unless the caller allows a partial import, a rejected chunk means nothing
+  is stored
+- RunningStats: count / nulls / mean / std / min / max per numeric column,
+  merged chunk by chunk (Welford's update in Chan's batched form)
+- Reservoir: a uniform sample of a fixed number of rows (Algorithm R), used
+  as the preview and for approximate quantiles
+- BucketSeries: per-period aggregates for the charts; the period doubles
+  whenever there are too many buckets, so it stays bounded for any file
+- valid chunks go straight to a staging table in the database file through
+  its writer (without republishing snapshots per chunk; a TEMP table would
+  sit in memory); the last transaction replaces the asset's rows from it,
+  so readers never see a partial import
+
+Memory is a few chunks plus the fixed-size profile, whatever the file size.
+"""
+
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+from utils.tracing import traced, current_span
+
+PRICE_COLUMNS = ["asset_id", "date", "open", "high", "low", "close",
+                 "volume", "open_interest", "daily_pct_change", "log_return"]
+NUMERIC_COLUMNS = PRICE_COLUMNS[2:]
+
+DEFAULT_CHUNK_ROWS = 200_000
+RESERVOIR_ROWS = 10_000
+MAX_BUCKETS = 4_000
+
+# chart columns -> how a bucket aggregates them
+BUCKET_AGG = {"open": "mean", "high": "max", "low": "min", "close": "mean",
+              "volume": "sum", "daily_pct_change": "mean", "log_return": "mean"}
+
+
+def normalize_columns(columns):
+    """Column names as the Import Tool expects them: lower case, spaces as underscores."""
+    return [str(c).strip().lower().replace(" ", "_") for c in columns]
+
+
+# ----------- Validation -----------
+
+def guess_date_format(values):
+    """strftime format of the first parseable date in values, or 'mixed' (parse each one)."""
+    for value in pd.Series(values).dropna().astype(str).head(100):
+        fmt = guess_datetime_format(value)
+        if fmt:
+            return fmt
+    return "mixed"
+
+
+def validate_chunk(chunk, tolerance=0.0, date_format="mixed", asset_id=None):
+    """
+    Coerces one chunk to the price schema.
+
+    Parameters:
+    - chunk: DataFrame with (normalized) PRICE_COLUMNS
+    - tolerance: largest fraction of bad rows (unparseable date, or a
+      non-numeric value in a numeric column) the chunk may have
+    - date_format: format of the date column (the same for every chunk of a file)
+    - asset_id: stored in every row instead of the file's asset_id (optional)
+
+    Returns:
+    - (frame, bad_rows, reason): frame holds the good rows, or is None when
+      the chunk is rejected; reason explains a rejection
+    """
+    out = pd.DataFrame(index=chunk.index)
+    out["asset_id"] = asset_id if asset_id else chunk["asset_id"].astype("string")
+    out["date"] = pd.to_datetime(chunk["date"], errors="coerce", format=date_format)
+    bad = out["date"].isna().to_numpy()
+    problems = {"date": int(bad.sum())}
+    for col in NUMERIC_COLUMNS:
+        values = pd.to_numeric(chunk[col], errors="coerce").astype("float64")
+        failed = (values.isna() & chunk[col].notna()).to_numpy()
+        if failed.any():
+            problems[col] = int(failed.sum())
+            bad |= failed
+        out[col] = values
+
+    bad_rows = int(bad.sum())
+    if bad_rows > tolerance * len(chunk):
+        detail = ", ".join(f"{col}: {n}" for col, n in problems.items() if n)
+        return None, bad_rows, f"{bad_rows} of {len(chunk)} rows unparseable ({detail})"
+    return (out.loc[~bad].copy() if bad_rows else out), bad_rows, None
+
+
+# ----------- Incremental Profile -----------
+
+class RunningStats:
+    """Count, nulls, mean, variance, min and max per column, updated one chunk at a time."""
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        k = len(self.columns)
+        self.rows = 0
+        self.count = np.zeros(k)
+        self.nulls = np.zeros(k, dtype="int64")
+        self.mean = np.zeros(k)
+        self.m2 = np.zeros(k)
+        self.min = np.full(k, np.nan)
+        self.max = np.full(k, np.nan)
+
+    def update(self, values):
+        """values: rows x columns float array, NaN for missing."""
+        present = ~np.isnan(values)
+        n_b = present.sum(axis=0).astype("float64")
+        self.rows += len(values)
+        self.nulls += len(values) - n_b.astype("int64")
+        seen = n_b > 0
+        if not seen.any():
+            return
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_b = np.where(seen, np.nansum(values, axis=0) / n_b, 0.0)
+            m2_b = np.nansum((values - mean_b) ** 2, axis=0)
+            # Chan et al.: merge (n, mean, M2) of the chunk into the running totals
+            n = self.count + n_b
+            delta = mean_b - self.mean
+            self.mean = np.where(seen, self.mean + delta * n_b / n, self.mean)
+            self.m2 = np.where(seen, self.m2 + m2_b + delta * delta * self.count * n_b / n, self.m2)
+            # fmin/fmax skip NaN (an all-missing column stays NaN)
+            self.min = np.fmin(self.min, np.fmin.reduce(values, axis=0))
+            self.max = np.fmax(self.max, np.fmax.reduce(values, axis=0))
+        self.count = n
+
+    def std(self):
+        # sample standard deviation, as describe() reports
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count > 1, np.sqrt(self.m2 / (self.count - 1)), np.nan)
+
+
+class Reservoir:
+    """Uniform sample of at most `size` rows of a stream (Algorithm R, vectorized per chunk)."""
+
+    def __init__(self, size=RESERVOIR_ROWS, seed=0):
+        self.size = size
+        self.seen = 0
+        self.sample = None
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, frame):
+        frame = frame.reset_index(drop=True)
+        fill = min(max(self.size - self.seen, 0), len(frame))
+        if fill:
+            head = frame.iloc[:fill]
+            self.sample = head.copy() if self.sample is None else pd.concat([self.sample, head], ignore_index=True)
+        rest = len(frame) - fill
+        if rest:
+            # row i of the stream (0-based) replaces slot j ~ U[0, i] when j < size;
+            # when rows of one chunk draw the same slot the last one wins, as in
+            # the sequential algorithm
+            positions = np.arange(self.seen + fill, self.seen + len(frame))
+            slots = self._rng.integers(0, positions + 1)
+            hit = slots < self.size
+            taken = pd.Series(np.flatnonzero(hit) + fill, index=slots[hit]).groupby(level=0).last()
+            if len(taken):
+                rows, source = taken.index.to_numpy(), taken.to_numpy()
+                for j in range(self.sample.shape[1]):
+                    self.sample.iloc[rows, j] = frame.iloc[source, j].to_numpy()
+        self.seen += len(frame)
+
+    def quantiles(self, columns, q=(0.25, 0.5, 0.75)):
+        """Approximate quantiles from the sample (rank error ~ 1/sqrt(size))."""
+        if self.sample is None:
+            return pd.DataFrame(np.nan, index=list(q), columns=columns)
+        values = self.sample[columns].to_numpy(dtype="float64")
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # all-missing columns give NaN
+            return pd.DataFrame(np.nanquantile(values, q, axis=0), index=list(q), columns=columns)
+
+
+class BucketSeries:
+    """
+    Per-period aggregates of the chart columns (BUCKET_AGG). Periods start at
+    one day and double whenever there would be more than max_buckets of them.
+    """
+
+    def __init__(self, columns=None, max_buckets=MAX_BUCKETS):
+        self.agg = {c: BUCKET_AGG[c] for c in (columns or BUCKET_AGG)}
+        self.max_buckets = max_buckets
+        self.days = 1
+        self._buckets = None  # bucket -> sums / counts / extremes
+
+    def _partial(self, frame, key):
+        # mergeable pieces: means and sums are kept as (sum, count) until the end
+        parts = {}
+        for col, how in self.agg.items():
+            if how in ("mean", "sum"):
+                parts[f"{col}__sum"] = frame[col]
+                parts[f"{col}__n"] = frame[col].notna().astype("int64")
+            else:
+                parts[col] = frame[col]
+        return pd.DataFrame(parts).groupby(key.to_numpy()).agg(self._merge_rules())
+
+    def _merge_rules(self):
+        rules = {}
+        for col, how in self.agg.items():
+            if how in ("mean", "sum"):
+                rules[f"{col}__sum"] = "sum"
+                rules[f"{col}__n"] = "sum"
+            else:
+                rules[col] = how
+        return rules
+
+    def update(self, frame):
+        days = frame["date"].to_numpy(dtype="datetime64[D]").astype("int64")
+        part = self._partial(frame, pd.Series(days // self.days))
+        merged = part if self._buckets is None else pd.concat([self._buckets, part])
+        self._buckets = merged.groupby(level=0).agg(self._merge_rules())
+        while len(self._buckets) > self.max_buckets:
+            self.days *= 2
+            self._buckets = self._buckets.groupby(self._buckets.index // 2).agg(self._merge_rules())
+
+    def frame(self):
+        """DataFrame with a date column (bucket start) and one column per chart column."""
+        if self._buckets is None:
+            return pd.DataFrame(columns=["date"] + list(self.agg))
+        b = self._buckets
+        out = pd.DataFrame({"date": (b.index.to_numpy() * self.days).astype("datetime64[D]")})
+        for col, how in self.agg.items():
+            if how in ("mean", "sum"):
+                # a bucket with no values for the column is missing, not zero
+                n = b[f"{col}__n"].to_numpy()
+                total = b[f"{col}__sum"].to_numpy(dtype="float64")
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    out[col] = np.where(n > 0, total / n if how == "mean" else total, np.nan)
+            else:
+                out[col] = b[col].to_numpy(dtype="float64")
+        return out.sort_values("date", ignore_index=True)
+
+
+class StreamProfile:
+    """What one pass over an import learned: validation report, stats, sample and chart series."""
+
+    def __init__(self, reservoir_rows=RESERVOIR_ROWS, seed=0):
+        self.stats = RunningStats(NUMERIC_COLUMNS)
+        self.reservoir = Reservoir(reservoir_rows, seed)
+        self.series = BucketSeries()
+        self.head = None
+        self.assets = set()
+        self.first_date = None
+        self.last_date = None
+        self.chunks = 0
+        self.rows_read = 0
+        self.rows_dropped = 0
+        self.rows_staged = 0
+        self.rows_written = 0  # rows stored; 0 if the import was not committed
+        self.rejected = []  # (chunk number, first line, reason)
+
+    def update(self, frame):
+        if self.head is None:
+            self.head = frame.head().reset_index(drop=True)
+        self.assets.update(frame["asset_id"].dropna().unique())
+        self.stats.update(frame[NUMERIC_COLUMNS].to_numpy(dtype="float64"))
+        self.reservoir.update(frame)
+        self.series.update(frame)
+        lo, hi = frame["date"].min(), frame["date"].max()
+        self.first_date = lo if self.first_date is None else min(self.first_date, lo)
+        self.last_date = hi if self.last_date is None else max(self.last_date, hi)
+
+    @property
+    def rows_valid(self):
+        return self.stats.rows
+
+    def summary(self):
+        """describe()-style table of the numeric columns (quantiles approximate)."""
+        s = self.stats
+        q = self.reservoir.quantiles(NUMERIC_COLUMNS)
+        table = pd.DataFrame({
+            "count": s.count, "nulls": s.nulls, "mean": s.mean, "std": s.std(),
+            "min": s.min, "25%": q.loc[0.25].to_numpy(), "50%": q.loc[0.5].to_numpy(),
+            "75%": q.loc[0.75].to_numpy(), "max": s.max,
+        }, index=NUMERIC_COLUMNS)
+        table.loc[table["count"] == 0, ["mean", "min", "max"]] = np.nan
+        return table.T
+
+    def preview(self):
+        """The reservoir sample in date order."""
+        if self.reservoir.sample is None:
+            return pd.DataFrame(columns=PRICE_COLUMNS)
+        return self.reservoir.sample.sort_values("date", ignore_index=True)
+
+
+# ----------- Import -----------
+
+def _position(handle):
+    try:
+        return handle.tell()
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+@traced()
+def stream_import(source, asset_id=None, writer=None, table="price_data", finalize=None,
+                  chunk_rows=DEFAULT_CHUNK_ROWS, tolerance=0.0, allow_partial=False, size=None, progress=None):
+    """
+    Validates, profiles and (optionally) stores a price CSV in one chunked pass.
+
+    Parameters:
+    - source: path or binary file object of the CSV
+    - asset_id: stored in every row's asset_id (default: keep the file's)
+    - writer: DuckDBWriter of the target database; None only profiles
+    - table: price table to replace the imported assets' rows in
+    - finalize: optional callable(con) run in the same final transaction
+      (e.g. the metadata upsert)
+    - chunk_rows: CSV rows per chunk
+    - tolerance: fraction of bad rows a chunk may have before it is rejected
+    - allow_partial: store the valid chunks even if some were rejected; by
+      default one rejected chunk means nothing is stored (the import replaces
+      the asset's whole history, which would then have a hole in it)
+    - size: total bytes of source, for progress (default: from the file)
+    - progress: optional callable(fraction) called after each chunk
+
+    Returns:
+    - StreamProfile; nothing is stored when no chunk was valid, or when a
+      chunk was rejected and allow_partial is False (the whole file is still
+      profiled, so the report lists every rejected chunk)
+    """
+    own = isinstance(source, (str, os.PathLike))
+    handle = open(source, "rb") if own else source
+    if size is None:
+        size = os.path.getsize(source) if own else getattr(handle, "size", None)
+    profile = StreamProfile()
+    stage = f"import_stage_{os.getpid()}_{id(profile):x}"
+    staged = False
+    writing = writer is not None
+    pending = None
+    date_format = None
+
+    try:
+        chunks = pd.read_csv(handle, chunksize=chunk_rows,
+                             usecols=lambda c: normalize_columns([c])[0] in PRICE_COLUMNS)
+        for chunk in chunks:
+            chunk.columns = normalize_columns(chunk.columns)
+            if profile.chunks == 0:
+                missing = set(PRICE_COLUMNS) - set(chunk.columns)
+                if missing:
+                    raise ValueError(f"Missing required columns: {sorted(missing)}")
+                date_format = guess_date_format(chunk["date"])
+            first_line = profile.rows_read + 2  # 1-based, after the header
+            profile.chunks += 1
+            profile.rows_read += len(chunk)
+
+            frame, bad_rows, reason = validate_chunk(chunk, tolerance, date_format, asset_id)
+            if frame is None:
+                profile.rejected.append((profile.chunks, first_line, reason))
+                writing = writing and allow_partial  # keep profiling, stop staging
+            else:
+                profile.rows_dropped += bad_rows
+                profile.update(frame)
+                if writing:
+                    if not staged:
+                        writer.execute(f'CREATE TABLE "{stage}" AS SELECT * FROM "{table}" LIMIT 0',
+                                       publish=False)
+                        staged = True
+                    # at most one chunk in flight: the next one is parsed while this one is written
+                    if pending is not None:
+                        profile.rows_staged += pending.result()
+                    pending = writer.submit(_append(stage, frame), publish=False)
+            if progress is not None and size:
+                position = _position(handle)
+                if position is not None:
+                    progress(min(position / size, 1.0))
+
+        if pending is not None:
+            profile.rows_staged += pending.result()
+            pending = None
+        if staged and writing and profile.rows_staged:
+            writer.submit(_replace(stage, table, finalize)).result()
+            staged = False
+            profile.rows_written = profile.rows_staged
+    finally:
+        if pending is not None:
+            try:
+                pending.result()
+            except Exception:
+                pass
+        if staged:
+            writer.execute(f'DROP TABLE IF EXISTS "{stage}"', publish=False)
+        if own:
+            handle.close()
+
+    current_span().set(chunks=profile.chunks, rows_in=profile.rows_read, rows_out=profile.rows_written,
+                       rejected=len(profile.rejected))
+    return profile
+
+
+def _append(stage, frame):
+    def op(con):
+        con.register("incoming", frame)
+        try:
+            con.execute(f'INSERT INTO "{stage}" SELECT {", ".join(PRICE_COLUMNS)} FROM incoming')
+        finally:
+            con.unregister("incoming")
+        return len(frame)
+    return op
+
+
+def _replace(stage, table, finalize):
+    # one transaction: the imported assets' old rows go and the staged ones
+    # arrive together, and this commit publishes the snapshots
+    def op(con):
+        if finalize is not None:
+            finalize(con)
+        con.execute(f'DELETE FROM "{table}" WHERE asset_id IN (SELECT DISTINCT asset_id FROM "{stage}")')
+        con.execute(f'INSERT INTO "{table}" SELECT * FROM "{stage}"')
+        con.execute(f'DROP TABLE "{stage}"')
+    return op
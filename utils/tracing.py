@@ -0,0 +1,222 @@
+# utils/tracing.py
+"""
+Lightweight tracing for page reruns and utils kernels.
+
+    with span("pivot", rows_in=len(df)) as s:
+        ...
+        s.set(rows_out=len(out))
+
+    @traced()                      # rows in/out and bytes taken from args/result
+    def prepare_data(...): ...
+
+Tracing is off unless enabled process-wide (TRACE_SPANS=1 / enable()) or for
+the current script thread (enable_for_thread()). When off, `span` hands out a
+shared no-op object and `traced` calls straight through, so the cost is one
+flag check per call.
+
+Root spans are kept per thread until collect(). Between start_trace() and
+collect() a thread keeps all of them (one rerun's worth); otherwise, as on
+the prefetch pool and writer threads that never run a rerun, only the last
+MAX_IDLE_ROOTS are kept.
+"""
+
+import os
+import json
+import time
+import threading
+import itertools
+from collections import deque
+from functools import wraps
+
+_enabled = os.getenv("TRACE_SPANS", "") not in ("", "0")
+_local = threading.local()
+_ids = itertools.count(1)
+
+MAX_IDLE_ROOTS = 64
+
+
+def enable(flag=True):
+    global _enabled
+    _enabled = flag
+
+
+def enable_for_thread(flag=True):
+    _local.enabled = flag
+
+
+def is_enabled():
+    return _enabled or getattr(_local, "enabled", False)
+
+
+class Span:
+    __slots__ = ("id", "parent_id", "name", "start", "duration_ms", "attrs", "children")
+
+    def __init__(self, name, parent_id, attrs):
+        self.id = next(_ids)
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.time()
+        self.duration_ms = None
+        self.attrs = attrs
+        self.children = []
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+        return self
+
+    def to_dict(self):
+        return {"id": self.id, "parent_id": self.parent_id, "name": self.name,
+                "start": self.start, "duration_ms": self.duration_ms, **self.attrs}
+
+    def walk(self, depth=0):
+        yield depth, self
+        for child in self.children:
+            yield from child.walk(depth + 1)
+
+
+class _NoopSpan:
+    def set(self, **attrs):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class _SpanContext:
+    __slots__ = ("span", "_t0")
+
+    def __init__(self, name, attrs):
+        stack = _stack()
+        parent = stack[-1] if stack else None
+        self.span = Span(name, parent.id if parent else None, attrs)
+        if parent is not None:
+            parent.children.append(self.span)
+        else:
+            _roots().append(self.span)
+
+    def __enter__(self):
+        _stack().append(self.span)
+        self._t0 = time.perf_counter()
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        self.span.duration_ms = (time.perf_counter() - self._t0) * 1000
+        if exc_type is not None:
+            self.span.attrs["error"] = exc_type.__name__
+        stack = _stack()
+        if stack and stack[-1] is self.span:
+            stack.pop()
+        return False
+
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _roots():
+    roots = getattr(_local, "roots", None)
+    if roots is None:
+        # not inside a trace: keep the latest roots only, nothing will collect the rest
+        roots = _local.roots = deque(maxlen=MAX_IDLE_ROOTS)
+    return roots
+
+
+def span(name, **attrs):
+    """Context manager timing a block; attrs are free-form (rows_in, rows_out, bytes, cache_hit, ...)."""
+    if not is_enabled():
+        return NOOP_SPAN
+    return _SpanContext(name, attrs)
+
+
+def current_span():
+    """Innermost open span of this thread (a no-op span when tracing is off)."""
+    if not is_enabled():
+        return NOOP_SPAN
+    stack = _stack()
+    return stack[-1] if stack else NOOP_SPAN
+
+
+def note_cache_miss():
+    """Call inside a cached function body: it only runs on a miss."""
+    current_span().set(cache_hit=False)
+
+
+def _rows(value):
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    shape = getattr(value, "shape", None)
+    if shape:
+        return int(shape[0])
+    return None
+
+
+def _nbytes(value):
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    memory_usage = getattr(value, "memory_usage", None)
+    if memory_usage is not None:
+        usage = memory_usage(index=True)
+        return int(usage.sum() if hasattr(usage, "sum") else usage)
+    nbytes = getattr(value, "nbytes", None)
+    return int(nbytes) if nbytes is not None else None
+
+
+def traced(name=None, cache=False):
+    """
+    Decorator form of `span`. Records rows_in (first array-like argument),
+    rows_out and bytes (result). With cache=True the span starts as a cache
+    hit and the wrapped function's body flips it with note_cache_miss().
+    """
+    def decorator(fn):
+        span_name = name or fn.__name__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not is_enabled():
+                return fn(*args, **kwargs)
+            rows_in = next((r for r in map(_rows, args) if r is not None), None)
+            attrs = {"rows_in": rows_in}
+            if cache:
+                attrs["cache_hit"] = True
+            with _SpanContext(span_name, attrs) as s:
+                result = fn(*args, **kwargs)
+                s.set(rows_out=_rows(result), bytes=_nbytes(result))
+            return result
+        return wrapper
+    return decorator
+
+
+def start_trace():
+    """Discards any spans collected so far on this thread (call at the top of a rerun)."""
+    _local.roots = []
+    _local.stack = []
+
+
+def collect():
+    """Returns and clears this thread's finished root spans, ending its trace."""
+    roots = list(_roots())
+    _local.roots = None
+    return roots
+
+
+def flatten(roots):
+    return [s.to_dict() for root in roots for _, s in root.walk()]
+
+
+def to_jsonl(roots):
+    return "".join(json.dumps(record, default=str) + "\n" for record in flatten(roots))
+
+
+def export_jsonl(roots, path):
+    """Appends spans as JSON lines to path for offline analysis."""
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(to_jsonl(roots))